@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+A stand-in for the povray binary, for benchmarking vapory's own overhead on
+machines without POV-Ray. It accepts the command line built by vapory,
+reads the scene file, and instantly writes a valid image (a gradient) in
+the requested Output_File_Type (PPM, TGA, PNG or HDR, PNG for anything
+else), on its standard output for ``+O-`` or in the given file, along with
+render statistics on its standard error like POV-Ray does.
+
+    vapory.io.POVRAY_BINARY = "/path/to/benchmarks/fake_povray.py"
+"""
+
+import sys
+import zlib
+import struct
+
+STATS = """Render Statistics
+Image Resolution %(width)d x %(height)d
+----------------------------------------------------------------------------
+Pixels:      %(pixels)11d   Samples:      %(pixels)11d   Smpls/Pxl: 1.00
+Rays:        %(pixels)11d   Saved:                  0   Max Level: 1/5
+----------------------------------------------------------------------------
+Peak memory used:        %(memory)11d bytes
+----------------------------------------------------------------------------
+Parser Time
+  Parse Time:       0 hours  0 minutes  0 seconds (0.000 seconds)
+              using 1 thread(s) with 0.000 CPU-seconds total
+Render Time:
+  Trace Time:       0 hours  0 minutes  0 seconds (0.000 seconds)
+              using 1 thread(s) with 0.000 CPU-seconds total
+POV-Ray finished
+"""
+
+
+def png_chunk(chunk_type, data):
+    return (struct.pack(">I", len(data)) + chunk_type + data +
+            struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def encode(row, height, file_type, bits, alpha):
+    """ Encodes an image of identical rows, given as (r, g, b, a) values in
+    [0, 255]. """
+    width = len(row)
+    if file_type == 'P':
+        repeat = 2 if bits == 16 else 1
+        data = bytes(bytearray(v for p in row for v in p[:3]
+                               for _ in range(repeat)))
+        return (b"P6\n%d %d\n%d\n" % (width, height,
+                                       65535 if bits == 16 else 255) +
+                data * height)
+    if file_type == 'T':
+        # Bottom-left origin, BGR(A), like most TGA writers.
+        order = [2, 1, 0, 3] if alpha else [2, 1, 0]
+        data = bytes(bytearray(p[i] for p in row for i in order))
+        return struct.pack("<BBB9xHHBB", 0, 0, 2, width, height,
+                           8 * len(order), 8 if alpha else 0) + data * height
+    if file_type == 'H':
+        # Flat RGBE scanlines, all the values below 1.
+        data = bytes(bytearray(v for p in row
+                               for v in (p[0], p[1], p[2], 128)))
+        return (b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y %d +X %d\n"
+                % (height, width) + data * height)
+    channels = 4 if alpha else 3
+    repeat = 2 if bits == 16 else 1
+    data = b"\x00" + bytes(bytearray(p[i] for p in row
+                                     for i in range(channels)
+                                     for _ in range(repeat)))
+    header = struct.pack(">IIBBBBB", width, height, 8 * repeat,
+                         6 if alpha else 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(data * height)) +
+            png_chunk(b"IEND", b""))
+
+
+def main(args):
+    options = {'W': 320, 'H': 240}
+    file_type, bits, alpha = 'N', 8, False
+    outfile = None
+    scene_size = 0
+    for arg in args:
+        if arg[:3] in ('+SR', '+ER', '+SC', '+EC') and arg[3:].isdigit():
+            options[arg[1:3]] = int(arg[3:])
+        elif arg[:2] in ('+W', '+H') and arg[2:].isdigit():
+            options[arg[1]] = int(arg[2:])
+        elif arg.startswith('+O'):
+            outfile = arg[2:]
+        elif arg.startswith('Output_File_Type='):
+            file_type = arg.split('=')[1]
+        elif arg.startswith('Bits_Per_Color='):
+            bits = int(arg.split('=')[1])
+        elif arg == 'Output_Alpha=on':
+            alpha = True
+        elif not arg.startswith(('+', '-')) and '=' not in arg:
+            with open(arg, 'rb') as f: # the scene is read, like POV-Ray
+                scene_size = len(f.read())
+
+    width, height = options['W'], options['H']
+    rows = range(options.get('SR', 1) - 1, options.get('ER', height))
+    cols = range(options.get('SC', 1) - 1, options.get('EC', width))
+    row = [(c % 256, 0, 128, 255 - c % 256) for c in cols]
+    data = encode(row, len(rows), file_type, bits, alpha)
+
+    if outfile in (None, '-'):
+        sys.stdout.buffer.write(data)
+    else:
+        with open(outfile, 'wb') as f:
+            f.write(data)
+    sys.stderr.write(STATS % dict(width=width, height=height,
+                                  pixels=len(rows) * len(cols),
+                                  memory=2**20 + scene_size))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,304 @@
+"""
+Benchmarks of vapory's own overhead: building and serializing big scenes,
+copying them, decoding images, and end-to-end renders against a fake
+povray binary (fake_povray.py) which answers instantly, so that they can
+run on machines without POV-Ray.
+
+Usage:
+
+    python benchmarks/run_benchmarks.py               # default sizes
+    python benchmarks/run_benchmarks.py --full        # up to 1M primitives
+    python benchmarks/run_benchmarks.py --quick -k mesh --json out.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy
+import vapory
+import vapory.io
+from vapory import (Scene, Camera, LightSource, Sphere, Box, Union,
+                    Difference, Texture, Pigment, Finish, Mesh2,
+                    VertexVectors, FaceIndices, InstanceArray, SphereArray,
+                    Static, render_many, bounding_box, add_bounds,
+                    cull_objects, clear_memos)
+
+FAKE_POVRAY = os.path.join(HERE, 'fake_povray.py')
+
+SIZES = {
+    'quick': dict(spheres=[1000, 10000], mesh=[10000], csg_depth=[50],
+                  images=[256, 1024], renders=10),
+    'default': dict(spheres=[10000, 100000], mesh=[100000, 1000000],
+                    csg_depth=[50, 200], images=[256, 1024, 4096],
+                    renders=30),
+    'full': dict(spheres=[10000, 100000, 1000000], mesh=[1000000, 4000000],
+                 csg_depth=[50, 200], images=[256, 1024, 4096, 8192],
+                 renders=100),
+}
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """ Registers a function returning a list of (case, function) pairs. """
+    def decorator(f):
+        BENCHMARKS.append((name, f))
+        return f
+    return decorator
+
+
+def timeit(f, repeat=3):
+    """ Returns the best time of ``repeat`` calls of f, in seconds. """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def camera():
+    return Camera('location', [0, 2, -3], 'look_at', [0, 1, 2])
+
+
+def sphere_scene(n, **scene_kwargs):
+    rng = numpy.random.RandomState(0)
+    texture = Texture(Pigment('color', [1, 0, 1]), Finish('phong', 0.5))
+    spheres = [Sphere(list(center), 0.1, texture)
+               for center in rng.uniform(-10, 10, (n, 3))]
+    return Scene(camera(), [LightSource([2, 4, -3], 'color', [1, 1, 1])] +
+                 spheres, **scene_kwargs)
+
+
+def csg_scene(depth):
+    obj = Sphere([0, 0, 0], 1)
+    for i in range(depth):
+        obj = Difference(Union(obj, Box([i, 0, 0], [i + 1, 1, 1])),
+                         Sphere([i, 1, 0], 0.5))
+    return Scene(camera(), [obj])
+
+
+def mesh_arrays(n_vertices):
+    rng = numpy.random.RandomState(0)
+    vertices = rng.uniform(-1, 1, (n_vertices, 3))
+    faces = rng.randint(0, n_vertices, (2 * n_vertices, 3))
+    return vertices, faces
+
+
+def serialize(scene):
+    scene.write_to(StringIO())
+
+
+@benchmark('build_spheres')
+def bench_build(sizes):
+    return [("%d spheres" % n, lambda n=n: sphere_scene(n))
+            for n in sizes['spheres']]
+
+
+@benchmark('serialize_spheres')
+def bench_serialize(sizes):
+    cases = []
+    for n in sizes['spheres']:
+        scene = sphere_scene(n)
+        cases.append(("%d spheres" % n, lambda s=scene: serialize(s)))
+        scene = sphere_scene(n, precision=6, minify=True)
+        cases.append(("%d spheres, precision=6 minify" % n,
+                      lambda s=scene: serialize(s)))
+    return cases
+
+
+@benchmark('serialize_spheres_cold')
+def bench_serialize_cold(sizes):
+    # Serializations of new scenes, before the code of the elements is
+    # memoized (the build time is included).
+    return [("build+serialize %d spheres" % n,
+             lambda n=n: serialize(sphere_scene(n)))
+            for n in sizes['spheres']]
+
+
+@benchmark('serialize_instances')
+def bench_instances(sizes):
+    cases = []
+    rng = numpy.random.RandomState(0)
+    for n in sizes['spheres']:
+        centers = rng.uniform(-10, 10, (n, 3))
+        radii = rng.uniform(0.05, 0.1, n)
+        colors = rng.uniform(0, 1, (n, 3))
+        cases.append(("SphereArray %d" % n, lambda c=centers, r=radii,
+                      k=colors: SphereArray(c, radii=r, colors=k).write_to(
+                          StringIO())))
+        cases.append(("InstanceArray %d" % n, lambda c=centers, r=radii,
+                      k=colors: InstanceArray(
+                          Box([0, 0, 0], [1, 1, 1]), c, scales=r,
+                          rotations=c, colors=k).write_to(StringIO())))
+    return cases
+
+
+@benchmark('animation_frame')
+def bench_animation_frame(sizes):
+    # One frame of a flythrough: a new camera and one moving object in
+    # front of a background which never changes.
+    cases = []
+    # Removed when the last case is garbage-collected, or at exit.
+    cache_dir = TemporaryDirectory(prefix='vapory_bench_')
+    for n in sizes['spheres']:
+        background = sphere_scene(n).objects
+        static = Static(*background)
+        for name, objects in [("%d spheres" % n, list(background)),
+                              ("Static %d spheres" % n, [static])]:
+            cases.append((name, lambda o=objects, d=cache_dir: serialize(
+                Scene(camera(), o + [Sphere([0, 0, 0], 1)],
+                      cache_dir=d.name))))
+    return cases
+
+
+@benchmark('serialize_mesh2')
+def bench_mesh(sizes):
+    cases = []
+    for n in sizes['mesh']:
+        vertices, faces = mesh_arrays(n)
+        array_mesh = Mesh2.from_arrays(vertices, faces)
+        cases.append(("from_arrays %d vertices" % n,
+                      lambda m=array_mesh: m.write_to(StringIO())))
+        if n <= 100000:
+            list_mesh = Mesh2(VertexVectors(n, *vertices.tolist()),
+                              FaceIndices(len(faces), *faces.tolist()))
+            cases.append(("lists %d vertices" % n,
+                          lambda m=list_mesh: m.write_to(StringIO())))
+    return cases
+
+
+@benchmark('serialize_csg')
+def bench_csg(sizes):
+    return [("depth %d" % depth,
+             lambda s=csg_scene(depth): serialize(s))
+            for depth in sizes['csg_depth']]
+
+
+def cleared(obj):
+    """ Drops the memoized boxes (and code) of an object, so that they are
+    computed again. """
+    clear_memos(obj)
+    return obj
+
+
+@benchmark('bounds')
+def bench_bounds(sizes):
+    # bounding_box memoizes the boxes on the elements: the memos are
+    # cleared in the timed function, except in the "memoized" cases.
+    # add_bounds computes the boxes again every time.
+    cases = []
+    for depth in sizes['csg_depth']:
+        obj = csg_scene(depth).objects[0]
+        cases.append(("bounding_box csg depth %d" % depth,
+                      lambda o=obj: bounding_box(cleared(o))))
+        cases.append(("bounding_box csg depth %d, memoized" % depth,
+                      lambda o=obj: bounding_box(o)))
+    for n in sizes['spheres'][:1]:
+        # Spheres alone get no bounds: groups of 10 in unions.
+        spheres = sphere_scene(n).objects[1:]
+        scene = Scene(camera(), [Union(*spheres[i:i + 10])
+                                 for i in range(0, n, 10)])
+        cases.append(("add_bounds %d spheres in unions" % n,
+                      lambda s=scene: add_bounds(s)))
+    return cases
+
+
+@benchmark('culling')
+def bench_culling(sizes):
+    cases = []
+    for n in sizes['spheres']:
+        # A narrow view, which sees a few percent of the spheres.
+        scene = sphere_scene(n).set_camera(camera().add_args(
+            ['angle', 20])).with_camera_ratio(640, 480)
+        cases.append(("cull+serialize %d spheres" % n,
+                      lambda s=scene: serialize(cull_objects(s, 1))))
+    return cases
+
+
+@benchmark('copy')
+def bench_copy(sizes):
+    cases = []
+    for n in sizes['spheres'][:2]:
+        scene = sphere_scene(n)
+        light = LightSource([0, 10, 0], 'color', [1, 1, 1])
+        cases.append(("copy %d spheres" % n, lambda s=scene: s.copy()))
+        cases.append(("add_objects %d spheres" % n,
+                      lambda s=scene: s.add_objects([light])))
+        cases.append(("set_camera %d spheres" % n,
+                      lambda s=scene: s.set_camera(camera())))
+    return cases
+
+
+@benchmark('ppm_to_numpy')
+def bench_ppm(sizes):
+    cases = []
+    for size in sizes['images']:
+        data = (b"P6\n%d %d\n255\n" % (size, size) +
+                bytes(bytearray(3 * size * size)))
+        cases.append(("%dx%d" % (size, size),
+                      lambda d=data: vapory.io.ppm_to_numpy(buffer=d)))
+    return cases
+
+
+@benchmark('render')
+def bench_render(sizes):
+    scene = sphere_scene(100)
+    scenes = [scene] * sizes['renders']
+    return [
+        ("render 64x48 x%d" % sizes['renders'],
+         lambda: [scene.render(width=64, height=48) for s in scenes]),
+        ("render 1024x768 x%d" % sizes['renders'],
+         lambda: [scene.render(width=1024, height=768) for s in scenes]),
+        ("render 1024x768 file x%d" % sizes['renders'],
+         lambda: [scene.render(width=1024, height=768, transport='file')
+                  for s in scenes]),
+        ("render_many 64x48 x%d" % sizes['renders'],
+         lambda: list(render_many(scenes, executor='thread', width=64,
+                                  height=48))),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--quick', action='store_const', dest='size',
+                        const='quick', default='default')
+    parser.add_argument('--full', action='store_const', dest='size',
+                        const='full')
+    parser.add_argument('-k', dest='filter', default='',
+                        help="only run the benchmarks containing this")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--povray', default=FAKE_POVRAY,
+                        help="povray binary for the render benchmarks")
+    args = parser.parse_args()
+
+    vapory.io.POVRAY_BINARY = args.povray
+    sizes = SIZES[args.size]
+    results = []
+    for name, make_cases in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        for case, f in make_cases(sizes):
+            seconds = timeit(f, args.repeat)
+            results.append(dict(benchmark=name, case=case, seconds=seconds))
+            print("%-20s %-32s %10.4f s" % (name, case, seconds))
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(size=args.size, python=sys.version,
+                           vapory=vapory.__version__, results=results), f,
+                      indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,4 +7,5 @@ import os
 examples = [f for f in os.listdir('.') if f.endswith(".py")
                                        and not f.startswith('_')]
 for f in examples:
-    execfile(f)
\ No newline at end of file
+    with open(f) as fh:
+        exec(compile(fh.read(), f, 'exec'), {'__name__': '__main__'})
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import vapory.io
+
+FAKE_POVRAY = os.path.join(ROOT, 'benchmarks', 'fake_povray.py')
+
+
+@pytest.fixture
+def fake_povray(monkeypatch):
+    """ Renders with the fake povray binary of the benchmarks. """
+    monkeypatch.setattr(vapory.io, 'POVRAY_BINARY', FAKE_POVRAY)
+    return FAKE_POVRAY
@@ -0,0 +1,24 @@
+import time
+import threading
+
+from vapory import Scene, Camera, Sphere, Animation
+
+
+def test_iter_frames_max_pending(fake_povray):
+    lock = threading.Lock()
+    started = []
+
+    def scene(t):
+        with lock:
+            started.append(t)
+        return Scene(Camera('location', [t, 0, -3], 'look_at', [0, 0, 0]),
+                     [Sphere([0, 0, 0], 1)])
+
+    animation = Animation(scene, n_frames=10, fps=10)
+    frames = animation.iter_frames(jobs=1, executor='thread', max_pending=2,
+                                   width=8, height=6)
+    next(frames)
+    time.sleep(0.3) # lets the worker start any frame submitted
+    # The frame held by the consumer and one frame rendering.
+    assert len(started) == 2
+    assert len(list(frames)) == 9
@@ -0,0 +1,41 @@
+import numpy
+
+from vapory import (Mesh2, InstanceArray, SphereArray, Sphere, Texture,
+                    Pigment, Finish)
+
+VERTICES = numpy.array([[0., 0, 0], [1, 0, 0], [0, 1, 0]])
+FACES = numpy.array([[0, 1, 2]])
+
+
+def test_mesh2_from_arrays_with_modifiers():
+    # The documented call: modifiers after the arrays.
+    mesh = Mesh2.from_arrays(VERTICES, FACES,
+                             Texture(Pigment('color', [1, 0, 0])))
+    code = str(mesh)
+    assert "texture" in code
+    assert "normal_vectors" not in code
+
+
+def test_mesh2_from_arrays_keywords():
+    code = str(Mesh2.from_arrays(VERTICES, FACES, 'translate', [1, 0, 0],
+                                 normals=VERTICES, uvs=VERTICES[:, :2]))
+    assert "normal_vectors" in code
+    assert "uv_vectors" in code
+    assert "translate" in code
+
+
+def test_instance_array_with_modifiers():
+    positions = numpy.array([[0., 0, 0], [1, 2, 3]])
+    code = str(InstanceArray(Sphere([0, 0, 0], 1), positions,
+                             Finish('phong', 1), scales=0.5))
+    assert "finish" in code
+    assert code.count("scale <0.5,0.5,0.5>") == 2
+
+
+def test_sphere_array_with_modifiers():
+    centers = numpy.array([[0., 0, 0], [1, 2, 3]])
+    code = str(SphereArray(centers, Finish('phong', 1), radii=0.5,
+                           colors=[[1, 0, 0], [0, 1, 0]]))
+    assert "finish" in code
+    assert code.count("0.5") == 2
+    assert "<1,0,0>" in code
@@ -0,0 +1,141 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import numpy
+import pytest
+
+import vapory.io
+import vapory.async_render
+from vapory import Scene, Camera, Sphere
+from vapory.async_render import parse_progress_line, iter_render_async
+
+# Writes progress lines like POV-Ray (updated with carriage returns), then
+# optionally its pid and waits, then an image.
+SCRIPT = """#!%s
+import sys, time
+sys.stderr.write("Parsing Options\\nCreating bounding slabs\\n")
+sys.stderr.write("Rendered 24 of 48 pixels (50%%)\\r"
+                 "Rendered 48 of 48 pixels (100%%)\\n")
+sys.stderr.flush()
+if %r:
+    open(%r, "w").write(str(__import__("os").getpid()))
+    time.sleep(60)
+sys.stdout.buffer.write(b"P6\\n8 6\\n255\\n" + bytes(144))
+"""
+
+
+@pytest.fixture
+def povray(tmp_path, monkeypatch):
+    """ Returns a function setting up a scripted POV-Ray, slow or not, and
+    the list of the scratch directories of the renders. """
+    scratch_dirs = []
+
+    def recording_mkdtemp(**kwargs):
+        scratch_dirs.append(tempfile.mkdtemp(**kwargs))
+        return scratch_dirs[-1]
+
+    monkeypatch.setattr(vapory.async_render, 'mkdtemp', recording_mkdtemp)
+
+    def setup(slow=False):
+        path = tmp_path / 'povray'
+        pid_file = str(tmp_path / 'pid')
+        path.write_text(SCRIPT % (sys.executable, slow, pid_file))
+        path.chmod(0o755)
+        monkeypatch.setattr(vapory.io, 'POVRAY_BINARY', str(path))
+        return pid_file
+
+    return setup, scratch_dirs
+
+
+def scene():
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [Sphere([0, 0, 0], 1)])
+
+
+def test_parse_progress_line():
+    report = parse_progress_line("Rendered 10240 of 307200 pixels (3%)")
+    assert report.phase == 'rendering'
+    assert (report.percent, report.pixels, report.pixels_total) == (
+        3, 10240, 307200)
+    assert parse_progress_line("Creating bounding slabs").phase == (
+        'creating_bounding_slabs')
+    assert parse_progress_line("some other line", 'photon').phase == 'photon'
+
+
+def test_progress_callback(povray):
+    setup, scratch_dirs = povray
+    setup()
+    reports = []
+    image = asyncio.run(scene().render_async(width=8, height=6,
+                                             progress=reports.append))
+    assert image.shape == (6, 8, 3)
+    assert [r.phase for r in reports] == ['parsing', 'creating_bounding_slabs',
+                                          'rendering', 'rendering']
+    assert [r.percent for r in reports[2:]] == [50, 100]
+    assert not os.path.exists(scratch_dirs[0])
+
+
+def test_progress_coroutine(povray):
+    setup, _ = povray
+    setup()
+    reports = []
+
+    async def progress(report):
+        await asyncio.sleep(0)
+        reports.append(report)
+
+    asyncio.run(scene().render_async(width=8, height=6, progress=progress))
+    assert len(reports) == 4
+
+
+def test_iter_render_async(povray):
+    setup, _ = povray
+    setup()
+
+    async def collect():
+        return [r async for r in iter_render_async(str(scene()), width=8,
+                                                   height=6)]
+
+    reports = asyncio.run(collect())
+    assert reports[-1].phase == 'done'
+    numpy.testing.assert_array_equal(reports[-1].result,
+                                     numpy.zeros((6, 8, 3)))
+    assert [r.percent for r in reports[:-1]] == [None, None, 50, 100]
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_cancel_kills_povray(povray):
+    setup, scratch_dirs = povray
+    pid_file = setup(slow=True)
+
+    async def cancel_after_progress():
+        task = asyncio.ensure_future(scene().render_async(width=8, height=6))
+        while not os.path.exists(pid_file):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_after_progress())
+    with open(pid_file) as f:
+        assert not process_exists(int(f.read()))
+    assert not os.path.exists(scratch_dirs[0])
+
+
+def test_timeout_kills_povray(povray):
+    setup, scratch_dirs = povray
+    pid_file = setup(slow=True)
+    with pytest.raises(TimeoutError):
+        asyncio.run(scene().render_async(width=8, height=6, timeout=1))
+    with open(pid_file) as f:
+        assert not process_exists(int(f.read()))
+    assert not os.path.exists(scratch_dirs[0])
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import subprocess
+
+import numpy
+import pytest
+
+from vapory.formats import image_to_numpy
+from vapory.stats import RenderStats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_POVRAY = os.path.join(ROOT, 'benchmarks', 'fake_povray.py')
+RUN_BENCHMARKS = os.path.join(ROOT, 'benchmarks', 'run_benchmarks.py')
+
+
+def run_fake_povray(tmp_path, *options):
+    scene_file = tmp_path / 'scene.pov'
+    scene_file.write_text("sphere { <0,0,0>, 1 }\n")
+    process = subprocess.run([sys.executable, FAKE_POVRAY, str(scene_file),
+                              '+W5', '+H3', '+O-'] + list(options),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             check=True)
+    return process.stdout, process.stderr
+
+
+def gradient(cols, rows=3):
+    """ The image of the fake POV-Ray, as (r, g, b, a) values in [0, 255]. """
+    row = [(c % 256, 0, 128, 255 - c % 256) for c in cols]
+    return numpy.array([row] * rows, dtype='float64')
+
+
+@pytest.mark.parametrize('file_type, bits, alpha', [
+    ('P', 8, False), ('P', 16, False), ('T', 8, False), ('T', 8, True),
+    ('N', 8, False), ('N', 8, True), ('N', 16, True)])
+def test_fake_povray_images(tmp_path, file_type, bits, alpha):
+    options = ['Output_File_Type=%s' % file_type, 'Bits_Per_Color=%d' % bits]
+    if alpha:
+        options.append('Output_Alpha=on')
+    image, _ = run_fake_povray(tmp_path, *options)
+    arr = image_to_numpy(file_type, buffer=image)
+    expected = gradient(range(5))[:, :, :4 if alpha else 3]
+    scale = 257 if bits == 16 else 1
+    numpy.testing.assert_array_equal(arr, expected * scale)
+
+
+def test_fake_povray_hdr(tmp_path):
+    image, _ = run_fake_povray(tmp_path, 'Output_File_Type=H')
+    arr = image_to_numpy('H', buffer=image)
+    expected = (gradient(range(5))[:, :, :3] + 0.5) / 256
+    numpy.testing.assert_allclose(arr, expected, rtol=1e-6)
+
+
+def test_fake_povray_region_and_stats(tmp_path):
+    image, err = run_fake_povray(tmp_path, 'Output_File_Type=P', '+SR2',
+                                 '+ER3', '+SC2', '+EC4')
+    numpy.testing.assert_array_equal(image_to_numpy('P', buffer=image),
+                                     gradient(range(1, 4), rows=2)[:, :, :3])
+    stats = RenderStats.from_output(err)
+    assert stats.resolution == (5, 3)
+    assert stats.pixels == 6
+    assert stats.peak_memory == 2**20 + len("sphere { <0,0,0>, 1 }\n")
+
+
+def test_run_benchmarks_json(tmp_path):
+    json_file = str(tmp_path / 'results.json')
+    output = subprocess.run([sys.executable, RUN_BENCHMARKS, '--quick',
+                             '-k', 'ppm_to_numpy', '--repeat', '1',
+                             '--json', json_file],
+                            stdout=subprocess.PIPE, check=True).stdout
+    with open(json_file) as f:
+        data = json.load(f)
+    assert data['size'] == 'quick'
+    assert [(r['benchmark'], r['case']) for r in data['results']] == [
+        ('ppm_to_numpy', '256x256'), ('ppm_to_numpy', '1024x1024')]
+    assert all(r['seconds'] > 0 for r in data['results'])
+    assert output.decode().count('ppm_to_numpy') == 2
@@ -0,0 +1,138 @@
+import numpy
+import pytest
+
+from vapory import (Scene, Camera, Sphere, Box, Union, ClippedBy,
+                    Intersection, Isosurface, ContainedBy, Object,
+                    InstanceArray, bounding_box, add_bounds, cull_objects)
+
+
+def test_inverse_clip_keeps_the_clipped_object_bounds():
+    box = Box([-2, -2, -2], [2, 2, 2],
+              ClippedBy(Sphere([0, 0, 0], .5, 'inverse')))
+    assert bounding_box(box) == ((-2, -2, -2), (2, 2, 2))
+    assert bounding_box(Union(box, Sphere([0, 0, 0], .1))) == (
+        (-2, -2, -2), (2, 2, 2))
+
+
+def test_clip_shrinks_the_bounds():
+    box = Box([-2, -2, -2], [2, 2, 2], ClippedBy(Sphere([0, 0, 0], .5)))
+    assert bounding_box(box) == ((-.5, -.5, -.5), (.5, .5, .5))
+
+
+def test_inverse_clip_is_not_culled_or_bounded():
+    # The corner of the box is in view, the clipping sphere is not.
+    union = Union(Box([-2, -2, -2], [2, 2, 2],
+                      ClippedBy(Sphere([0, 0, 0], .5, 'inverse'))),
+                  Sphere([0, 0, 0], .1))
+    camera = Camera('location', [1.5, 1.5, -5], 'look_at', [1.5, 1.5, 0],
+                    'angle', 10)
+    scene = Scene(camera, [union])
+    assert cull_objects(scene).objects == [union]
+    assert "bounded_by" not in str(add_bounds(union))
+
+
+def test_bounds_follow_vectors_modified_in_place():
+    sphere = Sphere([0, 0, 0], 1)
+    assert bounding_box(sphere) == ((-1, -1, -1), (1, 1, 1))
+    sphere.args[0][0] = 10
+    assert bounding_box(sphere) == ((9, -1, -1), (11, 1, 1))
+
+
+def container(obj):
+    """ The ContainedBy of an isosurface, or None. """
+    for e in obj.args:
+        if isinstance(e, ContainedBy):
+            return e
+    return None
+
+
+def corners(contained_by):
+    return tuple(tuple(c) for c in contained_by.args[0].args[:2])
+
+
+def assert_box_close(box, expected):
+    numpy.testing.assert_allclose(numpy.array(box), numpy.array(expected),
+                                  atol=1e-5)
+
+
+def test_clipped_isosurface_gets_smaller_container():
+    iso = Isosurface('function { x*x + y*y + z*z - 0.25 }',
+                     ContainedBy(Box([-5, -5, -5], [5, 5, 5])),
+                     ClippedBy(Box([-1, -1, -1], [1, 1, 1])),
+                     'translate', [3, 0, 0])
+    bounded = add_bounds(iso)
+    assert_box_close(corners(container(bounded)), [(-1, -1, -1), (1, 1, 1)])
+    # The container is only shrunk: it still contains the clip.
+    assert all(x < -1 for x in corners(container(bounded))[0])
+    assert corners(container(iso)) == ((-5, -5, -5), (5, 5, 5))
+
+
+def test_intersected_isosurface_gets_container():
+    iso = Isosurface('function { x + y }', 'threshold', 0.1)
+    box = Box([0, 0, 0], [0.5, 0.5, 0.5])
+    bounded = add_bounds(Intersection(iso, box, 'rotate', [0, 45, 0]))
+    new_iso = bounded.args[0]
+    # Inserted after the function (the default container is the unit box).
+    assert isinstance(new_iso.args[1], ContainedBy)
+    assert new_iso.args[2:] == ['threshold', 0.1]
+    assert_box_close(corners(container(new_iso)), [(0, 0, 0), (0.5, 0.5, 0.5)])
+    assert bounded.args[1] is box
+
+
+@pytest.mark.parametrize('iso', [
+    # Containers which are not plain boxes.
+    Isosurface('function { x }', ContainedBy(Sphere([0, 0, 0], 5)),
+               ClippedBy(Box([-1, -1, -1], [1, 1, 1]))),
+    Isosurface('function { x }',
+               ContainedBy(Box([-5, -5, -5], [5, 5, 5], 'rotate', 45)),
+               ClippedBy(Box([-1, -1, -1], [1, 1, 1]))),
+    # Not clearly smaller.
+    Isosurface('function { x }', ContainedBy(Box([-1, -1, -1], [1, 1, 1])),
+               ClippedBy(Box([-1, -1, -1], [1, 1, 0.9]))),
+    # The clip is after a transform: in other coordinates.
+    Isosurface('function { x }', ContainedBy(Box([-5, -5, -5], [5, 5, 5])),
+               'scale', 10, ClippedBy(Box([-1, -1, -1], [1, 1, 1]))),
+    # Inverse clip, open isosurface.
+    Isosurface('function { x }', ContainedBy(Box([-5, -5, -5], [5, 5, 5])),
+               ClippedBy(Box([-1, -1, -1], [1, 1, 1], 'inverse'))),
+    Isosurface('function { x }', ContainedBy(Box([-5, -5, -5], [5, 5, 5])),
+               'open', ClippedBy(Box([-1, -1, -1], [1, 1, 1]))),
+])
+def test_container_kept(iso):
+    assert str(container(add_bounds(iso))) == str(container(iso))
+
+
+def test_transformed_isosurface_container_kept_in_intersection():
+    iso = Isosurface('function { x }', 'scale', 3)
+    bounded = add_bounds(Intersection(iso, Box([0, 0, 0], [0.5, 0.5, 0.5])))
+    assert container(bounded.args[0]) is None
+
+
+def test_instance_array_bounds():
+    positions = numpy.array([[0, 0, 0], [5, 1, 2], [-3, 0, 1]], dtype=float)
+    scales = numpy.array([1, 2, 0.5])
+    rotations = numpy.array([[0, 0, 0], [0, 0, 90], [30, 0, 0]])
+    prototype = Box([0, 0, 0], [1, 1, 1])
+    array = InstanceArray(prototype, positions, 'translate', [0, 10, 0],
+                          scales=scales, rotations=rotations)
+    copies = Union(*[Object(prototype, 'scale', float(k), 'rotate', list(r),
+                            'translate', list(p))
+                     for (p, k, r) in zip(positions, scales, rotations)])
+    expected = bounding_box(Object(copies, 'translate', [0, 10, 0]))
+    assert_box_close(bounding_box(array), expected)
+
+
+def test_instance_array_of_spheres_bounds():
+    positions = numpy.array([[0, 0, 0], [5, 1, 2]], dtype=float)
+    array = InstanceArray(Sphere([0, 0, 0], 1), positions)
+    assert bounding_box(array) == ((-1, -1, -1), (6, 2, 3))
+
+
+def test_instance_array_culled():
+    camera = Camera('location', [0, 0, -5], 'look_at', [0, 0, 0],
+                    'angle', 30)
+    behind = InstanceArray(Sphere([0, 0, 0], 1),
+                           numpy.array([[0, 0, -20], [1, 0, -20]]))
+    visible = InstanceArray(Sphere([0, 0, 0], 1), numpy.array([[0, 0, 0]]))
+    scene = Scene(camera, [behind, visible])
+    assert list(cull_objects(scene).objects) == [visible]
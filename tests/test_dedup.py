@@ -0,0 +1,130 @@
+import re
+
+import pytest
+
+from vapory import (Scene, Camera, LightSource, Sphere, Box, Union, Texture,
+                    Pigment, Finish, Normal, Cylinder)
+
+DECLARE_RE = re.compile(r"#declare (VAPORY_DECL_\w+) =\n")
+REFERENCE_RE = re.compile(r"(?:object|texture|pigment|finish|normal) "
+                          r"\{ (VAPORY_DECL_\w+) \}")
+
+
+def texture():
+    return Texture(Pigment('color', [1, 0.5, 0]),
+                   Finish('phong', 0.9, 'reflection', 0.1, 'ambient', 0.2,
+                          'diffuse', 0.7),
+                   Normal('bumps', 0.3, 'scale', 0.2))
+
+
+def ring(texture):
+    return Union(*[Cylinder([i, 0, 0], [i, 1, 0], 0.1, texture)
+                   for i in range(3)])
+
+
+def scene(**kwargs):
+    objects = [LightSource([2, 4, -3], 'color', [1, 1, 1]),
+               Sphere([0, 0, 0], 1, texture()),
+               Box([-1, -1, -1], [1, 1, 1], texture()),
+               Union(ring(texture()), 'translate', [0, 2, 0]),
+               Union(ring(texture()), 'translate', [0, 4, 0]),
+               Sphere([5, 0, 0], 1, Texture(Pigment('color', [0, 0, 1])))]
+    return Scene(Camera('location', [0, 0, -5], 'look_at', [0, 0, 0]),
+                 objects, **kwargs)
+
+
+def split_declares(code):
+    """ Returns the #declare'd code by identifier (in the order of the
+    scene), and the rest of the scene. """
+    declares = {}
+    parts = DECLARE_RE.split(code)
+    for identifier, body in zip(parts[1::2], parts[2::2]):
+        declares[identifier] = body
+    # The last #declare is followed by the rest of the scene: the code of a
+    # #declare is a single balanced block.
+    if declares:
+        identifier, body = list(declares.items())[-1]
+        end = block_end(body)
+        declares[identifier], rest = body[:end], body[end:].lstrip("\n")
+    else:
+        rest = code
+    return declares, rest
+
+
+def block_end(code):
+    depth = 0
+    for i, c in enumerate(code):
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise ValueError("Unbalanced code")
+
+
+def expand(code):
+    """ Replaces the references to #declare'd subtrees with their code. """
+    declares, rest = split_declares(code)
+    declares = dict((k, v.strip("\n")) for (k, v) in declares.items())
+
+    def substitute(match):
+        return expand_references(declares[match.group(1)])
+
+    def expand_references(text):
+        return REFERENCE_RE.sub(substitute, text)
+
+    return expand_references(rest)
+
+
+def test_shared_subtrees_declared_once():
+    code = str(scene(dedup_min_size=50))
+    declared = DECLARE_RE.findall(code)
+    assert len(declared) == len(set(declared)) == 2
+    declares, rest = split_declares(code)
+    tex, rings = declared
+    # The texture: 3 uses in the ring, and one in each of the sphere and
+    # box. The ring: once in each of the two unions.
+    assert declares[rings].count("texture { %s }" % tex) == 3
+    assert rest.count("texture { %s }" % tex) == 2
+    assert rest.count("object { %s }" % rings) == 2
+    assert "phong" not in rest
+    assert "cylinder" not in rest
+
+
+@pytest.mark.parametrize('min_size', [1, 50])
+def test_declares_in_dependency_order(min_size):
+    # The #declare'd subtrees only refer to subtrees declared before them.
+    code = str(scene(dedup_min_size=min_size))
+    declares, _ = split_declares(code)
+    assert len(declares) >= 2
+    seen = set()
+    for identifier, body in declares.items():
+        assert set(REFERENCE_RE.findall(body)) <= seen
+        seen.add(identifier)
+
+
+@pytest.mark.parametrize('min_size', [1, 50, 200])
+def test_same_code_as_without_dedup(min_size):
+    assert expand(str(scene(dedup_min_size=min_size))) == str(scene())
+
+
+def test_same_code_minified():
+    deduplicated = scene(dedup_min_size=20, minify=True)
+    assert "#declare" in str(deduplicated)
+    assert expand(str(deduplicated)) == str(scene(minify=True))
+
+
+def test_small_and_unique_subtrees_not_declared():
+    assert "#declare" not in str(scene(dedup_min_size=10 ** 6))
+    single = Scene(Camera('location', [0, 0, -5], 'look_at', [0, 0, 0]),
+                   [Sphere([0, 0, 0], 1, texture())], dedup_min_size=1)
+    assert "#declare" not in str(single)
+
+
+def test_dedup_after_edit():
+    # The memoized hashes follow in-place edits of the shared subtrees.
+    s = scene(dedup_min_size=50)
+    str(s)
+    s.objects[1].args[2].args[0].args[1] = [0, 1, 0]
+    assert expand(str(s)) == str(Scene(s.camera, s.objects))
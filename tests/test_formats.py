@@ -0,0 +1,254 @@
+import zlib
+import struct
+
+import numpy
+import pytest
+
+from vapory.formats import (read_pnm_header, ppm_to_numpy, png_to_numpy,
+                            tga_to_numpy, hdr_to_numpy, PNG_SIGNATURE)
+
+
+def test_header_p6():
+    header = read_pnm_header(b"P6\n4 3\n255\n" + bytes(36))
+    assert header == dict(width=4, height=3, channels=3, maxval=255,
+                          offset=11)
+
+
+def test_header_comments_and_whitespace():
+    data = b"P5 # a comment\n# another\n 4\t# width\n3\r\n65535 \x01\x02"
+    header = read_pnm_header(data)
+    assert (header['width'], header['height'], header['maxval'],
+            header['channels']) == (4, 3, 65535, 1)
+    # Exactly one whitespace character after the maxval.
+    assert data[header['offset']:] == b"\x01\x02"
+
+
+def test_header_pam():
+    data = (b"P7\nWIDTH 2\nHEIGHT 1 # comment\nDEPTH 4\nMAXVAL 255\n"
+            b"TUPLTYPE RGB_ALPHA\nENDHDR\n" + bytes(8))
+    header = read_pnm_header(data)
+    assert (header['width'], header['height'], header['channels'],
+            header['maxval']) == (2, 1, 4, 255)
+    assert header['offset'] == len(data) - 8
+
+
+def test_header_truncated():
+    assert read_pnm_header(b"P6\n4 3") is None
+    assert read_pnm_header(b"P6\n4 3\n255") is None
+    assert read_pnm_header(b"P7\nWIDTH 2\nHEIGHT 1\n") is None
+    assert read_pnm_header(b"P7\nWIDTH 2\nENDHDR") is None
+
+
+@pytest.mark.parametrize('data', [
+    b"P3\n4 3\n255\n",
+    b"\x89PNG\r\n",
+    b"P6\n4x 3\n255\n",
+    b"P7\nWIDTH 2\nENDHDR\n",
+    b"P7\nWIDTH 2\nHEIGHT 1\nDEPTH 3\nMAXVAL 255\nTUPLTYPE RGB_ALPHA\n"
+    b"ENDHDR\n",
+])
+def test_header_invalid(data):
+    with pytest.raises(ValueError):
+        read_pnm_header(data)
+
+
+def test_ppm_to_numpy_p6():
+    pixels = numpy.arange(36, dtype='uint8').reshape((3, 4, 3))
+    arr = ppm_to_numpy(buffer=b"P6\n4 3\n255\n" + pixels.tobytes())
+    assert arr.dtype == numpy.uint8
+    numpy.testing.assert_array_equal(arr, pixels)
+    assert not arr.flags.writeable
+
+
+def test_ppm_to_numpy_p5():
+    pixels = numpy.arange(12, dtype='uint8').reshape((3, 4))
+    arr = ppm_to_numpy(buffer=b"P5\n#c\n4 3\n255\n" + pixels.tobytes())
+    assert arr.shape == (3, 4)
+    numpy.testing.assert_array_equal(arr, pixels)
+
+
+def test_ppm_to_numpy_p7_rgba():
+    pixels = numpy.arange(24, dtype='uint8').reshape((2, 3, 4))
+    data = (b"P7\nWIDTH 3\nHEIGHT 2\nDEPTH 4\nMAXVAL 255\n"
+            b"TUPLTYPE RGB_ALPHA\nENDHDR\n" + pixels.tobytes())
+    numpy.testing.assert_array_equal(ppm_to_numpy(buffer=data), pixels)
+
+
+def test_ppm_to_numpy_16_bits():
+    pixels = numpy.array([[[1, 256, 65535], [0, 2, 4096]]], dtype='>u2')
+    data = b"P6\n2 1\n65535\n" + pixels.tobytes()
+    arr = ppm_to_numpy(buffer=data)
+    assert arr.dtype == numpy.dtype('>u2')
+    numpy.testing.assert_array_equal(arr, pixels)
+    little = ppm_to_numpy(buffer=data, byteorder='<')
+    assert little.dtype == numpy.dtype('<u2')
+    assert little[0, 0, 0] == 256
+
+
+def test_ppm_to_numpy_truncated():
+    with pytest.raises(ValueError):
+        ppm_to_numpy(buffer=b"P6\n4 3\n255\n" + bytes(35))
+    with pytest.raises(ValueError):
+        ppm_to_numpy(buffer=b"P6\n4 3\n65535\n" + bytes(36))
+    with pytest.raises(ValueError):
+        ppm_to_numpy(buffer=b"P6\n4 3")
+
+
+@pytest.mark.parametrize('memmap', [True, False])
+def test_ppm_to_numpy_file(tmp_path, memmap):
+    # A header longer than the first read of the file.
+    pixels = numpy.arange(36, dtype='uint8').reshape((3, 4, 3))
+    path = tmp_path / 'image.ppm'
+    path.write_bytes(b"P6\n#" + b"x" * 3000 + b"\n4 3\n255\n" +
+                     pixels.tobytes())
+    arr = ppm_to_numpy(str(path), memmap=memmap)
+    assert isinstance(arr, numpy.memmap) == memmap
+    numpy.testing.assert_array_equal(arr, pixels)
+
+
+def test_ppm_to_numpy_truncated_file_header(tmp_path):
+    path = tmp_path / 'image.ppm'
+    path.write_bytes(b"P6\n4 3")
+    with pytest.raises(ValueError):
+        ppm_to_numpy(str(path))
+
+
+def png_chunk(chunk_type, data):
+    return (struct.pack(">I", len(data)) + chunk_type + data +
+            struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if (pa <= pb) and (pa <= pc):
+        return a
+    return b if pb <= pc else c
+
+
+def encode_png(pixels, filters, depth=8, color_type=2):
+    """ Encodes the bytes of an image (a list of rows of bytes) with one
+    filter type per row, byte by byte as in the PNG specification. """
+    channels = {0: 1, 2: 3, 6: 4}[color_type]
+    bpp = channels * depth // 8
+    width = len(pixels[0]) // bpp
+    raw = b""
+    previous = [0] * len(pixels[0])
+    for row, filter_type in zip(pixels, filters):
+        encoded = []
+        for i, x in enumerate(row):
+            a = row[i - bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i - bpp] if i >= bpp else 0
+            predictor = [0, a, b, (a + b) // 2, paeth(a, b, c)][filter_type]
+            encoded.append((x - predictor) % 256)
+        raw += bytes([filter_type] + encoded)
+        previous = row
+    header = struct.pack(">IIBBBBB", width, len(pixels), depth, color_type,
+                         0, 0, 0)
+    return (PNG_SIGNATURE + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(raw)) + png_chunk(b"IEND", b""))
+
+
+def random_image(shape, dtype='uint8'):
+    rng = numpy.random.RandomState(0)
+    return rng.randint(0, numpy.iinfo(dtype).max + 1, shape).astype(dtype)
+
+
+@pytest.mark.parametrize('filters', [[0] * 5, [1] * 5, [2] * 5, [3] * 5,
+                                     [4] * 5, [4, 1, 3, 0, 2],
+                                     [0, 1, 2, 1, 0]])
+def test_png_filters(filters):
+    image = random_image((5, 7, 3))
+    data = encode_png([list(row.tobytes()) for row in image], filters)
+    numpy.testing.assert_array_equal(png_to_numpy(buffer=data), image)
+
+
+@pytest.mark.parametrize('filters', [[4] * 4, [3, 4, 2, 1]])
+def test_png_filters_16_bits_rgba(filters):
+    image = random_image((4, 6, 4), '>u2')
+    data = encode_png([list(row.tobytes()) for row in image], filters,
+                      depth=16, color_type=6)
+    arr = png_to_numpy(buffer=data)
+    assert arr.dtype == numpy.dtype('>u2')
+    numpy.testing.assert_array_equal(arr, image)
+
+
+def test_png_gray_paeth():
+    image = random_image((6, 3))
+    data = encode_png([list(row.tobytes()) for row in image], [4] * 6,
+                      color_type=0)
+    numpy.testing.assert_array_equal(png_to_numpy(buffer=data), image)
+
+
+def tga_header(image_type, width, height, bits, descriptor=0):
+    return struct.pack("<BBB5xHHHHBB", 0, 0, image_type, 0, 0, width, height,
+                       bits, descriptor)
+
+
+def test_tga_rle():
+    # 3x2 BGRA pixels, stored bottom row first: a run of 3 pixels, then a
+    # run of 1 pixel and 2 raw pixels.
+    data = (tga_header(10, 3, 2, 32) +
+            bytes([0x82, 1, 2, 3, 4]) +
+            bytes([0x80, 5, 6, 7, 8]) +
+            bytes([0x01, 9, 10, 11, 12, 13, 14, 15, 16]))
+    arr = tga_to_numpy(buffer=data)
+    expected = numpy.array([[[7, 6, 5, 8], [11, 10, 9, 12], [15, 14, 13, 16]],
+                            [[3, 2, 1, 4], [3, 2, 1, 4], [3, 2, 1, 4]]],
+                           dtype='uint8')
+    numpy.testing.assert_array_equal(arr, expected)
+
+
+def test_tga_rle_24_bits_top_left():
+    # A packet may span several rows.
+    data = (tga_header(10, 2, 2, 24, descriptor=0x20) +
+            bytes([0x82, 1, 2, 3]) + bytes([0x00, 4, 5, 6]))
+    arr = tga_to_numpy(buffer=data)
+    numpy.testing.assert_array_equal(arr, [[[3, 2, 1], [3, 2, 1]],
+                                           [[3, 2, 1], [6, 5, 4]]])
+
+
+def test_tga_rle_same_as_uncompressed():
+    image = random_image((3, 4, 4))
+    flat = tga_header(2, 4, 3, 32) + image.tobytes()
+    rle = tga_header(10, 4, 3, 32) + b"".join(
+        bytes([0x03]) + row.tobytes() for row in image)
+    numpy.testing.assert_array_equal(tga_to_numpy(buffer=rle),
+                                     tga_to_numpy(buffer=flat))
+
+
+def test_tga_rle_truncated():
+    with pytest.raises(ValueError):
+        tga_to_numpy(buffer=tga_header(10, 3, 2, 32) +
+                     bytes([0x82, 1, 2, 3, 4]))
+
+
+HDR_HEADER = b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y 2 +X 8\n"
+
+
+def rgbe_to_float(rgbe):
+    rgbe = numpy.asarray(rgbe, dtype='float64')
+    rgb = (rgbe[..., :3] + 0.5) * 2.0 ** (rgbe[..., 3:] - 136)
+    rgb[rgbe[..., 3] == 0] = 0
+    return rgb
+
+
+def test_hdr_rle():
+    # First row run-length encoded channel by channel, second row flat.
+    rgbe = numpy.zeros((2, 8, 4), dtype='uint8')
+    rgbe[0, :, 0] = [10] * 5 + [1, 2, 3]
+    rgbe[0, :, 1] = [20] * 8
+    rgbe[0, :, 2] = [1, 2, 3, 4, 5, 6, 7, 8]
+    rgbe[0, :, 3] = [128] * 4 + [0] * 2 + [130] * 2
+    rgbe[1] = random_image((8, 4))
+    row = (bytes([2, 2, 0, 8]) +
+           bytes([0x85, 10, 3, 1, 2, 3]) +
+           bytes([0x88, 20]) +
+           bytes([8, 1, 2, 3, 4, 5, 6, 7, 8]) +
+           bytes([0x84, 128, 0x82, 0, 0x82, 130]))
+    data = HDR_HEADER + row + rgbe[1].tobytes()
+    arr = hdr_to_numpy(buffer=data)
+    assert arr.dtype == numpy.float32
+    numpy.testing.assert_allclose(arr, rgbe_to_float(rgbe), rtol=1e-6)
+    assert (arr[0, 4:6] == 0).all()
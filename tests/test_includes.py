@@ -0,0 +1,74 @@
+import pytest
+
+import vapory.io
+from vapory import (Scene, Camera, LightSource, Sphere, Union, Static,
+                    RenderService)
+
+
+@pytest.fixture
+def commands(fake_povray, monkeypatch):
+    """ Records the POV-Ray commands of the renders. """
+    commands = []
+    run_povray = vapory.io.run_povray
+
+    def recording_run_povray(cmd, *args, **kwargs):
+        commands.append(cmd)
+        return run_povray(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(vapory.io, 'run_povray', recording_run_povray)
+    return commands
+
+
+def scene(cache_dir, *objects):
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [LightSource([2, 4, -3], 'color', [1, 1, 1])] + list(objects),
+                 cache_dir=cache_dir)
+
+
+def include_flags(cmd):
+    return [e for e in cmd if e.startswith('+L')]
+
+
+def test_no_include_dir_without_include_files(commands, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    scene(cache_dir, Sphere([0, 0, 0], 1)).render(width=8, height=6,
+                                                   includedirs=['extra'])
+    assert include_flags(commands[0]) == ['+Lextra']
+
+
+def test_include_dir_with_cacheable_elements(commands, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    s = scene(cache_dir, Union(Sphere([0, 0, 0], 1)).cacheable())
+    s.render(width=8, height=6)
+    # Again, with the memoized code and the existing include file.
+    s.render(width=8, height=6)
+    for cmd in commands:
+        assert include_flags(cmd) == ['+L' + cache_dir]
+
+
+def test_include_dir_with_static_groups(commands, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    scene(cache_dir, Static(Sphere([0, 0, 0], 1))).render(width=8, height=6)
+    assert include_flags(commands[0]) == ['+L' + cache_dir]
+
+
+def test_given_includedirs_not_modified(commands, tmp_path):
+    includedirs = ['extra']
+    s = scene(str(tmp_path), Union(Sphere([0, 0, 0], 1)).cacheable())
+    s.render(width=8, height=6, includedirs=includedirs)
+    assert includedirs == ['extra']
+    assert len(include_flags(commands[0])) == 2
+
+
+def test_service_include_dirs(commands, tmp_path):
+    service = RenderService(workers=1)
+    try:
+        service.render(scene(str(tmp_path), Sphere([0, 0, 0], 1)),
+                       width=8, height=6)
+        service.render(scene(str(tmp_path),
+                             Union(Sphere([0, 0, 0], 1)).cacheable()),
+                       width=8, height=6)
+    finally:
+        service.shutdown()
+    assert include_flags(commands[0]) == []
+    assert include_flags(commands[1]) == ['+L' + str(tmp_path)]
@@ -0,0 +1,125 @@
+import os
+
+import numpy
+import pytest
+
+from vapory import Scene, Camera, Sphere, RenderCache
+
+
+def scene():
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [Sphere([0, 0, 0], 1)])
+
+
+def test_cached_file_render_returns_none(fake_povray, tmp_path):
+    cache = RenderCache(directory=str(tmp_path / 'cache'))
+    outfile = str(tmp_path / 'image.png')
+    assert scene().render(outfile, width=8, height=6, cache=cache) is None
+    os.remove(outfile)
+    assert scene().render(outfile, width=8, height=6, cache=cache) is None
+    assert os.path.exists(outfile)
+
+
+@pytest.mark.parametrize('options', [
+    dict(cache=RenderCache()), dict(tempfile='scene.pov'),
+    dict(remove_temp=False), dict(region=(0, 3, 0, 4))])
+def test_tiled_render_options_not_ignored(fake_povray, options):
+    with pytest.raises(ValueError):
+        scene().render(width=8, height=6, tiles=(2, 2), **options)
+
+
+def test_tiled_render(fake_povray):
+    image = scene().render(width=8, height=6, tiles=(2, 2))
+    numpy.testing.assert_array_equal(image, scene().render(width=8, height=6))
+
+
+def test_max_memory(fake_povray):
+    import pytest
+    assert scene().render(width=8, height=6,
+                          max_memory=2**31).shape == (6, 8, 3)
+    with pytest.raises(IOError):
+        # Not enough memory for the (Python) fake POV-Ray to start.
+        scene().render(width=8, height=6, max_memory=2**20)
+
+
+def test_max_memory_from_threads(fake_povray):
+    from vapory import render_many
+    images = list(render_many([scene()] * 8, jobs=4, executor='thread',
+                              width=8, height=6, max_memory=2**31))
+    assert [image.shape for image in images] == [(6, 8, 3)] * 8
+
+
+def test_max_memory_async(fake_povray):
+    import asyncio
+    image = asyncio.run(scene().render_async(width=8, height=6,
+                                             max_memory=2**31))
+    assert image.shape == (6, 8, 3)
+
+
+def test_limit_memory_command():
+    from vapory.io import limit_memory
+    assert limit_memory(['povray', 'a.pov'], None) == ['povray', 'a.pov']
+    cmd = limit_memory(['povray', 'a.pov'], 2**30)
+    assert cmd[:2] == ['/bin/sh', '-c']
+    assert 'ulimit -v 1048576' in cmd[2]
+    assert cmd[-2:] == ['povray', 'a.pov']
+
+
+@pytest.fixture
+def scratch_dir(fake_povray, tmp_path, monkeypatch):
+    """ The directory of the scratch files of the 'file' transport. """
+    import vapory.io
+    directory = tmp_path / 'shm'
+    directory.mkdir()
+    monkeypatch.setattr(vapory.io, 'SCRATCH_DIR', str(directory))
+    return directory
+
+
+@pytest.mark.parametrize('options', [
+    dict(), dict(dtype='uint16'), dict(region=(1, 4, 2, 7))])
+def test_file_transport_memmap(scratch_dir, options):
+    arr = scene().render(width=8, height=6, transport='file', **options)
+    assert isinstance(arr, numpy.memmap)
+    assert not arr.flags.writeable
+    numpy.testing.assert_array_equal(
+        arr, scene().render(width=8, height=6, **options))
+    # The scratch files are removed, the mapping stays readable.
+    assert list(scratch_dir.iterdir()) == []
+    assert arr.sum() > 0
+
+
+@pytest.mark.parametrize('options', [
+    dict(channels='rgba'), dict(channels='rgba', dtype='uint16'),
+    dict(dtype='float32')])
+def test_file_transport_other_formats(scratch_dir, options):
+    arr = scene().render(width=8, height=6, transport='file', **options)
+    assert not isinstance(arr, numpy.memmap)
+    numpy.testing.assert_array_equal(
+        arr, scene().render(width=8, height=6, **options))
+    assert list(scratch_dir.iterdir()) == []
+
+
+def test_unknown_transport(fake_povray):
+    with pytest.raises(ValueError):
+        scene().render(width=8, height=6, transport='socket')
+
+
+@pytest.mark.parametrize('transport', ['pipe', 'file'])
+def test_out_array(scratch_dir, transport):
+    out = numpy.zeros((6, 8, 3), dtype='uint8')
+    arr = scene().render(width=8, height=6, transport=transport, out=out)
+    assert arr is out
+    numpy.testing.assert_array_equal(out, scene().render(width=8, height=6))
+    with pytest.raises(ValueError):
+        scene().render(width=8, height=5, transport=transport, out=out)
+
+
+def test_out_array_not_cached(fake_povray):
+    cache = RenderCache()
+    out = numpy.zeros((6, 8, 3), dtype='uint8')
+    expected = scene().render(width=8, height=6)
+    scene().render(width=8, height=6, cache=cache, out=out)
+    out[:] = 0
+    # Served from the cache, which doesn't hold the caller's buffer.
+    assert scene().render(width=8, height=6, cache=cache, out=out) is out
+    numpy.testing.assert_array_equal(out, expected)
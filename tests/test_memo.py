@@ -0,0 +1,138 @@
+import numpy
+
+from vapory import Sphere, Union, Mesh2, Texture, Pigment
+
+
+def serialized_twice(element):
+    # Elements are memoized the second time they are serialized.
+    str(element)
+    return str(element)
+
+
+def test_vector_modified_in_place():
+    sphere = Sphere([0, 0, 0], 1)
+    serialized_twice(sphere)
+    sphere.args[0][0] = 7
+    assert "<7,0,0>" in str(sphere)
+
+
+def test_vector_of_a_child_modified_in_place():
+    color = [1, 0, 0]
+    union = Union(Sphere([0, 0, 0], 1, Texture(Pigment('color', color))))
+    serialized_twice(union)
+    color[1] = 1
+    assert "<1,1,0>" in str(union)
+
+
+def test_array_modified_in_place():
+    vertices = numpy.zeros((3, 3))
+    mesh = Mesh2.from_arrays(vertices, numpy.array([[0, 1, 2]]))
+    before = serialized_twice(mesh)
+    vertices[0, 0] = 5
+    assert str(mesh) != before
+
+
+def memoized_scene():
+    from vapory import Scene, Camera
+    texture = Texture(Pigment('color', [1, 0, 0]))
+    scene = Scene(Camera('location', [0, 0, -3]),
+                  [Sphere([i, 0, 0], 1, texture) for i in range(100)])
+    serialized_twice(scene)
+    return scene
+
+
+def test_pickles_and_copies_drop_the_memos():
+    import copy
+    import pickle
+    scene = memoized_scene()
+    sphere = scene.objects[0]
+    assert sphere._memo is not None
+    assert len(pickle.dumps(sphere)) < 300
+    for new in [copy.deepcopy(scene), pickle.loads(pickle.dumps(scene))]:
+        assert new.objects[0]._memo is None
+        assert str(new) == str(scene)
+
+
+class Tagged(Sphere):
+    pov_keyword = "sphere"
+
+
+def test_pickle_keeps_the_attributes_of_subclasses():
+    import pickle
+    sphere = Tagged([0, 0, 0], 1).cacheable()
+    sphere.tag = "mine"
+    new = pickle.loads(pickle.dumps(sphere))
+    assert (new.tag, new.cache_include) == ("mine", True)
+    assert str(new) == str(sphere)
+
+
+def test_clear_memos():
+    from vapory import clear_memos
+    scene = memoized_scene()
+    code = str(scene)
+    clear_memos(scene)
+    assert all(e._memo is None for e in scene.objects)
+    assert scene.objects[0].args[2]._memo is None
+    assert str(scene) == code
+
+
+def test_arglist_mutators_bump_the_version():
+    from vapory.memo import ArgList
+    mutations = [
+        lambda a: a.__setitem__(0, 5), lambda a: a.__delitem__(0),
+        lambda a: a.__iadd__([4]), lambda a: a.__imul__(2),
+        lambda a: a.append(4), lambda a: a.extend([4]),
+        lambda a: a.insert(0, 4), lambda a: a.pop(), lambda a: a.remove(2),
+        lambda a: a.clear(), lambda a: a.sort(), lambda a: a.reverse()]
+    for mutate in mutations:
+        args = ArgList([3, 2, 1])
+        mutate(args)
+        assert args.version == 1
+
+
+def test_args_modified_in_place_after_memoized_render():
+    sphere = Sphere([0, 0, 0], 1)
+    serialized_twice(sphere)
+    sphere.args.append('translate')
+    sphere.args.append([0, 1, 0])
+    assert "translate\n<0,1,0>" in str(sphere)
+    sphere.args[1] = 2
+    assert "<0,0,0>\n2\n" in str(sphere)
+
+
+def test_nested_list_modified_in_place():
+    from vapory import Polygon
+    points = [[0, 0], [1, 1]]
+    polygon = Polygon(2, points)
+    before = serialized_twice(polygon)
+    points[1][0] = 5
+    after = str(polygon)
+    assert after != before
+    assert "5" in after
+
+
+def test_numpy_arg_modified_in_place():
+    centers = numpy.array([[0., 1, 2], [3, 4, 5]])
+    sphere = Sphere(centers, 1)
+    serialized_twice(sphere)
+    centers[1, 1] = 7
+    assert "<3.0,7.0,5.0>" in str(sphere)
+
+
+def test_shared_child_modified_under_two_parents():
+    color = [1, 0, 0]
+    texture = Texture(Pigment('color', color))
+    first = Union(Sphere([0, 0, 0], 1, texture))
+    second = Union(Sphere([1, 0, 0], 1), texture)
+    serialized_twice(first)
+    serialized_twice(second)
+    hashes = (first.content_hash(), second.content_hash())
+    color[2] = 1
+    assert "<1,0,1>" in str(first)
+    assert "<1,0,1>" in str(second)
+    assert first.content_hash() != hashes[0]
+    assert second.content_hash() != hashes[1]
+    # The other way around: a child replaced in one parent only.
+    texture.args[0] = Pigment('color', [0, 1, 0])
+    assert "<0,1,0>" in str(first)
+    assert "<0,1,0>" in str(second)
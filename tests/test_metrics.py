@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from vapory import Scene, Camera, Sphere
+from vapory.metrics import (REGISTRY, MetricsRegistry, add_hook, remove_hook,
+                            timed)
+
+
+@pytest.fixture
+def stages():
+    """ Records the (stage, seconds, info) of the hook calls, with empty
+    metrics. """
+    REGISTRY.reset()
+    calls = []
+    hook = lambda stage, seconds, info: calls.append((stage, seconds, info))
+    add_hook(hook)
+    yield calls
+    remove_hook(hook)
+    REGISTRY.reset()
+
+
+def scene():
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [Sphere([0, 0, 0], 1)])
+
+
+def test_render_stages(fake_povray, stages):
+    scene().render(width=8, height=6)
+    names = [stage for (stage, seconds, info) in stages]
+    assert sorted(names) == sorted([
+        'serialization', 'file_write', 'spawn', 'povray', 'povray_parse',
+        'povray_trace', 'decode'])
+    assert all(seconds >= 0 for (stage, seconds, info) in stages)
+    info = dict((stage, info) for (stage, seconds, info) in stages)
+    # The scene as written, with the camera angle of the image size.
+    assert info['file_write']['bytes'] > len(str(scene()))
+    assert REGISTRY.counter('vapory_scene_bytes_total').value == (
+        info['file_write']['bytes'])
+    histogram = REGISTRY.histogram('vapory_stage_seconds', stage='decode')
+    assert histogram.count == 1
+    assert REGISTRY.counter('vapory_renders_total').value == 1
+
+
+def test_failed_render_counted(fake_povray, stages):
+    with pytest.raises(IOError):
+        scene().render(width=8, height=6, max_memory=2**20)
+    assert REGISTRY.counter('vapory_render_failures_total').value == 1
+    assert 'decode' not in [stage for (stage, seconds, info) in stages]
+
+
+def test_timed_records_on_error(stages):
+    with pytest.raises(KeyError):
+        with timed('decode', width=3):
+            raise KeyError()
+    assert [(s, i) for (s, t, i) in stages] == [('decode', {'width': 3})]
+
+
+def test_histogram_buckets_and_exports(tmp_path):
+    registry = MetricsRegistry()
+    for value in [0.002, 0.2, 7, 1000]:
+        registry.observe('vapory_stage_seconds', value, stage='povray')
+    registry.inc('vapory_renders_total', 4)
+    histogram = registry.histogram('vapory_stage_seconds', stage='povray')
+    buckets = dict(zip(histogram.buckets, histogram.counts))
+    assert (buckets[0.001], buckets[0.005], buckets[0.5], buckets[10],
+            buckets[float('inf')]) == (0, 1, 2, 3, 4)
+    assert histogram.sum == pytest.approx(1007.202)
+
+    text = registry.to_prometheus()
+    assert "# TYPE vapory_renders_total counter\n" in text
+    assert "vapory_renders_total 4\n" in text
+    assert ('vapory_stage_seconds_bucket{stage="povray",le="0.5"} 2\n'
+            in text)
+    assert ('vapory_stage_seconds_bucket{stage="povray",le="+Inf"} 4\n'
+            in text)
+    assert 'vapory_stage_seconds_count{stage="povray"} 4\n' in text
+
+    registry.write_json(str(tmp_path / 'metrics.json'))
+    registry.write_prometheus(str(tmp_path / 'metrics.prom'))
+    with open(str(tmp_path / 'metrics.json')) as f:
+        data = json.load(f)
+    assert data['vapory_renders_total'] == [
+        {'labels': {}, 'type': 'counter', 'value': 4}]
+    assert data['vapory_stage_seconds'][0]['count'] == 4
+    assert (tmp_path / 'metrics.prom').read_text() == text
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'metrics.json', 'metrics.prom']
@@ -0,0 +1,100 @@
+import os
+
+import numpy
+import pytest
+
+from vapory import Scene, Camera, Sphere, render_many, render_tiles
+from vapory.parallel import tile_regions
+
+
+def scene(n_spheres=1):
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [Sphere([i, 0, 0], 1) for i in range(n_spheres)])
+
+
+def test_render_many_own_scene_files(fake_povray, tmp_path, monkeypatch):
+    # The fake POV-Ray reports a peak memory which grows with the size of
+    # the scene file it read: each render reads its own scene.
+    monkeypatch.chdir(tmp_path)
+    scenes = [scene(n) for n in [1, 20, 5, 40, 10, 30]]
+    results = list(render_many(scenes, jobs=3, executor='thread', width=8,
+                               height=6, return_stats=True))
+    memories = [stats.peak_memory for (image, stats) in results]
+    assert len(set(memories)) == 6
+    assert numpy.argsort(memories).tolist() == [0, 2, 4, 1, 5, 3]
+    for image, stats in results:
+        assert image.shape == (6, 8, 3)
+    # No scratch files in the current directory.
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_render_many_unordered(fake_povray):
+    results = list(render_many([scene()] * 5, jobs=2, executor='thread',
+                               ordered=False, width=8, height=6))
+    assert sorted(i for (i, image) in results) == list(range(5))
+    for i, image in results:
+        assert image.shape == (6, 8, 3)
+
+
+def test_render_many_outfiles(fake_povray, tmp_path):
+    outfiles = [str(tmp_path / ('frame_%d.png' % i)) for i in range(3)]
+    results = list(render_many([scene()] * 3, jobs=3, executor='thread',
+                               outfiles=outfiles, width=8, height=6))
+    assert results == [None] * 3
+    assert all(os.path.exists(f) for f in outfiles)
+
+
+def test_render_many_processes(fake_povray):
+    images = list(render_many([scene(), scene(2)], jobs=2, width=8,
+                              height=6))
+    numpy.testing.assert_array_equal(images[0], images[1])
+    assert images[0].shape == (6, 8, 3)
+
+
+def test_render_many_errors(fake_povray):
+    with pytest.raises(ValueError):
+        list(render_many([scene()], executor='fibers'))
+    with pytest.raises(IOError):
+        list(render_many([scene()] * 2, executor='thread', width=8,
+                         height=6, max_memory=2**20))
+
+
+@pytest.mark.parametrize('tiles', [(1, 1), (3, 2), (4, 7), (20, 3)])
+def test_tile_regions_cover_the_image(tiles):
+    covered = numpy.zeros((7, 10), dtype=int)
+    for row_start, row_end, col_start, col_end in tile_regions(10, 7, tiles):
+        covered[row_start:row_end, col_start:col_end] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize('tiles', [(3, 2), (10, 1), (1, 7)])
+def test_tiled_render_same_as_full_render(fake_povray, tiles):
+    full = scene().render(width=10, height=7)
+    tiled = scene().render(width=10, height=7, tiles=tiles, jobs=3)
+    assert tiled.dtype == full.dtype
+    numpy.testing.assert_array_equal(tiled, full)
+
+
+def test_tiled_render_rgba_in_out_array(fake_povray):
+    out = numpy.zeros((6, 8, 4), dtype='uint8')
+    image = scene().render(width=8, height=6, tiles=(2, 3), jobs=2,
+                           output_alpha=True, out=out)
+    assert image is out
+    numpy.testing.assert_array_equal(
+        out, scene().render(width=8, height=6, output_alpha=True))
+
+
+def test_render_tiles_of_code(fake_povray):
+    image = render_tiles(str(scene()), 8, 6, tiles=(2, 2), executor='thread')
+    numpy.testing.assert_array_equal(image,
+                                     scene().render(width=8, height=6))
+
+
+def test_tiled_render_errors(fake_povray, tmp_path):
+    with pytest.raises(ValueError):
+        scene().render(str(tmp_path / 'image.png'), width=8, height=6,
+                       tiles=(2, 2))
+    with pytest.raises(ValueError):
+        scene().render(tiles=(2, 2))
+    with pytest.raises(ValueError):
+        scene().render(width=8, height=6, tiles=(2, 2), return_stats=True)
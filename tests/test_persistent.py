@@ -0,0 +1,164 @@
+import copy
+import pickle
+import random
+
+import pytest
+
+from vapory import Scene, Camera, Sphere
+from vapory.persistent import SharedList
+
+
+def check(shared, items):
+    assert list(shared) == items
+    assert len(shared) == len(items)
+    assert shared == items
+    assert sum(map(len, shared._segments)) == len(items)
+
+
+def test_random_operations_like_list():
+    rng = random.Random(0)
+    items = []
+    shared = SharedList()
+    for step in range(2000):
+        n = len(items)
+        op = rng.choice(['append', 'extend', 'insert', 'set', 'del', 'pop',
+                         'iadd', 'slice_set', 'slice_del', 'remove'])
+        if op == 'append':
+            items.append(step)
+            shared.append(step)
+        elif op == 'extend':
+            values = list(range(step, step + rng.randint(0, 20)))
+            items.extend(values)
+            shared.extend(values)
+        elif op == 'iadd':
+            items += [step, -step]
+            shared += [step, -step]
+        elif op == 'insert':
+            index = rng.randint(-n - 3, n + 3)
+            items.insert(index, step)
+            shared.insert(index, step)
+        elif not n:
+            continue
+        elif op == 'set':
+            index = rng.randint(-n, n - 1)
+            items[index] = -step
+            shared[index] = -step
+        elif op == 'del':
+            index = rng.randint(-n, n - 1)
+            del items[index]
+            del shared[index]
+        elif op == 'pop':
+            index = rng.randint(-n, n - 1)
+            assert shared.pop(index) == items.pop(index)
+        elif op == 'slice_set':
+            i, j = sorted(rng.randint(0, n) for _ in range(2))
+            items[i:j] = [step] * 3
+            shared[i:j] = [step] * 3
+        elif op == 'slice_del':
+            i, j = sorted(rng.randint(0, n) for _ in range(2))
+            del items[i:j:2]
+            del shared[i:j:2]
+        elif op == 'remove':
+            value = rng.choice(items)
+            items.remove(value)
+            shared.remove(value)
+        check(shared, items)
+
+
+def test_read_operations_like_list():
+    items = [3, 1, 4, 1, 5, 9, 2, 6]
+    shared = SharedList(items[:6])
+    shared.extend(items[6:])
+    assert len(shared._segments) == 2
+    for index in range(-8, 8):
+        assert shared[index] == items[index]
+    for s in [slice(None), slice(2, 6), slice(None, None, -1),
+              slice(1, None, 3), slice(-3, -1)]:
+        assert shared[s] == items[s]
+    assert (5 in shared) and (7 not in shared)
+    assert shared.index(1) == 1
+    assert shared.index(1, 2) == 3
+    assert shared.count(1) == 2
+    assert list(reversed(shared)) == items[::-1]
+    with pytest.raises(IndexError):
+        shared[8]
+    with pytest.raises(IndexError):
+        shared[-9]
+    with pytest.raises(ValueError):
+        shared.index(7)
+
+
+def test_operators_like_list():
+    shared = SharedList([1, 2])
+    assert shared + [3] == [1, 2, 3]
+    assert [0] + shared == [0, 1, 2]
+    assert shared * 2 == [1, 2, 1, 2]
+    assert 2 * shared == [1, 2, 1, 2]
+    assert shared != [1, 2, 3]
+    assert shared != (1, 2)
+    shared *= 3
+    assert shared == [1, 2] * 3
+    assert isinstance(shared, SharedList)
+
+
+def test_reverse_sort_clear():
+    items = list(range(10))
+    shared = SharedList(items[:6])
+    shared.extend(items[6:])
+    shared.reverse()
+    items.reverse()
+    check(shared, items)
+    shared.sort()
+    items.sort()
+    check(shared, items)
+    shared.sort(key=lambda x: x % 3, reverse=True)
+    items.sort(key=lambda x: x % 3, reverse=True)
+    check(shared, items)
+    shared.clear()
+    check(shared, [])
+
+
+def test_reverse_single_pass(monkeypatch):
+    # No item-by-item access (which costs O(n) each).
+    shared = SharedList(range(1000))
+    shared.extend(range(1000, 1300))
+
+    def locate(*args):
+        raise AssertionError("reverse should not locate items")
+
+    monkeypatch.setattr(SharedList, '_locate', locate)
+    shared.reverse()
+    assert list(shared) == list(range(1299, -1, -1))
+
+
+def test_copies_are_independent():
+    first = SharedList(range(5))
+    second = first.copy()
+    third = first + [5]
+    second[0] = 'x'
+    del second[1]
+    third.append(6)
+    first.reverse()
+    assert first == [4, 3, 2, 1, 0]
+    assert second == ['x', 2, 3, 4]
+    assert third == [0, 1, 2, 3, 4, 5, 6]
+
+
+def test_pickle_and_copy():
+    shared = SharedList([1, [2, 3]])
+    for other in [pickle.loads(pickle.dumps(shared)), copy.copy(shared),
+                  copy.deepcopy(shared)]:
+        assert isinstance(other, SharedList)
+        assert other == shared
+    assert copy.deepcopy(shared)[1] is not shared[1]
+
+
+def test_scene_objects():
+    sphere = Sphere([0, 0, 0], 1)
+    scene = Scene(Camera('location', [0, 0, -3]), (sphere,))
+    assert isinstance(scene.objects, SharedList)
+    assert not isinstance(scene.objects, list)
+    assert list(scene.objects) == [sphere]
+    other = scene.add_objects([Sphere([1, 0, 0], 1)])
+    assert len(other.objects) == 2
+    assert len(scene.objects) == 1
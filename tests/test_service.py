@@ -0,0 +1,215 @@
+import json
+import socket
+import threading
+from concurrent.futures import wait
+
+import numpy
+import pytest
+
+import vapory.io
+import vapory.service
+from vapory import (Scene, Camera, LightSource, Sphere, RenderService,
+                    RenderCache)
+from vapory.service import request_render
+
+
+def scene():
+    return Scene(Camera('location', [0, 0, -3], 'look_at', [0, 0, 0]),
+                 [LightSource([2, 4, -3], 'color', [1, 1, 1]),
+                  Sphere([0, 0, 0], 1)])
+
+
+def test_socket_round_trip_float(fake_povray):
+    service = RenderService(workers=1)
+    try:
+        host, port = service.serve()
+        direct = scene().render(width=8, height=6, dtype='float32')
+        arr = request_render(scene(), port, host, width=8, height=6,
+                             dtype='float32')
+    finally:
+        service.shutdown()
+    assert arr.dtype == numpy.float32
+    assert arr.shape == (6, 8, 3)
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def test_socket_round_trip_uint16(fake_povray):
+    service = RenderService(workers=1)
+    try:
+        host, port = service.serve()
+        direct = scene().render(width=8, height=6, dtype='uint16')
+        arr = request_render(scene(), port, host, width=8, height=6,
+                             dtype='uint16')
+    finally:
+        service.shutdown()
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("POV-Ray should not run on a cache hit")
+
+
+def test_cache_shared_with_scene_render(fake_povray, monkeypatch):
+    cache = RenderCache()
+    direct = scene().render(width=8, height=6, cache=cache)
+    service = RenderService(workers=1, cache=cache)
+    monkeypatch.setattr(vapory.service, '_render_povfile', fail)
+    try:
+        arr = service.render(scene(), width=8, height=6)
+    finally:
+        service.shutdown()
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def test_scene_render_uses_service_cache(fake_povray, monkeypatch):
+    cache = RenderCache()
+    service = RenderService(workers=1, cache=cache)
+    try:
+        arr = service.render(scene(), width=8, height=6, dtype='uint16')
+    finally:
+        service.shutdown()
+    monkeypatch.setattr(vapory.io, '_run_render', fail)
+    direct = scene().render(width=8, height=6, dtype='uint16', cache=cache)
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def test_service_reads_disk_cache(fake_povray, monkeypatch, tmp_path):
+    # A new process: only the disk tier of the cache is filled.
+    direct = scene().render(width=8, height=6,
+                            cache=RenderCache(directory=str(tmp_path)))
+    service = RenderService(workers=1,
+                            cache=RenderCache(directory=str(tmp_path)))
+    monkeypatch.setattr(vapory.service, '_render_povfile', fail)
+    try:
+        arr = service.render(scene(), width=8, height=6)
+    finally:
+        service.shutdown()
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def test_service_writes_disk_cache(fake_povray, monkeypatch, tmp_path):
+    service = RenderService(workers=1,
+                            cache=RenderCache(directory=str(tmp_path)))
+    try:
+        arr = service.render(scene(), width=8, height=6, transport='file')
+    finally:
+        service.shutdown()
+    assert len(list(tmp_path.iterdir())) == 1
+    monkeypatch.setattr(vapory.io, '_run_render', fail)
+    direct = scene().render(width=8, height=6,
+                            cache=RenderCache(directory=str(tmp_path)))
+    numpy.testing.assert_array_equal(arr, direct)
+
+
+def send_raw(port, line, data=b''):
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        f = sock.makefile('rwb')
+        f.write(line + b"\n" + data)
+        f.flush()
+        return json.loads(f.readline().decode('utf8'))
+
+
+@pytest.mark.parametrize('request_line', [
+    b'{"width": 8, "height": 6}',
+    b'{"size": "12"}',
+    b'{"size": 1.5}',
+    b'{"size": -1}',
+    b'[1, 2]',
+    b'not json',
+    b'{"size": 0, "timeout": 1}',
+    b'{"size": 0, "max_memory": 1}',
+    b'{"size": 0, "transport": "file"}',
+])
+def test_socket_rejects_bad_requests(fake_povray, monkeypatch, request_line):
+    service = RenderService(workers=1)
+    monkeypatch.setattr(vapory.service, '_render_povfile', fail)
+    try:
+        host, port = service.serve()
+        response = send_raw(port, request_line)
+    finally:
+        service.shutdown()
+    assert 'error' in response
+    assert 'size' not in response
+
+
+def test_socket_accepts_whitelisted_options(fake_povray):
+    service = RenderService(workers=1)
+    try:
+        host, port = service.serve()
+        arr = request_render(scene(), port, host, width=8, height=6,
+                             quality=5, antialiasing=0.3, channels='rgba',
+                             region=(1, 4, 2, 6), priority=2, deadline=30)
+    finally:
+        service.shutdown()
+    assert arr.shape == (3, 4, 4)
+
+
+class BlockedRender:
+    """ Replaces POV-Ray: records the render options and waits for
+    release(). """
+
+    def __init__(self):
+        self.calls = []
+        self.event = threading.Event()
+
+    def __call__(self, pov_file, keep_image=False, **kwargs):
+        self.calls.append(kwargs)
+        self.event.wait()
+        return numpy.zeros((1, 1, 3), dtype='uint8'), None, b''
+
+    def release(self):
+        self.event.set()
+
+
+def test_coalesced_callers_keep_their_deadlines(monkeypatch):
+    render = BlockedRender()
+    monkeypatch.setattr(vapory.service, '_render_povfile', render)
+    service = RenderService(workers=1)
+    try:
+        early = service.submit("scene", deadline=0.2)
+        late = service.submit("scene", deadline=30)
+        wait([early], timeout=5)
+        assert isinstance(early.exception(timeout=0), TimeoutError)
+        assert not late.done()
+        render.release()
+        assert late.result(timeout=5).shape == (1, 1, 3)
+    finally:
+        render.release()
+        service.shutdown()
+    assert len(render.calls) == 1
+
+
+def test_queued_job_expires(monkeypatch):
+    render = BlockedRender()
+    monkeypatch.setattr(vapory.service, '_render_povfile', render)
+    service = RenderService(workers=1)
+    try:
+        busy = service.submit("busy")
+        queued = service.submit("queued", deadline=0.2)
+        wait([queued], timeout=5)
+        assert isinstance(queued.exception(timeout=0), TimeoutError)
+        assert not busy.done()
+        render.release()
+        busy.result(timeout=5)
+    finally:
+        render.release()
+        service.shutdown()
+    # The expired job was never rendered.
+    assert len(render.calls) == 1
+
+
+def test_job_timeout_is_latest_caller_deadline(monkeypatch):
+    render = BlockedRender()
+    monkeypatch.setattr(vapory.service, '_render_povfile', render)
+    service = RenderService(workers=1)
+    try:
+        busy = service.submit("busy")
+        first = service.submit("scene", deadline=5)
+        second = service.submit("scene", deadline=30)
+        render.release()
+        first.result(timeout=5)
+        second.result(timeout=5)
+    finally:
+        render.release()
+        service.shutdown()
+    assert 25 < render.calls[1]['timeout'] <= 30
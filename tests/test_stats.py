@@ -0,0 +1,123 @@
+from vapory.stats import RenderStats
+
+# What POV-Ray 3.7 writes on its standard error after a render.
+PARSER_STATS = """\
+Parser Statistics
+----------------------------------------------------------------------------
+Finite Objects:            3
+Infinite Objects:          1
+Light Sources:             1
+Total:                     5
+----------------------------------------------------------------------------
+Parser Time
+  Parse Time:       0 hours  0 minutes  0 seconds (0.012 seconds)
+              using 1 thread(s) with 0.011 CPU-seconds
+  Bounding Time:    0 hours  0 minutes  0 seconds (0.001 seconds)
+              using 1 thread(s) with 0.001 CPU-seconds
+"""
+
+RENDER_STATS = """\
+----------------------------------------------------------------------------
+Render Statistics
+Image Resolution 640 x 480
+----------------------------------------------------------------------------
+Pixels:           309760   Samples:          412345   Smpls/Pxl: 1.33
+Rays:             987654   Saved:             12345   Max Level: 5/5
+----------------------------------------------------------------------------
+Ray->Shape Intersection          Tests       Succeeded  Percentage
+----------------------------------------------------------------------------
+Box                             1582417       412020     26.04
+Plane                           2470153      1206844     48.86
+Sphere                          1582417       381547     24.11
+Bounding Box                   10451892      3905516     37.37
+----------------------------------------------------------------------------
+Shadow Ray Tests:          1193428   Succeeded:               364128
+Shadow Cache Hits:          513245
+----------------------------------------------------------------------------
+"""
+
+RENDER_TIME = """\
+Render Time:
+  Photon Time:      No photons
+  Radiosity Time:   0 hours  0 minutes  2 seconds (2.105 seconds)
+              using 4 thread(s) with 7.961 CPU-seconds
+  Trace Time:       0 hours  1 minutes  3 seconds (63.250 seconds)
+              using 4 thread(s) with 245.020 CPU-seconds
+"""
+
+MEMORY = """\
+----------------------------------------------------------------------------
+Peak memory used:          8472576 bytes
+POV-Ray finished
+"""
+
+
+def test_full_output():
+    output = PARSER_STATS + RENDER_STATS + RENDER_TIME + MEMORY
+    stats = RenderStats.from_output(output)
+    assert stats.parse_time == 0.012
+    assert stats.bounding_time == 0.001
+    assert stats.photon_time is None
+    assert stats.radiosity_time == 2.105
+    assert stats.trace_time == 63.25
+    assert stats.cpu_times == dict(parse=0.011, bounding=0.001,
+                                   radiosity=7.961, trace=245.02)
+    assert abs(stats.total_time - 65.368) < 1e-9
+    assert (stats.pixels, stats.samples, stats.rays, stats.saved_rays) == (
+        309760, 412345, 987654, 12345)
+    assert stats.resolution == (640, 480)
+    assert stats.intersections == {
+        'Box': (1582417, 412020), 'Plane': (2470153, 1206844),
+        'Sphere': (1582417, 381547), 'Bounding Box': (10451892, 3905516)}
+    assert (stats.shadow_ray_tests, stats.shadow_rays_succeeded) == (
+        1193428, 364128)
+    assert stats.peak_memory == 8472576
+    assert not stats.cached
+
+
+def test_bytes_with_carriage_returns():
+    output = (PARSER_STATS + RENDER_STATS + RENDER_TIME + MEMORY)
+    stats = RenderStats.from_output(output.replace("\n", "\r\n").encode())
+    assert stats.trace_time == 63.25
+    assert stats.intersections['Bounding Box'] == (10451892, 3905516)
+    assert stats.peak_memory == 8472576
+
+
+def test_progress_lines_before_the_statistics():
+    # POV-Ray rewrites its progress line with carriage returns.
+    progress = ("Rendered 10240 of 307200 pixels (3%)\r"
+                "Rendered 307200 of 307200 pixels (100%)\n")
+    stats = RenderStats.from_output(PARSER_STATS + progress + RENDER_STATS +
+                                    RENDER_TIME)
+    assert stats.pixels == 309760
+    assert stats.trace_time == 63.25
+
+
+def test_missing_sections():
+    # No intersection table (e.g. an empty scene), no memory line, and the
+    # render times only: the missing values stay empty.
+    render_stats = RENDER_STATS.split("Ray->Shape")[0]
+    stats = RenderStats.from_output(render_stats + RENDER_TIME)
+    assert stats.parse_time is None
+    assert stats.intersections == {}
+    assert stats.shadow_ray_tests is None
+    assert stats.peak_memory is None
+    assert stats.rays == 987654
+    assert stats.trace_time == 63.25
+    assert 'parse' not in stats.cpu_times
+
+
+def test_failed_render_output():
+    stats = RenderStats.from_output(
+        "File 'scene.pov' line 3: Parse Error: Expected 'object', "
+        "undeclared identifier 'Foo' found instead\nFatal error in parser: "
+        "Cannot parse input.\nRender failed\n")
+    assert stats.total_time == 0
+    assert stats.as_dict()['rays'] is None
+
+
+def test_as_dict_and_repr():
+    stats = RenderStats.from_output(MEMORY)
+    assert 'output' not in stats.as_dict()
+    assert repr(stats) == "RenderStats(cached=False, peak_memory=8472576)"
+    assert RenderStats(cached=True).cached
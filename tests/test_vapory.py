@@ -0,0 +1,109 @@
+import pickle
+
+import pytest
+
+from vapory import (Union, Sphere, Texture, Pigment, LightSource, Mesh2,
+                    SphereSweep)
+from vapory.vapory import POVRayElement
+
+
+class MyThing(POVRayElement):
+    size = 1
+
+    def __str__(self):
+        return "sphere { <0,0,0>, %d }" % self.size
+
+
+def test_nested_custom_str():
+    thing = MyThing()
+    union = Union(thing, Texture(Pigment('color', [1, 0, 0])))
+    assert "sphere { <0,0,0>, 1 }" in str(union)
+    assert "my_thing" not in str(union)
+    # Also when the union is memoized.
+    thing.size = 2
+    assert "sphere { <0,0,0>, 2 }" in str(union)
+    assert "sphere { <0,0,0>, 2 }" in str(Union(union))
+
+
+def test_custom_str_subclass_of_subclass():
+    class Ball(Sphere):
+        def __str__(self):
+            return "ball"
+
+    class SmallBall(Ball):
+        pass
+
+    assert str(Union(SmallBall([0, 0, 0], 1))) == "union {\nball \n}"
+    assert not Sphere.custom_str
+
+
+def test_custom_str_calling_super():
+    class Commented(Sphere):
+        pov_keyword = "sphere"
+
+        def __str__(self):
+            return "// a sphere\n" + POVRayElement.__str__(self)
+
+    code = str(Union(Commented([0, 0, 0], 1)))
+    assert "// a sphere\nsphere {" in code
+
+
+def test_minified_global_settings():
+    from vapory import Scene, Camera
+    scene = Scene(Camera('location', [0, 0, -3]), [Sphere([0, 0, 0], 1)],
+                  minify=True)
+    assert str(scene).endswith("\nglobal_settings{}")
+    scene.global_settings = ['assumed_gamma 1', 'max_trace_level 5']
+    assert str(scene).endswith(
+        "\nglobal_settings{assumed_gamma 1 max_trace_level 5}")
+    scene.minify = False
+    assert str(scene).endswith(
+        "\nglobal_settings{\nassumed_gamma 1\nmax_trace_level 5\n}")
+
+
+def test_elements_have_slots():
+    sphere = Sphere([0, 0, 0], 1)
+    assert not hasattr(sphere, '__dict__')
+    with pytest.raises(AttributeError):
+        sphere.size = 2
+    # Subclasses defined out of vapory keep their __dict__.
+    thing = MyThing()
+    thing.size = 3
+    assert thing.__dict__ == {'size': 3}
+
+
+@pytest.mark.parametrize('cls, keyword', [
+    (Sphere, 'sphere'), (LightSource, 'light_source'), (Mesh2, 'mesh2'),
+    (SphereSweep, 'sphere_sweep'), (MyThing, 'my_thing')])
+def test_precomputed_keywords(cls, keyword):
+    assert cls.pov_keyword == keyword
+    assert cls.pov_keyword == cls.transformed_name().lower()
+
+
+def test_args_tuple_until_read():
+    sphere = Sphere([0, 0, 0], 1)
+    union = Union(sphere).add_args(['hollow'])
+    assert str(union) == "union {\nsphere {\n<0,0,0>\n1 \n}\nhollow \n}"
+    # Serialization and add_args don't convert the args.
+    assert sphere._args.__class__ is tuple
+    assert union._args.__class__ is tuple
+    # Reading them gives a list which can be modified in place.
+    sphere.args[1] = 2
+    assert isinstance(sphere.args, list)
+    assert "\n2 \n" in str(union)
+    sphere.args.append('hollow')
+    assert str(sphere) == "sphere {\n<0,0,0>\n2\nhollow \n}"
+
+
+def test_copy_and_pickle_with_slots():
+    sphere = Sphere([0, 0, 0], 1).cacheable()
+    str(sphere)
+    thing = MyThing()
+    thing.size = 4
+    for original in [sphere, thing, Union(sphere, thing)]:
+        for other in [original.copy(),
+                      pickle.loads(pickle.dumps(original))]:
+            assert type(other) is type(original)
+            assert str(other) == str(original)
+    assert sphere.copy().cache_include
+    assert pickle.loads(pickle.dumps(thing)).size == 4
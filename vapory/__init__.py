@@ -2,3 +2,12 @@
 
 from .version import __version__
 from .vapory import *
+from .cache import RenderCache
+from .parallel import render_many, render_tiles
+from .animation import Animation
+from .includes import Static
+from .memo import clear_memos
+from .bounds import bounding_box, add_bounds
+from .culling import cull_objects
+from .service import RenderService
+from .stats import RenderStats
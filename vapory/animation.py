@@ -0,0 +1,129 @@
+"""
+Animations: a function of time returning a Scene, rendered frame by frame
+over a pool of workers.
+
+>>> def scene(t):
+...     return Scene(Camera('location', [cos(t), 1, sin(t)],
+...                         'look_at', [0, 0, 0]), objects=[...])
+>>> animation = Animation(scene, n_frames=100, fps=25)
+>>> for frame in animation.iter_frames(jobs=4, width=320, height=240):
+...     video_writer.write(frame)
+
+The objects which don't move can be grouped in a Static built once, outside
+of the scene function: they are written to a shared include file the first
+time, and each frame then only serializes the camera and the objects which
+change.
+
+>>> background = Static(LightSource([10, 10, -10], 'color', [1, 1, 1]),
+...                     *buildings)
+>>> def scene(t):
+...     return Scene(Camera('location', [t, 1, -5], 'look_at', [0, 0, 0]),
+...                  objects=[background, Sphere([t, 0, 0], 1)])
+"""
+
+import os
+from collections import deque
+from .parallel import make_executor, threads_per_job
+
+
+def _render_frame(scene_fn, t, render_kwargs):
+    return scene_fn(t).render(**render_kwargs)
+
+
+class Animation:
+    """ An animation defined by a function of time returning a Scene.
+
+    Parameters
+    ------------
+
+    scene_fn
+      Function ``t -> Scene``, with t the time in seconds. With the
+      'process' executor it is sent to the workers, so it must be defined
+      at the top level of a module (no lambda).
+
+    n_frames
+      Number of frames of the animation.
+
+    fps
+      Frames per second. Frame i is the scene at time ``i / fps``.
+    """
+
+    def __init__(self, scene_fn, n_frames, fps=25):
+        self.scene_fn = scene_fn
+        self.n_frames = n_frames
+        self.fps = fps
+
+    @property
+    def duration(self):
+        return 1.0 * self.n_frames / self.fps
+
+    def times(self):
+        """ Returns the times of the frames. """
+        return [1.0 * i / self.fps for i in range(self.n_frames)]
+
+    def scene_at(self, t):
+        return self.scene_fn(t)
+
+    def iter_frames(self, jobs=None, executor='process', max_pending=None,
+                    **render_kwargs):
+        """ Renders the frames in parallel and yields them in frame order.
+
+        At most ``max_pending`` frames are being rendered, waiting to be
+        consumed or held by the consumer at any time, so long animations
+        don't fill the memory when the consumer is slower than the renders.
+
+        Parameters
+        ------------
+
+        jobs
+          Number of frames rendered at the same time (default: number of
+          cores). The POV-Ray threads are split between them unless
+          ``threads`` is given.
+
+        executor
+          'process' (default), 'thread' or a concurrent.futures executor.
+
+        max_pending
+          Maximal number of frames in flight (default: 2 * jobs).
+
+        render_kwargs
+          Parameters of Scene.render (width, height, quality...). With
+          ``outfile``, a pattern like "frame_%04d.png" writes the frames to
+          files, and their names are yielded instead of arrays.
+        """
+
+        jobs = min(jobs or os.cpu_count() or 1, max(1, self.n_frames))
+        max_pending = max(1, max_pending or 2 * jobs)
+        render_kwargs.setdefault('threads', threads_per_job(jobs))
+        outfile = render_kwargs.pop('outfile', None)
+
+        pool = make_executor(executor, jobs)
+        pending = deque()
+        times = iter(enumerate(self.times()))
+
+        def submit_next():
+            frame = next(times, None)
+            if frame is None:
+                return
+            i, t = frame
+            kwargs = render_kwargs
+            if outfile is not None:
+                kwargs = dict(render_kwargs, outfile=outfile % i)
+            pending.append((i, pool.submit(_render_frame, self.scene_fn, t,
+                                           kwargs)))
+
+        try:
+            for _ in range(max_pending):
+                submit_next()
+            while pending:
+                i, future = pending.popleft()
+                result = future.result()
+                yield result if outfile is None else outfile % i
+                # The consumer is done with this frame.
+                submit_next()
+        finally:
+            if pool is not executor:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def __iter__(self):
+        return self.iter_frames()
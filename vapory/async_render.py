@@ -0,0 +1,191 @@
+"""
+Rendering with POV-Ray from asyncio code, without blocking the event loop,
+with live progress reports parsed from POV-Ray's output.
+
+>>> image = await scene.render_async(width=300, height=200,
+...                                  progress=lambda p: print(p.percent))
+
+>>> async for p in iter_render_async(scene.iter_chunks(), width=300,
+...                                  height=200):
+...     if p.result is not None:
+...         image = p.result
+"""
+
+import os
+import re
+import shutil
+import asyncio
+from collections import namedtuple
+from tempfile import mkdtemp
+from .io import (povray_command, image_to_numpy_region, limit_memory,
+                 write_scene, numpy_output_format)
+from .stats import RenderStats
+from .metrics import REGISTRY, timed, record_render_stats
+
+RENDERED_RE = re.compile(r"Rendered (\d+) of (\d+) pixels \((\d+)%\)")
+PHASE_RE = re.compile(r"(Parsing|Creating bounding slabs|Photon|Radiosity|"
+                      r"Rendering|Render Statistics)")
+
+_RenderProgress = namedtuple("RenderProgress",
+                             "phase line percent pixels pixels_total result")
+
+
+class RenderProgress(_RenderProgress):
+    """ A progress report of POV-Ray.
+
+    Attributes: ``phase`` ('parsing', 'rendering', 'done'...), ``line`` (the
+    raw POV-Ray line), ``percent``, ``pixels`` and ``pixels_total`` (None
+    outside of the rendering phase) and ``result`` (the result of the
+    render, only in the final 'done' report).
+    """
+    __slots__ = ()
+
+
+def parse_progress_line(line, phase=None):
+    """ Returns a RenderProgress for a line of POV-Ray's output. """
+    match = RENDERED_RE.search(line)
+    if match:
+        pixels, total, percent = [int(e) for e in match.groups()]
+        return RenderProgress('rendering', line, percent, pixels, total, None)
+    match = PHASE_RE.search(line)
+    if match:
+        phase = match.group(1).lower().replace(' ', '_')
+    return RenderProgress(phase, line, None, None, None, None)
+
+
+async def _read_lines(stream, callback):
+    """ Calls callback on each line of the stream. POV-Ray updates its
+    progress lines with carriage returns, which are also line ends here. """
+    lines = []
+    buffer = b""
+    while True:
+        data = await stream.read(4096)
+        if not data:
+            break
+        buffer += data
+        parts = re.split(b"[\r\n]", buffer)
+        buffer = parts.pop()
+        for part in parts:
+            line = part.decode('ascii', 'replace').strip()
+            if line:
+                lines.append(line)
+                await callback(line)
+    if buffer.strip():
+        line = buffer.decode('ascii', 'replace').strip()
+        lines.append(line)
+        await callback(line)
+    return lines
+
+
+async def _call(progress, report):
+    if progress is None:
+        return
+    result = progress(report)
+    if asyncio.iscoroutine(result):
+        await result
+
+
+async def render_povstring_async(string, outfile=None, height=None,
+                                 width=None, quality=None, antialiasing=None,
+                                 remove_temp=True, includedirs=None,
+                                 output_alpha=False, threads=None,
+                                 region=None, progress=None, timeout=None,
+                                 max_memory=None, return_stats=False,
+                                 channels=None, dtype='uint8'):
+    """ Renders the provided scene description with POV-Ray, in an asyncio
+    subprocess.
+
+    The parameters are those of render_povstring (outfile can be None for a
+    numpy array or a PNG file name). Cancelling the task, or reaching the
+    timeout (a TimeoutError is then raised), kills POV-Ray and removes the
+    temporary files.
+
+    progress
+      Function (or coroutine function) called with a RenderProgress for
+      each line POV-Ray writes to its standard error.
+
+    return_stats
+      If True, returns ``(result, stats)`` with stats a RenderStats.
+    """
+
+    loop = asyncio.get_event_loop()
+    scratch_dir = mkdtemp(prefix='vapory_')
+    pov_file = os.path.join(scratch_dir, '__temp__.pov')
+    chunks = [string] if isinstance(string, str) else string
+    numpy_format, output_alpha = numpy_output_format(channels, dtype,
+                                                     output_alpha, outfile)
+    file_type, bits_per_color = numpy_format or (None, None)
+
+    process = None
+    try:
+        # Serializing a big scene takes time, it is done in a thread.
+        await loop.run_in_executor(None, write_scene, chunks, pov_file)
+        cmd = povray_command(pov_file, outfile, height, width, quality,
+                             antialiasing, False, includedirs, output_alpha,
+                             threads, region, file_type, bits_per_color)
+        REGISTRY.inc('vapory_renders_total')
+        with timed('spawn'):
+            process = await asyncio.create_subprocess_exec(
+                *limit_memory(cmd, max_memory),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+
+        state = {'phase': None}
+
+        async def on_line(line):
+            report = parse_progress_line(line, state['phase'])
+            state['phase'] = report.phase
+            await _call(progress, report)
+
+        try:
+            with timed('povray'):
+                out, err_lines = await asyncio.wait_for(asyncio.gather(
+                    process.stdout.read(),
+                    _read_lines(process.stderr, on_line)), timeout)
+                await process.wait()
+        except asyncio.TimeoutError:
+            REGISTRY.inc('vapory_render_timeouts_total')
+            raise TimeoutError("POVRay rendering was stopped after %s "
+                               "seconds." % timeout)
+        if process.returncode:
+            REGISTRY.inc('vapory_render_failures_total')
+            raise IOError("POVRay rendering failed with the following "
+                          "error: " + "\n".join(err_lines))
+        stats = RenderStats.from_output("\n".join(err_lines))
+        record_render_stats(stats)
+        result = None
+        if outfile is None:
+            result = image_to_numpy_region(out, region, file_type=file_type)
+        if return_stats:
+            return result, stats
+        return result
+    finally:
+        if (process is not None) and (process.returncode is None):
+            # The task was cancelled (or failed) while POV-Ray was running.
+            process.kill()
+            await asyncio.shield(process.wait())
+        if remove_temp:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+async def iter_render_async(string, **render_kwargs):
+    """ Renders the scene like render_povstring_async, as an async iterator
+    of RenderProgress reports. The last report has phase 'done' and holds
+    the result of the render. """
+
+    queue = asyncio.Queue()
+    task = asyncio.ensure_future(render_povstring_async(
+        string, progress=queue.put, **render_kwargs))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            report = await queue.get()
+            if report is None:
+                break
+            yield report
+        result = task.result()
+        yield RenderProgress('done', '', 100, None, None, result)
+    finally:
+        if not task.done():
+            task.cancel()
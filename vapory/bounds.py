@@ -0,0 +1,674 @@
+"""
+Bounding boxes of elements computed from their arguments, and a pass which
+adds tight ``bounded_by`` boxes where POV-Ray's automatic bounding is loose
+(and shrinks the ``contained_by`` boxes of isosurfaces to their visible
+part).
+
+POV-Ray bounds a transformed or CSG object with the box of the transformed
+boxes of its parts, which gets loose with rotations and nested CSG. Here
+the transforms are applied to the primitives themselves (a rotated sphere
+stays bounded by a box of its size).
+
+>>> bounding_box(Sphere([0, 0, 0], 1, 'scale', [2, 1, 1]))
+((-2.0, -1.0, -1.0), (2.0, 1.0, 1.0))
+>>> scene = add_bounds(scene)
+
+The boxes are ``(lower_corner, upper_corner)`` tuples, or None for
+unbounded elements (planes...) and elements whose extent is unknown
+(text, raw POV-Ray code, transforms written as strings...).
+"""
+
+import re
+from math import sin, cos, radians, sqrt
+from .vapory import Scene, POVRayElement, Box, BoundedBy, ContainedBy
+from .memo import args_version, args_snapshot
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
+
+IDENTITY = (((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+            (0.0, 0.0, 0.0))
+
+TRANSFORMS = ['translate', 'scale', 'rotate', 'matrix']
+
+# Elements which may get a bounded_by from add_bounds.
+BOUNDED_CLASSES = ['Union', 'Merge', 'Intersection', 'Difference', 'Blob',
+                   'Isosurface', 'Parametric', 'Object']
+
+
+class UnknownBounds(Exception):
+    """ Raised when the extent of an element can't be computed. """
+
+
+def bounding_box(element):
+    """ Returns the bounding box ``(lower_corner, upper_corner)`` of an
+    element in the coordinates of its parent, or None if it is unbounded
+    or unknown.
+
+    The box is memoized on the element until its args (or the vectors and
+    arrays in its args) are modified. The args of its children are not
+    watched: replace a child rather than modifying it in place. """
+    if not isinstance(element, POVRayElement):
+        return None
+    version = (args_version(element), args_snapshot(element))
+    memo = element._box
+    if (memo is not None) and (memo[0] == version):
+        return memo[1]
+    try:
+        box = _bounds(element, IDENTITY, True)
+    except UnknownBounds:
+        box = None
+    element._box = (version, box)
+    return box
+
+
+def add_bounds(obj, min_ratio=1.5):
+    """ Returns a copy of a scene (or of an element) where the CSG objects,
+    blobs and isosurfaces get a ``BoundedBy(Box(...))`` when their tight
+    bounding box is clearly smaller than the box POV-Ray would compute.
+
+    The isosurfaces (and the parametric objects contained by a box) which
+    are clipped by a box, or intersected with other objects, get a
+    ``ContainedBy(Box(...))`` reduced to the part of their container inside
+    this box or these objects, when it is clearly smaller: POV-Ray only
+    evaluates their function inside the container, and nothing outside of
+    the clip or of the intersection is visible anyway. Only containers
+    given as boxes without modifiers (or the default container of
+    isosurfaces) are reduced.
+
+    Parameters
+    ------------
+
+    obj
+      A Scene or an element. Elements already bounded or clipped are left
+      as they are (but their children may get bounds).
+
+    min_ratio
+      Minimal ratio of the surface areas of POV-Ray's box and of the tight
+      box for a bound to be added (the probability that a ray hits a box
+      is proportional to its area).
+    """
+    if isinstance(obj, Scene):
+        new = obj._evolve()
+        new.objects = [add_bounds(e, min_ratio) for e in obj.objects]
+        return new
+    if not (isinstance(obj, POVRayElement) and _is_a(obj, BOUNDED_CLASSES)):
+        return obj
+    args = obj._args
+    children = _shape_children(obj)
+    new_children = [add_bounds(e, min_ratio) for e in children]
+    if _is_a(obj, ['Intersection']):
+        new_children = _contain_in_siblings(new_children, min_ratio)
+    if any(a is not b for (a, b) in zip(children, new_children)):
+        obj = obj._evolve(tuple(new_children) + tuple(args[len(children):]))
+    obj = _contain(obj, _clip_limit(obj), min_ratio)
+    args = obj._args
+    if any(isinstance(e, POVRayElement) and _is_a(e, ['BoundedBy',
+                                                       'ClippedBy'])
+           for e in args):
+        return obj
+    try:
+        tight = _bounds(obj, IDENTITY, True)
+        if tight is None:
+            return obj
+        loose = _bounds(obj, IDENTITY, False)
+    except UnknownBounds:
+        return obj
+    if (loose is None) or (_area(loose) >= min_ratio * _area(tight)):
+        lo, hi = _pad(tight)
+        obj = obj.add_args([BoundedBy(Box(list(lo), list(hi)))])
+    return obj
+
+
+def _pad(box):
+    """ The box, padded so that rounding errors don't clip the surfaces. """
+    pad = 1e-6 * (1 + max(abs(x) for x in box[0] + box[1]))
+    return (tuple(x - pad for x in box[0]), tuple(x + pad for x in box[1]))
+
+
+def _clip_limit(obj):
+    """ Box (in the coordinates of the object) outside of which a clipped
+    object is invisible, or None. Only the clips written before the
+    transforms of the object are used. """
+    try:
+        own, clips = _modifiers(obj._args)
+        return _intersection([
+            _union([_child_bounds(e, IDENTITY, True)
+                    for e in clip._args if _is_shape(e)])
+            for (clip, after) in clips
+            if (after is own) and _is_a(clip, ['ClippedBy'])])
+    except UnknownBounds:
+        return None
+
+
+def _contain_in_siblings(children, min_ratio):
+    """ Shrinks the containers of the untransformed isosurfaces of an
+    intersection to the other children. """
+    if not any(_is_a(e, ['Isosurface', 'Parametric']) for e in children):
+        return children
+    boxes = []
+    for e in children:
+        try:
+            boxes.append(_child_bounds(e, IDENTITY, True))
+        except UnknownBounds:
+            boxes.append(None)
+    new_children = []
+    for i, e in enumerate(children):
+        try:
+            untransformed = _modifiers(e._args)[0] is IDENTITY
+        except UnknownBounds:
+            untransformed = False
+        if untransformed:
+            e = _contain(e, _intersection(boxes[:i] + boxes[i + 1:]),
+                         min_ratio)
+        new_children.append(e)
+    return new_children
+
+
+def _contain(obj, limit, min_ratio):
+    """ Returns the isosurface or parametric object with its container
+    reduced to the limit box (see add_bounds), or the object itself. """
+    if (limit is None) or not _is_a(obj, ['Isosurface', 'Parametric']):
+        return obj
+    args = list(obj._args)
+    if any(isinstance(e, str) and e.strip() == 'open' for e in args):
+        return obj # the sides of the container are not part of the object
+    index = None
+    for i, e in enumerate(args):
+        if isinstance(e, POVRayElement) and _is_a(e, ['ContainedBy']):
+            index = i
+    try:
+        if index is not None:
+            shapes = args[index]._args
+            if not ((len(shapes) == 1) and _is_a(shapes[0], ['Box']) and
+                    (len(shapes[0]._args) == 2)):
+                return obj # the box of a sphere contains more than it
+            corners = [_vector(c) for c in shapes[0]._args]
+            container = (tuple(map(min, *corners)), tuple(map(max, *corners)))
+        else:
+            # The default container, after the function of an isosurface.
+            function = args[0] if args else None
+            if not (_is_a(obj, ['Isosurface']) and isinstance(function, str)
+                    and function.strip().startswith('function') and
+                    function.count('{') == function.count('}') > 0):
+                return obj
+            container = ((-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+    except UnknownBounds:
+        return obj
+    box = _intersection([container, _pad(limit)])
+    if any(h <= l for (l, h) in zip(*box)) or (
+            _area(container) < min_ratio * _area(box)):
+        return obj
+    contained_by = ContainedBy(Box(list(box[0]), list(box[1])))
+    if index is None:
+        args.insert(1, contained_by)
+    else:
+        args[index] = contained_by
+    return obj._evolve(tuple(args))
+
+
+# =============================================================================
+# Transforms: pairs (A, t) for p => A.p + t
+
+
+def _compose(outer, inner):
+    """ Returns the transform applying inner, then outer. """
+    if inner is IDENTITY:
+        return outer
+    if outer is IDENTITY:
+        return inner
+    (A, a), (B, b) = outer, inner
+    C = tuple(tuple(sum(A[i][k] * B[k][j] for k in range(3))
+                    for j in range(3)) for i in range(3))
+    c = tuple(sum(A[i][k] * b[k] for k in range(3)) + a[i] for i in range(3))
+    return (C, c)
+
+
+def _vector(value, size=3):
+    """ Returns a number or a vector as a tuple of floats. """
+    if isinstance(value, str):
+        raise UnknownBounds("Vector given as POV-Ray code: %s" % value)
+    if isinstance(value, (int, float)):
+        return (float(value),) * size
+    try:
+        value = tuple(float(e) for e in value)
+    except (TypeError, ValueError):
+        raise UnknownBounds("Not a vector: %s" % (value,))
+    if len(value) != size:
+        raise UnknownBounds("Vector of size %d expected: %s" % (size, value))
+    return value
+
+
+def _transform(keyword, value):
+    if keyword == 'translate':
+        return (IDENTITY[0], _vector(value))
+    if keyword == 'scale':
+        x, y, z = _vector(value)
+        return (((x, 0, 0), (0, y, 0), (0, 0, z)), (0, 0, 0))
+    if keyword == 'rotate':
+        # Around x, then y, then z, in degrees.
+        result = IDENTITY
+        for axis, angle in enumerate(_vector(value)):
+            c, s = cos(radians(angle)), sin(radians(angle))
+            i, j = [(1, 2), (2, 0), (0, 1)][axis]
+            A = [[1.0 if k == l else 0.0 for l in range(3)] for k in range(3)]
+            A[i][i], A[i][j], A[j][i], A[j][j] = c, -s, s, c
+            result = _compose((A, (0, 0, 0)), result)
+        return result
+    # matrix: POV-Ray's rows, for row vectors.
+    m = _vector(value, 12)
+    return (tuple(tuple(m[3 * j + i] for j in range(3)) for i in range(3)),
+            m[9:12])
+
+
+def _modifiers(args):
+    """ Returns the transform of the element (the composition of its
+    transforms) and its clipping objects, each with the transform of the
+    modifiers following it. """
+    transforms, clips = [], []
+    args = list(args)
+    i = 0
+    while i < len(args):
+        e = args[i]
+        if isinstance(e, str):
+            keyword = e.strip()
+            if keyword in TRANSFORMS:
+                if i + 1 == len(args):
+                    raise UnknownBounds("No value after %s" % keyword)
+                transforms.append(_transform(keyword, args[i + 1]))
+                i += 2
+                continue
+            if set(re.findall(r"\w+", keyword)) & set(TRANSFORMS +
+                                                      ['transform']):
+                raise UnknownBounds("Transform given as POV-Ray code: %s" % e)
+        elif isinstance(e, POVRayElement) and _is_a(e, ['ClippedBy',
+                                                        'BoundedBy']):
+            clips.append((e, len(transforms)))
+        elif (isinstance(e, POVRayElement) and
+              e.pov_keyword in ['transform', 'matrix']):
+            raise UnknownBounds("Transform element: %s" % e.pov_keyword)
+        i += 1
+    suffixes = [IDENTITY] * (len(transforms) + 1)
+    for k in range(len(transforms) - 1, -1, -1):
+        suffixes[k] = _compose(suffixes[k + 1], transforms[k])
+    return suffixes[0], [(clip, suffixes[k]) for (clip, k) in clips]
+
+
+# =============================================================================
+# Boxes
+
+
+def _union(boxes):
+    """ Bounding box of boxes, None if one of them is None. """
+    boxes = list(boxes)
+    if (not boxes) or any(b is None for b in boxes):
+        return None
+    return (tuple(min(b[0][i] for b in boxes) for i in range(3)),
+            tuple(max(b[1][i] for b in boxes) for i in range(3)))
+
+
+def _intersection(boxes):
+    """ Intersection of boxes, ignoring the unbounded (None) ones. """
+    boxes = [b for b in boxes if b is not None]
+    if not boxes:
+        return None
+    lo = tuple(max(b[0][i] for b in boxes) for i in range(3))
+    hi = tuple(min(b[1][i] for b in boxes) for i in range(3))
+    # An empty intersection is kept as a flat box.
+    return (lo, tuple(max(l, h) for (l, h) in zip(lo, hi)))
+
+
+def _area(box):
+    dx, dy, dz = [h - l for (l, h) in zip(*box)]
+    return dx * dy + dy * dz + dz * dx
+
+
+def _apply(T, point):
+    A, t = T
+    if A is IDENTITY[0]:
+        return tuple(x + y for (x, y) in zip(point, t))
+    return tuple(sum(A[i][k] * point[k] for k in range(3)) + t[i]
+                 for i in range(3))
+
+
+def _points_box(points, T):
+    """ Box of transformed points (vectors or an (N, 3) numpy array). """
+    if hasattr(points, 'shape'):
+        A, t = T
+        points = numpy.dot(numpy.asarray(points, dtype=float),
+                           numpy.array(A).T) + t
+        return (tuple(points.min(axis=0).tolist()),
+                tuple(points.max(axis=0).tolist()))
+    return _union([(p, p) for p in [_apply(T, _vector(p)) for p in points]])
+
+
+def _round_box(center, radius, T, normal=None):
+    """ Box of a transformed sphere, or of a transformed disc if a normal
+    is given. """
+    A, t = T
+    center = _apply(T, _vector(center))
+    radius = float(radius)
+    if normal is not None:
+        normal = _vector(normal)
+        norm = sqrt(sum(x * x for x in normal))
+        normal = tuple(x / norm for x in normal)
+    if (normal is None) and (A is IDENTITY[0]):
+        radius = abs(radius)
+        return (tuple(c - radius for c in center),
+                tuple(c + radius for c in center))
+    extents = []
+    for row in A:
+        squared = sum(x * x for x in row)
+        if normal is not None:
+            squared -= sum(x * n for (x, n) in zip(row, normal)) ** 2
+        extents.append(abs(radius) * sqrt(max(0.0, squared)))
+    return (tuple(c - e for (c, e) in zip(center, extents)),
+            tuple(c + e for (c, e) in zip(center, extents)))
+
+
+def _corners_box(lo, hi, T):
+    lo, hi = _vector(lo), _vector(hi)
+    return _points_box([(x, y, z) for x in (lo[0], hi[0])
+                        for y in (lo[1], hi[1]) for z in (lo[2], hi[2])], T)
+
+
+# =============================================================================
+# Elements
+
+
+def _is_a(element, names):
+    return any(cls.__name__ in names for cls in type(element).__mro__)
+
+
+def _is_shape(e):
+    return (isinstance(e, POVRayElement) and
+            getattr(e, 'declare_keyword', None) == 'object')
+
+
+def _shape_children(element):
+    """ The objects at the start of the args of a CSG object. """
+    children = []
+    for e in element._args:
+        if not _is_shape(e):
+            break
+        children.append(e)
+    return children
+
+
+def _bounds(element, T, tight):
+    """ Box of the element transformed by T. With tight=False, computes the
+    box like POV-Ray: the transformed box of the element's own box. """
+    if not isinstance(element, POVRayElement):
+        raise UnknownBounds("Not an element: %s" % (element,))
+    for cls in type(element).__mro__:
+        handler = _HANDLERS.get(cls.__name__)
+        if handler is not None:
+            break
+    else:
+        raise UnknownBounds("Unknown element: %s" % type(element).__name__)
+    args = element._args
+    own, clips = _modifiers(args)
+    if tight:
+        box = handler(element, args, _compose(T, own), tight)
+    else:
+        box = handler(element, args, IDENTITY, tight)
+        if box is not None:
+            box = _corners_box(box[0], box[1], _compose(T, own))
+    for clip, after in clips:
+        shapes = [e for e in clip._args if _is_shape(e)]
+        if shapes:
+            # An inverse clip keeps the outside of its shape: no bound.
+            box = _intersection([box, _union(
+                [_child_bounds(e, _compose(T, after), tight)
+                 for e in shapes])])
+    return box
+
+
+def _unbounded(element, args, T, tight):
+    return None
+
+
+def _sphere(element, args, T, tight):
+    return _round_box(args[0], args[1], T)
+
+
+def _box(element, args, T, tight):
+    return _corners_box(args[0], args[1], T)
+
+
+def _unit_box(element, args, T, tight):
+    return _corners_box((-1, -1, -1), (1, 1, 1), T)
+
+
+def _height_field(element, args, T, tight):
+    return _corners_box((0, 0, 0), (1, 1, 1), T)
+
+
+def _cone(element, args, T, tight):
+    base, base_radius, cap, cap_radius = args[:4]
+    normal = [c - b for (b, c) in zip(_vector(base), _vector(cap))]
+    return _union([_round_box(base, base_radius, T, normal),
+                   _round_box(cap, cap_radius, T, normal)])
+
+
+def _cylinder(element, args, T, tight):
+    return _cone(element, [args[0], args[2], args[1], args[2]], T, tight)
+
+
+def _disc(element, args, T, tight):
+    return _round_box(args[0], args[2], T, args[1])
+
+
+def _torus(element, args, T, tight):
+    major, minor = float(args[0]), float(args[1])
+    (lo, hi) = _round_box((0, 0, 0), major, T, (0, 1, 0))
+    (_, extents) = _round_box((0, 0, 0), minor, (T[0], (0, 0, 0)))
+    return (tuple(l - e for (l, e) in zip(lo, extents)),
+            tuple(h + e for (h, e) in zip(hi, extents)))
+
+
+def _triangle(element, args, T, tight):
+    return _points_box(args[:3], T)
+
+
+def _smooth_triangle(element, args, T, tight):
+    return _points_box(args[0:6:2], T)
+
+
+def _polygon(element, args, T, tight):
+    n = int(args[0])
+    return _points_box([_planar(p) for p in args[1:n + 1]], T)
+
+
+def _planar(point):
+    """ 2D points of polygons are in the xy plane. """
+    point = tuple(point)
+    return point if len(point) == 3 else (point[0], point[1], 0)
+
+
+def _spline_points(args, allowed):
+    """ Splits the leading keywords from the rest of the args, raises
+    UnknownBounds for splines which may go out of their points' hull. """
+    keywords = []
+    for e in args:
+        if not isinstance(e, str):
+            break
+        keywords.append(e.strip())
+    for keyword in keywords:
+        if keyword.endswith('_spline') and keyword not in allowed:
+            raise UnknownBounds("The %s may overshoot its points" % keyword)
+    return keywords, args[len(keywords):]
+
+
+def _prism(element, args, T, tight):
+    keywords, args = _spline_points(args, ['linear_spline', 'bezier_spline'])
+    heights = (float(args[0]), float(args[1]))
+    n = int(args[2])
+    points = [_vector(p, 2) for p in args[3:3 + n]]
+    if 'conic_sweep' in keywords:
+        return _points_box([(x * h, h, z * h) for (x, z) in points
+                            for h in heights], T)
+    return _points_box([(x, h, z) for (x, z) in points for h in heights], T)
+
+
+def _lathe(element, args, T, tight):
+    keywords, args = _spline_points(args, ['linear_spline', 'bezier_spline'])
+    n = int(args[0])
+    return _union([_round_box((0, y, 0), abs(x), T, (0, 1, 0))
+                   for (x, y) in [_vector(p, 2) for p in args[1:n + 1]]])
+
+
+def _sphere_sweep(element, args, T, tight):
+    # b-splines stay in the hull of their control spheres.
+    keywords, args = _spline_points(args, ['linear_spline', 'b_spline'])
+    n = int(args[0])
+    return _union([_round_box(args[1 + 2 * i], args[2 + 2 * i], T)
+                   for i in range(n)])
+
+
+def _mesh2(element, args, T, tight):
+    for e in args:
+        if isinstance(e, POVRayElement) and _is_a(e, ['VertexVectors']):
+            vectors = e._args[1:]
+            if (len(vectors) == 1) and hasattr(vectors[0], 'array'):
+                vectors = vectors[0].array  # a VectorArray
+            return _points_box(vectors, T)
+    raise UnknownBounds("Mesh2 without vertex_vectors")
+
+
+def _container(element, args, T, tight):
+    """ Isosurfaces and parametric objects are inside their container. """
+    for e in args:
+        if isinstance(e, POVRayElement) and _is_a(e, ['ContainedBy']):
+            return _union([_bounds(c, T, tight) for c in e._args
+                           if _is_shape(c)])
+    return _unit_box(element, args, T, tight)
+
+
+def _blob(element, args, T, tight):
+    boxes = []
+    args = list(args)
+    for i, e in enumerate(args):
+        if _is_shape(e):
+            # Sphere(center, radius, strength), Cylinder(end1, end2, radius,
+            # strength), with an optional 'strength' keyword.
+            strength = list(e._args[3 if _is_a(e, ['Cylinder']) else 2:])
+            if strength and (strength[0] == 'strength'):
+                strength = strength[1:]
+            if (strength and isinstance(strength[0], (int, float)) and
+                    strength[0] < 0):
+                continue # negative components only remove matter
+            boxes.append(_bounds(e, T, tight))
+        elif (isinstance(e, str) and e.strip() == 'component'):
+            strength, radius, center = args[i + 1:i + 4]
+            if float(strength) >= 0:
+                boxes.append(_round_box(center, radius, T))
+    return _union(boxes)
+
+
+def _object(element, args, T, tight):
+    return _bounds(args[0], T, tight)
+
+
+def _union_csg(element, args, T, tight):
+    children = _shape_children(element)
+    if any(_is_a(e, ['LightSource']) for e in children):
+        raise UnknownBounds("CSG with light sources")
+    return _union([_child_bounds(e, T, tight) for e in children])
+
+
+def _intersection_csg(element, args, T, tight):
+    return _intersection([_child_bounds(e, T, tight)
+                          for e in _shape_children(element)])
+
+
+def _difference_csg(element, args, T, tight):
+    children = _shape_children(element)
+    if not children:
+        raise UnknownBounds("Empty difference")
+    return _child_bounds(children[0], T, tight)
+
+
+def _child_bounds(e, T, tight):
+    if any(isinstance(a, str) and a.strip() == 'inverse' for a in e._args):
+        return None # the outside of the child
+    return _bounds(e, T, tight)
+
+
+def _sphere_array(element, args, T, tight):
+    rows = args[0].array
+    A, t = T
+    centers = numpy.dot(rows[:, :3], numpy.array(A).T) + t
+    norms = numpy.sqrt((numpy.array(A) ** 2).sum(axis=1))
+    extents = numpy.abs(rows[:, 3:4]) * norms
+    return (tuple((centers - extents).min(axis=0).tolist()),
+            tuple((centers + extents).max(axis=0).tolist()))
+
+
+def _instance_array(element, args, T, tight):
+    """ The corners of the prototype's box placed like each copy (exact
+    for copies which aren't rotated). """
+    prototype, placements = args[1], args[2]
+    box = _bounds(prototype, IDENTITY, tight)
+    if box is None:
+        return None
+    rows, row_format = placements.array, placements.row_format
+    points = numpy.array([[(x, y, z) for x in (box[0][0], box[1][0])
+                           for y in (box[0][1], box[1][1])
+                           for z in (box[0][2], box[1][2])]] * len(rows))
+    column = 0
+    if "scale <" in row_format:
+        points *= rows[:, None, 0:3]
+        column += 3
+    if "rotate <" in row_format:
+        # Around x, then y, then z, in degrees.
+        angles = numpy.radians(rows[:, column:column + 3])
+        for axis in range(3):
+            c = numpy.cos(angles[:, axis:axis + 1])
+            s = numpy.sin(angles[:, axis:axis + 1])
+            i, j = [(1, 2), (2, 0), (0, 1)][axis]
+            pi, pj = points[:, :, i].copy(), points[:, :, j].copy()
+            points[:, :, i] = c * pi - s * pj
+            points[:, :, j] = s * pi + c * pj
+        column += 3
+    points += rows[:, None, column:column + 3]
+    return _points_box(points.reshape((-1, 3)), T)
+
+
+_HANDLERS = {
+    'Sphere': _sphere,
+    'Box': _box,
+    'Cone': _cone,
+    'Cylinder': _cylinder,
+    'Disc': _disc,
+    'Torus': _torus,
+    'Triangle': _triangle,
+    'SmoothTriangle': _smooth_triangle,
+    'Polygon': _polygon,
+    'Superellipsoid': _unit_box,
+    'HeightField': _height_field,
+    'Prism': _prism,
+    'Lathe': _lathe,
+    'SphereSweep': _sphere_sweep,
+    'Mesh': _union_csg,
+    'Mesh2': _mesh2,
+    'Isosurface': _container,
+    'Parametric': _container,
+    'Blob': _blob,
+    'Object': _object,
+    'Union': _union_csg,
+    'Merge': _union_csg,
+    'Intersection': _intersection_csg,
+    'Difference': _difference_csg,
+    'SphereArray': _sphere_array,
+    'InstanceArray': _instance_array,
+    'Plane': _unbounded,
+    'Poly': _unbounded,
+    'Cubic': _unbounded,
+    'Quartic': _unbounded,
+    'Polynomial': _unbounded,
+    'Quadric': _unbounded,
+}
@@ -0,0 +1,181 @@
+"""
+Two-tier cache of render results, so that identical renders (same scene,
+same include files, same options) don't start POV-Ray again.
+
+>>> cache = RenderCache(max_items=256, directory="render_cache")
+>>> image = scene.render(width=300, height=200, cache=cache)
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+INCLUDE_RE = re.compile(r'#include\s+"([^"]+)"')
+
+
+class SceneHasher:
+    """ Computes the hash of a scene while it is streamed to its file, and
+    collects the names of the files it #includes. """
+
+    def __init__(self):
+        self.sha1 = hashlib.sha1()
+        self.includes = []
+
+    def iter_update(self, chunks):
+        """ Yields the chunks unchanged, updating the hash on the way. """
+        for chunk in chunks:
+            self.sha1.update(chunk.encode('utf8'))
+            if '#include' in chunk:
+                self.includes.extend(INCLUDE_RE.findall(chunk))
+            yield chunk
+
+    def hexdigest(self):
+        return self.sha1.hexdigest()
+
+
+class RenderCache:
+    """ Cache of render results with an in-memory LRU tier (numpy arrays)
+    and an on-disk tier (raw PPM or PNG outputs) bounded in size.
+
+    Arrays returned by the cache are read-only, as they are shared between
+    all the calls which hit the same entry.
+
+    Parameters
+    ------------
+
+    max_items
+      Maximal number of numpy arrays kept in memory.
+
+    directory
+      Directory of the on-disk tier. If None, only the memory tier is used.
+
+    max_disk_bytes
+      Maximal total size of the on-disk tier. The least recently used
+      entries are removed when this size is exceeded.
+    """
+
+    def __init__(self, max_items=128, directory=None, max_disk_bytes=2**30):
+        self.max_items = max_items
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.arrays = OrderedDict()
+        self.lock = threading.Lock()
+        self.include_hashes = {}
+
+    def __getstate__(self):
+        # Sent to other processes without the memory tier or the lock.
+        state = self.__dict__.copy()
+        state['arrays'] = OrderedDict()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def include_digest(self, name, includedirs=None):
+        """ Returns the hash of an included file, or its name if it is not
+        found (e.g. in POV-Ray's own library path). """
+        for folder in ['.'] + list(includedirs or []):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                signature = (path, stat.st_mtime, stat.st_size)
+                digest = self.include_hashes.get(signature)
+                if digest is None:
+                    h = hashlib.sha1()
+                    with open(path, 'rb') as f:
+                        for block in iter(lambda: f.read(2**20), b''):
+                            h.update(block)
+                    digest = self.include_hashes[signature] = h.hexdigest()
+                return digest
+        return name
+
+    def key(self, hasher, includedirs=None, options=None):
+        """ Returns the key of a render: a hash of the scene code, of the
+        files it includes, and of the render options. """
+        h = hashlib.sha1(hasher.hexdigest().encode('ascii'))
+        for name in sorted(set(hasher.includes)):
+            h.update(self.include_digest(name, includedirs).encode('utf8'))
+        h.update(repr(sorted((options or {}).items())).encode('utf8'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get_array(self, key):
+        """ Returns the cached array for this key, or None. """
+        with self.lock:
+            arr = self.arrays.get(key)
+            if arr is not None:
+                self.arrays.move_to_end(key)
+                return arr
+        return None
+
+    def put_array(self, key, arr):
+        arr.flags.writeable = False
+        with self.lock:
+            self.arrays[key] = arr
+            self.arrays.move_to_end(key)
+            while len(self.arrays) > self.max_items:
+                self.arrays.popitem(last=False)
+
+    def get_bytes(self, key):
+        """ Returns the cached raw output (PPM or PNG) for this key, or
+        None. """
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        os.utime(path, None) # marks the entry as recently used
+        return data
+
+    def put_bytes(self, key, data):
+        if self.directory is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self.path(key)
+        temp_path = "%s.%d.%d.tmp" % (path, os.getpid(),
+                                      threading.current_thread().ident)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used files of the on-disk tier until
+        it fits in max_disk_bytes. """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """ Empties both tiers of the cache. """
+        with self.lock:
+            self.arrays.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
@@ -2,6 +2,13 @@ import os
 
 POVRAY_BINARY = ("povray.exe" if os.name=='nt' else "povray")
 
+# Where the include files of cacheable elements are written by default.
+INCLUDE_CACHE_DIR = "__vapory_cache__"
+
+# Where images are written by renders with transport='file' (in memory on
+# systems with a tmpfs, None for the default temporary directory).
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
 GLOBAL_SCENE_SETTINGS = {
     "charset"        : "ascii",
     "adc_bailout"    : "1/255",
@@ -0,0 +1,192 @@
+"""
+View-frustum culling: the objects of a scene which the camera can't see are
+left out of the scene code, which saves both their serialization and their
+parsing by POV-Ray.
+
+>>> scene.render('city.png', width=640, height=480, cull_margin=5)
+
+The bounding boxes of the objects are computed with vapory.bounds (and
+memoized on the objects, so that the next frames of a flythrough only test
+them). An object is dropped when its box is farther than ``margin`` outside
+of the pyramid seen by the camera. Objects out of view may still cast
+shadows into it or appear in reflections: the margin keeps those within
+this distance.
+
+Only the shapes are culled. The lights, the objects whose extent is
+unknown (raw code, Static groups, text...) and the unbounded ones (planes)
+are always kept. So is everything when the camera isn't a perspective or
+orthographic camera given by vectors (fisheye, mesh cameras...).
+"""
+
+from math import tan, radians, sqrt
+from .bounds import (bounding_box, UnknownBounds, _modifiers, _vector,
+                     _is_shape)
+
+# Camera keywords which don't change the field of view.
+CAMERA_IGNORED = ['perspective', 'aperture', 'blur_samples', 'focal_point',
+                  'confidence', 'variance', 'translate', 'rotate', 'scale',
+                  'matrix']
+
+CAMERA_VECTORS = ['location', 'look_at', 'direction', 'right', 'up', 'sky']
+
+
+def _sub(a, b):
+    return tuple(x - y for (x, y) in zip(a, b))
+
+
+def _dot(a, b):
+    return sum(x * y for (x, y) in zip(a, b))
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _scaled(a, length):
+    """ Returns the vector a with the given length. """
+    norm = sqrt(_dot(a, a))
+    if norm == 0:
+        raise UnknownBounds("Zero-length camera vector")
+    return tuple(x * length / norm for x in a)
+
+
+def _plane(normal, point, toward):
+    """ Returns the plane ``(unit_normal, offset)`` through the point, oriented
+    so that the vector ``toward`` points to its inside. """
+    normal = _scaled(normal, 1.0)
+    if _dot(normal, toward) < 0:
+        normal = tuple(-x for x in normal)
+    return (normal, _dot(normal, point))
+
+
+def camera_vectors(camera):
+    """ Returns ``(orthographic, location, direction, right, up)`` for a
+    camera, after the angle, look_at and transforms are applied like
+    POV-Ray does (in this order, whatever the order of the args).
+    Raises UnknownBounds for other cameras. """
+    args = camera._args
+    values = dict(location=(0, 0, 0), direction=(0, 0, 1),
+                  right=(1.33, 0, 0), up=(0, 1, 0), sky=(0, 1, 0))
+    orthographic = False
+    angle = None
+    i = 0
+    while i < len(args):
+        e = args[i]
+        i += 1
+        if not isinstance(e, str):
+            continue
+        keyword = e.strip()
+        if keyword in CAMERA_VECTORS:
+            if i == len(args):
+                raise UnknownBounds("No value after %s" % keyword)
+            values[keyword] = _vector(args[i])
+            i += 1
+        elif keyword == 'angle':
+            # Horizontal angle, and optionally vertical angle.
+            angle = []
+            while ((len(angle) < 2) and (i < len(args)) and
+                   isinstance(args[i], (int, float))):
+                angle.append(float(args[i]))
+                i += 1
+            if not angle:
+                raise UnknownBounds("No value after angle")
+        elif keyword == 'orthographic':
+            orthographic = True
+        elif keyword not in CAMERA_IGNORED:
+            raise UnknownBounds("Unsupported camera: %s" % e)
+    location, direction = values['location'], values['direction']
+    right, up = values['right'], values['up']
+    if angle is not None:
+        if orthographic:
+            raise UnknownBounds("Orthographic camera with an angle")
+        length = 0.5 * sqrt(_dot(right, right)) / tan(radians(angle[0] / 2))
+        direction = _scaled(direction, length)
+        if len(angle) == 2:
+            up = _scaled(up, 2 * length * tan(radians(angle[1] / 2)))
+    if 'look_at' in values:
+        forward = _sub(values['look_at'], location)
+        new_right = _cross(values['sky'], forward)
+        new_up = _cross(forward, new_right)
+        direction = _scaled(forward, sqrt(_dot(direction, direction)))
+        right = _scaled(new_right, sqrt(_dot(right, right)))
+        up = _scaled(new_up, sqrt(_dot(up, up)))
+    A, t = _modifiers(args)[0]
+    location = tuple(_dot(row, location) + x for (row, x) in zip(A, t))
+    direction, right, up = [tuple(_dot(row, v) for row in A)
+                            for v in (direction, right, up)]
+    return orthographic, location, direction, right, up
+
+
+def view_frustum(camera):
+    """ Returns the planes ``(unit_normal, offset)`` bounding the space seen
+    by a camera: the visible points p verify ``dot(normal, p) >= offset``
+    for every plane. Returns None if the camera isn't supported. """
+    try:
+        orthographic, location, direction, right, up = camera_vectors(camera)
+        if orthographic:
+            # Parallel rays starting from the rectangle at the location.
+            planes = [_plane(_cross(right, up), location, direction)]
+            for side, other in [(right, up), (up, right)]:
+                normal = _cross(other, direction)
+                for sign in [1, -1]:
+                    edge = tuple(l + sign * 0.5 * x
+                                 for (l, x) in zip(location, side))
+                    planes.append(_plane(normal, edge,
+                                         tuple(-sign * x for x in side)))
+            return planes
+        # Rays from the location through the corners of the image.
+        corners = [tuple(d + sr * 0.5 * r + su * 0.5 * u
+                         for (d, r, u) in zip(direction, right, up))
+                   for (sr, su) in [(1, 1), (-1, 1), (-1, -1), (1, -1)]]
+        return [_plane(_cross(corners[k - 1], corners[k]), location,
+                       direction) for k in range(4)]
+    except UnknownBounds:
+        return None
+
+
+def is_visible(box, planes, margin=0):
+    """ Returns False if the box is farther than the margin outside of the
+    planes of a view frustum (it may still be invisible otherwise). """
+    lo, hi = box
+    for (nx, ny, nz), offset in planes:
+        # The corner of the box farthest along the normal.
+        farthest = ((nx * (hi[0] if nx > 0 else lo[0])) +
+                    (ny * (hi[1] if ny > 0 else lo[1])) +
+                    (nz * (hi[2] if nz > 0 else lo[2])))
+        if farthest < offset - margin:
+            return False
+    return True
+
+
+def cull_objects(scene, margin=0):
+    """ Returns a copy of the scene without the objects which its camera
+    can't see (see this module's documentation), or the scene itself if
+    no object is culled.
+
+    Parameters
+    ------------
+
+    scene
+      A Scene. Its camera should have the final image ratio (see
+      Scene.with_camera_ratio), Scene.render does it before culling.
+
+    margin
+      Distance (in scene units) outside of the field of view within which
+      the objects are kept, e.g. for their shadows and reflections.
+    """
+    planes = view_frustum(scene.camera)
+    if planes is None:
+        return scene
+    visible = []
+    for e in scene.objects:
+        if _is_shape(e):
+            box = bounding_box(e)
+            if (box is not None) and not is_visible(box, planes, margin):
+                continue
+        visible.append(e)
+    if len(visible) == len(scene.objects):
+        return scene
+    new = scene._evolve()
+    new.objects = visible
+    return new
@@ -0,0 +1,91 @@
+"""
+Deduplication of the repeated subtrees of a scene.
+
+Identical subtrees (same structural hash, see memo.py) which appear several
+times in a scene and are big enough are written once as
+``#declare VAPORY_DECL_<hash> = ...`` at the top of the scene, and every
+occurrence is replaced by a reference to this identifier. POV-Ray then
+parses them once and shares their data.
+
+>>> scene = Scene(camera, objects, dedup_min_size=100)
+"""
+
+from .memo import get_memo
+
+# Default minimal size (in characters of code) of the deduplicated subtrees.
+DEDUP_MIN_SIZE = 100
+
+
+def identifier(digest):
+    return "VAPORY_DECL_%s" % digest[:16].upper()
+
+
+def find_duplicates(elements, context, min_size=DEDUP_MIN_SIZE):
+    """ Finds the subtrees of the elements to #declare and prepares the
+    context to refer to them. Returns the list of the subtrees, in an order
+    where each one comes after the subtrees it contains. """
+
+    counts, first, sizes, order = {}, {}, {}, []
+
+    def visit(element, memo):
+        digest = memo.digest
+        if digest in counts:
+            counts[digest] += 1
+            return digest
+        counts[digest] = 1
+        first[digest] = element
+        size = memo.size
+        children = []
+        # The code of a cacheable element is in its include file.
+        if not element.cache_include:
+            for child, child_memo in memo.children:
+                children.append(visit(child, child_memo))
+            if memo.parts is not None:
+                size += sum(sizes[part._memo.digest] for part in memo.parts
+                            if not isinstance(part, str))
+        sizes[digest] = size
+        order.append((digest, children))
+        return digest
+
+    for element in elements:
+        if hasattr(element, 'content_hash'):
+            visit(element, get_memo(element, context))
+
+    declared = []
+    for digest, children in order:
+        element = first[digest]
+        if any((child in context.declared) or (child in context.affected)
+               for child in children):
+            context.affected.add(digest)
+        if ((counts[digest] > 1) and (sizes[digest] >= min_size) and
+                element.declarable and not element.cache_include):
+            declared.append(element)
+            context.declared[digest] = identifier(digest)
+    return declared
+
+
+def iter_declare_chunks(elements, context):
+    """ Yields the #declare statements of the deduplicated subtrees. """
+    for element in elements:
+        yield "#declare %s =\n" % context.declared[element.content_hash(
+            context)]
+        for chunk in iter_expanded_chunks(element, context):
+            yield chunk
+        yield "\n"
+
+
+def iter_dedup_chunks(element, context):
+    """ Yields the code of an element in a deduplicated scene: a reference
+    if it is #declare'd, else its code with references to the #declare'd
+    subtrees it contains. """
+    digest = element.content_hash(context)
+    if digest in context.declared:
+        return iter([element.reference(context.declared[digest])])
+    return iter_expanded_chunks(element, context)
+
+
+def iter_expanded_chunks(element, context):
+    if element.content_hash(context) in context.affected:
+        # Some children are references: don't use the memoized code.
+        return element.iter_body_chunks(context)
+    return element.iter_memo_chunks(context)
@@ -0,0 +1,412 @@
+"""
+Decoding of the images written by POV-Ray into numpy arrays.
+
+POV-Ray only keeps the alpha channel and high dynamic ranges in some of its
+output formats, so each kind of numpy output comes from a different format
+(see output_format): PPM for RGB images in 8 or 16 bits, uncompressed TGA
+for 8-bit RGBA, 16-bit PNG for 16-bit RGBA and Radiance HDR for float32 RGB.
+"""
+
+import zlib
+import struct
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
+
+# (channels, dtype) => (POV-Ray's Output_File_Type, Bits_Per_Color)
+OUTPUT_FORMATS = {
+    ('rgb', 'uint8'): ('P', None),
+    ('rgb', 'uint16'): ('P', 16),
+    ('rgba', 'uint8'): ('T', None),
+    ('rgba', 'uint16'): ('N', 16),
+    ('rgb', 'float32'): ('H', None),
+}
+
+EXTENSIONS = {'P': 'ppm', 'T': 'tga', 'N': 'png', 'H': 'hdr'}
+
+
+def output_format(channels='rgb', dtype='uint8'):
+    """ Returns the POV-Ray file type and bits per color giving numpy outputs
+    with the given channels ('rgb' or 'rgba') and dtype ('uint8', 'uint16'
+    or 'float32'). 16-bit outputs are big-endian uint16 arrays. """
+    if numpy_found:
+        dtype = numpy.dtype(dtype).name
+    fmt = OUTPUT_FORMATS.get((channels, dtype))
+    if fmt is None:
+        raise ValueError("Numpy outputs with channels=%r and dtype=%r are not"
+                         " supported. Supported: %s." % (
+                             channels, dtype, ", ".join(
+                                 "%s/%s" % e for e in sorted(OUTPUT_FORMATS))))
+    return fmt
+
+
+def image_to_numpy(file_type='P', filename=None, buffer=None, memmap=True):
+    """ Decodes an image written by POV-Ray with the given Output_File_Type
+    ('P', 'T', 'N' or 'H', see output_format), from a file or a buffer. """
+    if file_type == 'P':
+        return ppm_to_numpy(filename, buffer, memmap=memmap)
+    decoders = {'T': tga_to_numpy, 'N': png_to_numpy, 'H': hdr_to_numpy}
+    if file_type not in decoders:
+        raise ValueError("Unknown image file type %r." % (file_type,))
+    return decoders[file_type](filename, buffer)
+
+
+def _read(filename, buffer):
+    if not numpy_found:
+        raise IOError("Decoding images requires numpy installed.")
+    if buffer is None:
+        with open(filename, 'rb') as f:
+            buffer = f.read()
+    return buffer
+
+
+PNM_WHITESPACE = b" \t\r\n\x0b\x0c"
+PAM_CHANNELS = {b"GRAYSCALE": 1, b"GRAYSCALE_ALPHA": 2, b"RGB": 3,
+                b"RGB_ALPHA": 4, b"BLACKANDWHITE": 1}
+
+
+def read_pnm_header(buffer):
+    """ Parses the header of a binary PGM (P5), PPM (P6) or PAM (P7) image.
+
+    Only the header bytes are read. Returns a dict with the ``width``,
+    ``height``, ``channels`` and ``maxval`` of the image and the ``offset``
+    of the pixel data, or None if the buffer ends before the header does
+    (e.g. the first bytes of a file). Raises a ValueError for other
+    formats.
+
+    Format specifications: http://netpbm.sourceforge.net/doc/pgm.html,
+    http://netpbm.sourceforge.net/doc/pam.html
+    """
+
+    magic = bytes(buffer[:2])
+    if magic == b"P7":
+        end = buffer.find(b"ENDHDR", 2)
+        if end < 0:
+            return None
+        newline = buffer.find(b"\n", end)
+        if newline < 0:
+            return None
+        fields = {}
+        for line in bytes(buffer[2:end]).splitlines():
+            line = line.split(b"#", 1)[0].split()
+            if line:
+                fields[line[0]] = line[1:]
+        try:
+            header = dict(width=int(fields[b"WIDTH"][0]),
+                          height=int(fields[b"HEIGHT"][0]),
+                          channels=int(fields[b"DEPTH"][0]),
+                          maxval=int(fields[b"MAXVAL"][0]),
+                          offset=newline + 1)
+        except (KeyError, IndexError, ValueError):
+            raise ValueError("Invalid PAM header.")
+        tupltype = b"_".join(fields.get(b"TUPLTYPE", []))
+        if PAM_CHANNELS.get(tupltype, header['channels']) != header['channels']:
+            raise ValueError("Invalid PAM header: TUPLTYPE %s with DEPTH %d"
+                             % (tupltype.decode(), header['channels']))
+        return header
+
+    if magic not in (b"P5", b"P6"):
+        raise ValueError("Not a raw PPM/PGM/PAM file (magic number %r)."
+                         % magic)
+
+    # Three numbers separated by whitespace and comments, then exactly one
+    # whitespace character before the pixel data.
+    values = []
+    i = 2
+    n = len(buffer)
+    while len(values) < 3:
+        while (i < n) and (buffer[i:i + 1] in PNM_WHITESPACE or
+                           buffer[i:i + 1] == b"#"):
+            if buffer[i:i + 1] == b"#":
+                while (i < n) and (buffer[i:i + 1] not in b"\r\n"):
+                    i += 1
+            i += 1
+        start = i
+        while (i < n) and buffer[i:i + 1].isdigit():
+            i += 1
+        if i >= n:
+            return None
+        if (i == start) or (buffer[i:i + 1] not in PNM_WHITESPACE):
+            raise ValueError("Invalid PPM/PGM header.")
+        values.append(int(bytes(buffer[start:i])))
+    width, height, maxval = values
+    return dict(width=width, height=height, maxval=maxval,
+                channels=1 if magic == b"P5" else 3, offset=i + 1)
+
+
+def ppm_to_numpy(filename=None, buffer=None, byteorder='>', memmap=True):
+    """Return image data from a raw PGM/PPM/PAM file as numpy array.
+
+    The array has shape (height, width, channels), or (height, width) for
+    grayscale images, and dtype uint8, or uint16 (with the given byteorder,
+    big-endian in the file format) when the maximal value is above 255.
+    RGBA images come from PAM files (P7) with 4 channels.
+
+    No pixel data is copied: for a buffer, the result is a read-only view of
+    the buffer; for a file, a read-only numpy.memmap of the file (unless
+    memmap is False, then the file is read in memory).
+
+    Format specification: http://netpbm.sourceforge.net/doc/pgm.html
+
+    """
+
+    if not numpy_found:
+        raise IOError("Function ppm_to_numpy requires numpy installed.")
+
+    if buffer is None:
+        with open(filename, 'rb') as f:
+            head = f.read(1024)
+            header = read_pnm_header(head)
+            while header is None:
+                more = f.read(len(head))
+                if not more:
+                    raise ValueError("Truncated PPM/PGM header: '%s'"
+                                     % filename)
+                head += more
+                header = read_pnm_header(head)
+            if not memmap:
+                f.seek(0)
+                buffer = f.read()
+    else:
+        header = read_pnm_header(buffer)
+        if header is None:
+            raise ValueError("Truncated PPM/PGM header.")
+
+    width, height, channels = (header['width'], header['height'],
+                               header['channels'])
+    dtype = numpy.dtype('uint8' if header['maxval'] < 256 else
+                        byteorder + 'u2')
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    count = width * height * channels
+
+    if buffer is None:
+        return numpy.memmap(filename, dtype=dtype, mode='r',
+                            offset=header['offset'], shape=shape)
+
+    if len(buffer) < header['offset'] + count * dtype.itemsize:
+        raise ValueError("Truncated PPM/PGM/PAM data: expected %d bytes."
+                         % (count * dtype.itemsize))
+    arr = numpy.frombuffer(buffer, dtype=dtype, count=count,
+                           offset=header['offset'])
+    arr.flags.writeable = False
+    return arr.reshape(shape)
+
+
+def tga_to_numpy(filename=None, buffer=None):
+    """ Returns the image data of a 24- or 32-bit TGA file, uncompressed
+    (which POV-Ray writes for 'T' outputs) or run-length encoded (for 'C'
+    outputs), as an RGB(A) uint8 numpy array.
+    """
+
+    buffer = _read(filename, buffer)
+    (id_length, colormap_type, image_type, width, height, bits,
+     descriptor) = struct.unpack("<BBB9xHHBB", buffer[:18])
+    if (image_type not in (2, 10)) or colormap_type or (bits not in (24, 32)):
+        raise ValueError("Only uncompressed or run-length encoded 24/32-bit "
+                         "true-color TGA files are supported.")
+    channels = bits // 8
+    count = width * height * channels
+    offset = 18 + id_length
+    if image_type == 10:
+        arr = _tga_unpack_rle(buffer, offset, width * height, channels)
+    else:
+        if len(buffer) < offset + count:
+            raise ValueError("Truncated TGA data: expected %d bytes." % count)
+        arr = numpy.frombuffer(buffer, dtype='uint8', count=count,
+                               offset=offset)
+    arr = arr.reshape((height, width, channels))
+    if not (descriptor & 0x20):
+        arr = arr[::-1] # the origin is the bottom-left corner
+    # BGR(A) to RGB(A).
+    return arr[:, :, [2, 1, 0, 3][:channels]]
+
+
+def _tga_unpack_rle(buffer, position, pixels, channels):
+    """ Decodes the run-length encoded pixel data of a TGA file: packets of
+    1 to 128 pixels, either one pixel repeated (if the high bit of the
+    packet header is set) or raw pixels. """
+    data = bytearray()
+    size = pixels * channels
+    while len(data) < size:
+        if position >= len(buffer):
+            raise ValueError("Truncated TGA data: expected %d bytes." % size)
+        header = buffer[position]
+        count = (header & 0x7f) + 1
+        if header & 0x80:
+            data += buffer[position + 1:position + 1 + channels] * count
+            position += 1 + channels
+        else:
+            data += buffer[position + 1:position + 1 + count * channels]
+            position += 1 + count * channels
+    if len(data) != size or position > len(buffer):
+        raise ValueError("Invalid TGA data: the run-length encoded packets "
+                         "don't match the image size.")
+    return numpy.frombuffer(bytes(data), dtype='uint8')
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+
+def png_to_numpy(filename=None, buffer=None):
+    """ Returns the image data of a non-interlaced 8- or 16-bit PNG file as
+    a numpy array of shape (height, width, channels), or (height, width) for
+    grayscale images. 16-bit images are big-endian uint16 arrays.
+
+    The rows are unfiltered with numpy: rows filtered with None, Sub or Up
+    one row at a time, images with Average or Paeth rows one anti-diagonal
+    at a time (the pixels of an anti-diagonal don't depend on each other),
+    which still takes about a second for a 2048x2048 16-bit RGBA image.
+    """
+
+    buffer = _read(filename, buffer)
+    if buffer[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file.")
+    idat = []
+    header = None
+    position = 8
+    while position < len(buffer):
+        length, chunk_type = struct.unpack(">I4s",
+                                           buffer[position:position + 8])
+        data = buffer[position + 8:position + 8 + length]
+        position += 12 + length
+        if chunk_type == b"IHDR":
+            header = struct.unpack(">IIBBBBB", data)
+        elif chunk_type == b"IDAT":
+            idat.append(data)
+        elif chunk_type == b"IEND":
+            break
+    if header is None:
+        raise ValueError("Invalid PNG file: no IHDR chunk.")
+    width, height, depth, color_type, _, _, interlace = header
+    if (depth not in (8, 16)) or (color_type not in PNG_CHANNELS) or interlace:
+        raise ValueError("Only non-interlaced 8/16-bit gray or RGB(A) PNG "
+                         "files are supported.")
+
+    channels = PNG_CHANNELS[color_type]
+    bpp = channels * depth // 8
+    raw = numpy.frombuffer(zlib.decompress(b"".join(idat)), dtype='uint8')
+    raw = raw[:height * (width * bpp + 1)].reshape((height, width * bpp + 1))
+    filters = raw[:, 0]
+    data = raw[:, 1:].reshape((height, width, bpp))
+    if filters.max() > 4:
+        raise ValueError("Invalid PNG file: unknown filter type.")
+
+    if (filters < 3).all():
+        image = numpy.empty((height, width, bpp), dtype='uint8')
+        previous = numpy.zeros((width, bpp), dtype='uint8')
+        for row, filter_type in enumerate(filters):
+            if filter_type == 0:
+                image[row] = data[row]
+            elif filter_type == 1:
+                numpy.cumsum(data[row], axis=0, dtype='uint8', out=image[row])
+            else:
+                numpy.add(data[row], previous, out=image[row])
+            previous = image[row]
+    else:
+        image = _png_unfilter_diagonals(data, filters)
+
+    image = image.view('>u2' if depth == 16 else 'uint8')
+    if channels == 1:
+        return image.reshape((height, width))
+    return image.reshape((height, width, channels))
+
+
+def _png_unfilter_diagonals(data, filters):
+    height, width, bpp = data.shape
+    # The anti-diagonal d of the image (the pixels (r, d - r)) is stored in
+    # the row d + 2 of this array, at the index r + 1, so that the pixels
+    # on the left, up and up-left of an anti-diagonal are contiguous slices
+    # of the two previous rows. The zeros around are the PNG convention for
+    # the pixels outside of the image.
+    skewed = numpy.zeros((height + width + 1, height + 1, bpp), dtype='uint8')
+    s0, s1, s2 = skewed.strides
+    image = numpy.lib.stride_tricks.as_strided(
+        skewed[2:, 1:], shape=(height, width, bpp), strides=(s0 + s1, s0, s2))
+    image[...] = data
+    kinds = numpy.unique(filters)
+    index = numpy.searchsorted(kinds, filters)[:, None]
+    for d in range(height + width - 1):
+        r0, r1 = max(0, d - width + 1), min(height, d + 1)
+        left = skewed[d + 1, r0 + 1:r1 + 1].astype('int16')
+        up = skewed[d + 1, r0:r1].astype('int16')
+        up_left = skewed[d, r0:r1]
+        predictors = []
+        for kind in kinds:
+            if kind == 0:
+                predictors.append(0)
+            elif kind == 1:
+                predictors.append(left)
+            elif kind == 2:
+                predictors.append(up)
+            elif kind == 3:
+                predictors.append((left + up) >> 1)
+            else:
+                da, db = left - up_left, up - up_left
+                pa, pb, pc = abs(db), abs(da), abs(da + db)
+                predictors.append(numpy.where(
+                    (pa <= pb) & (pa <= pc), left,
+                    numpy.where(pb <= pc, up, up_left)))
+        if len(kinds) == 1:
+            predictor = predictors[0]
+        else:
+            predictor = numpy.choose(index[r0:r1], predictors)
+        target = skewed[d + 2, r0 + 1:r1 + 1]
+        numpy.add(target, predictor, out=target, casting='unsafe')
+    return image.copy()
+
+
+def hdr_to_numpy(filename=None, buffer=None):
+    """ Returns the image data of a Radiance HDR (RGBE) file, flat or
+    run-length encoded, as a float32 RGB numpy array.
+
+    Run-length encoded scanlines are decoded one run at a time in Python
+    (about 1 second per million runs), the conversion to floats with numpy.
+    """
+
+    buffer = _read(filename, buffer)
+    end = buffer.find(b"\n\n")
+    if (not buffer.startswith(b"#?")) or (end < 0):
+        raise ValueError("Not a Radiance HDR file.")
+    line_end = buffer.find(b"\n", end + 2)
+    resolution = buffer[end + 2:line_end].split()
+    if (len(resolution) != 4) or (resolution[0] != b"-Y") or (
+            resolution[2] != b"+X"):
+        raise ValueError("Unsupported HDR orientation: %r" % resolution)
+    height, width = int(resolution[1]), int(resolution[3])
+
+    rgbe = numpy.empty((height, 4, width), dtype='uint8')
+    position = line_end + 1
+    for row in range(height):
+        head = buffer[position:position + 4]
+        if (8 <= width < 32768) and (head[:2] == b"\x02\x02") and (
+                (head[2] << 8) + head[3] == width):
+            # Run-length encoded scanline, one channel after the other.
+            position += 4
+            for channel in range(4):
+                target = rgbe[row, channel]
+                col = 0
+                while col < width:
+                    count = buffer[position]
+                    if count > 128:
+                        count -= 128
+                        target[col:col + count] = buffer[position + 1]
+                        position += 2
+                    else:
+                        target[col:col + count] = numpy.frombuffer(
+                            buffer, 'uint8', count, position + 1)
+                        position += 1 + count
+                    col += count
+        else:
+            pixels = numpy.frombuffer(buffer, 'uint8', 4 * width, position)
+            rgbe[row] = pixels.reshape((width, 4)).T
+            position += 4 * width
+
+    exponent = rgbe[:, 3:4].astype('int32')
+    scale = numpy.ldexp(numpy.float32(1), exponent - 136).astype('float32')
+    rgb = (rgbe[:, :3] + numpy.float32(0.5)) * scale
+    rgb[numpy.broadcast_to(exponent == 0, rgb.shape)] = 0
+    return numpy.ascontiguousarray(rgb.transpose((0, 2, 1)))
@@ -1,17 +1,105 @@
+from collections import namedtuple
+
 WIKIREF = "http://wiki.povray.org/content/Reference:"
 
-def vectorize(arr):
+_OutputFormat = namedtuple("OutputFormat", "precision minify float_format")
+
+
+class OutputFormat(_OutputFormat):
+    """ How the POV-Ray code of a scene is written.
+
+    precision
+      Number of significant digits of the floats, or None to write them
+      exactly (Python's shortest repr, e.g. 0.30000000000000004).
+
+    minify
+      If True, the code is written without cosmetic whitespace (one space
+      between the arguments of an element, no newlines inside elements).
+    """
+    __slots__ = ()
+
+    def __new__(cls, precision=None, minify=False):
+        float_format = None if precision is None else "%%.%dg" % precision
+        return _OutputFormat.__new__(cls, precision, minify, float_format)
+
+    def __getnewargs__(self):
+        return (self.precision, self.minify)
+
+
+DEFAULT_FORMAT = OutputFormat()
+
+
+def is_float_array(arr):
+    return hasattr(arr, 'dtype') and arr.dtype.kind == 'f'
+
+
+def vectorize(arr, output_format=DEFAULT_FORMAT):
     """ transforms [a, b, c] into string "<a, b, c>"" """
-    return "<%s>" % ",".join([str(e) for e in arr])
+    if output_format.float_format is None:
+        return "<%s>" % ",".join([str(e) for e in arr])
+    if is_float_array(arr):
+        # Formatted in bulk.
+        return ("<%s>" % ",".join([output_format.float_format] * len(arr))
+                % tuple(arr.tolist()))
+    return "<%s>" % ",".join([format_number(e, output_format) for e in arr])
+
+
+def vectorize_rows(arr, output_format=DEFAULT_FORMAT):
+    """ Transforms a 2D numpy array into one vector "<a,b,c>" per line, with
+    one string operation for the whole array. """
+    float_format = output_format.float_format
+    if (float_format is None) or not is_float_array(arr):
+        float_format = "%s"
+    row = "<%s>" % ",".join([float_format] * arr.shape[1])
+    return "\n".join([row] * len(arr)) % tuple(arr.ravel().tolist())
+
 
-def format_if_necessary(e):
+def format_number(e, output_format=DEFAULT_FORMAT):
+    """ Writes a number with the precision of the output format. """
+    if (output_format.float_format is not None) and isinstance(e, float):
+        return output_format.float_format % e
+    return str(e)
+
+
+def format_if_necessary(e, output_format=DEFAULT_FORMAT):
     """ If necessary, replaces -3 by (-3), and [a, b, c] by <a, b, c> """
 
     if isinstance(e, (int, float)) and e<0:
         # This format because POVray interprets -3 as a substraction
-        return "( %s )"%str(e)
+        return ("(%s)" if output_format.minify else "( %s )") % format_number(
+            e, output_format)
     if hasattr(e, '__iter__') and not isinstance(e, str):
+        if getattr(e, 'ndim', 1) == 2:
+            # (N, 3) numpy arrays become one vector per line
+            return vectorize_rows(e, output_format)
         # lists, tuples, numpy arrays, become '<a,b,c,d >'
-        return vectorize(e)
+        return vectorize(e, output_format)
+    if isinstance(e, float):
+        return format_number(e, output_format)
     else:
         return e
+
+def iter_chunks(e, context=None):
+    """ Yields the POV-Ray code of e (an element, a scene, a vector, a number
+    or a raw string) chunk by chunk. """
+    if hasattr(e, 'iter_chunks'):
+        for chunk in e.iter_chunks(context):
+            yield chunk
+    else:
+        yield str(format_if_necessary(
+            e, DEFAULT_FORMAT if context is None else context.output_format))
+
+def write_chunks(chunks, fileobj, buffer_size=2**16):
+    """ Writes an iterable of strings to a file-like object, grouping small
+    chunks into writes of about ``buffer_size`` characters. """
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            fileobj.write("".join(buf))
+            buf = []
+            size = 0
+    if buf:
+        fileobj.write("".join(buf))
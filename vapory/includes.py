@@ -0,0 +1,197 @@
+"""
+Content-addressed cache of include files for heavy subtrees of a scene.
+
+An element marked with ``element.cacheable()`` is written once to a file
+``<hash>.inc`` of the cache directory, which declares it under an
+identifier. The main scene only contains an ``#include`` and a reference to
+this identifier.
+
+The objects of a Static group (the parts of an animation which don't move)
+are written once to an include file, which each frame only ``#include``'s.
+"""
+
+import os
+import threading
+from .config import INCLUDE_CACHE_DIR
+from .helpers import write_chunks, iter_chunks, DEFAULT_FORMAT
+from .cache import SceneHasher
+
+
+class SerializationContext:
+    """ State shared by the elements of a scene while it is serialized.
+
+    Parameters
+    ------------
+
+    include_cache
+      An IncludeCache, or None to serialize cacheable elements inline.
+
+    output_format
+      The OutputFormat of the code (precision of the numbers...).
+    """
+
+    # In a recording context, elements yield themselves instead of their
+    # code (see memo.py).
+    recording = False
+
+    def __init__(self, include_cache=None, output_format=DEFAULT_FORMAT):
+        self.include_cache = include_cache
+        self.output_format = output_format
+        # Keys of the include files used by the code (see
+        # Scene.iter_render_chunks)
+        self.included = set()
+        # ids of the elements whose memoized code was checked (see memo.py)
+        self.validated = set()
+        # Hashes of the #declare'd subtrees => identifiers, and hashes of
+        # the subtrees containing some of them (see dedup.py).
+        self.declared = {}
+        self.affected = set()
+
+    def subcontext(self):
+        """ Returns a context for a different file (e.g. an include file),
+        which shares the caches but not the list of included files. """
+        context = SerializationContext(self.include_cache, self.output_format)
+        context.validated = self.validated
+        return context
+
+
+class IncludeCache:
+    """ Directory of content-hashed include files.
+
+    Files are named after the structural hash of the elements, memoized on
+    the elements, so that an unchanged subtree is neither serialized nor
+    written again on later renders.
+
+    Parameters
+    ------------
+
+    directory
+      Directory of the include files. It is created if needed. Scenes
+      using it must be rendered with this directory in their includedirs,
+      which ``Scene.render`` does automatically.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = os.path.abspath(directory or INCLUDE_CACHE_DIR)
+
+    def filename(self, key):
+        return "%s.inc" % key
+
+    def path(self, key):
+        return os.path.join(self.directory, self.filename(key))
+
+    def identifier(self, key):
+        return "VAPORY_%s" % key[:16].upper()
+
+    def key(self, element, context):
+        """ Returns the content hash of the element (memoized). """
+        return element.content_hash(context)
+
+    def write(self, element, key, context):
+        """ Writes the include file of the element, unless it already
+        exists. """
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        identifier = self.identifier(key)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write("#ifndef (%s)\n#declare %s =\n" % (identifier, identifier))
+            write_chunks(element.iter_memo_chunks(context.subcontext()), f)
+            f.write("\n#end\n")
+        # Renaming is atomic, concurrent writers of the same file are safe.
+        os.replace(temp_path, path)
+
+    def write_hashed(self, chunks):
+        """ Writes code to a file named after its hash, returns the hash. """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        temp_path = os.path.join(self.directory, "%d.%d.tmp" % (
+            os.getpid(), threading.get_ident()))
+        hasher = SceneHasher()
+        with open(temp_path, 'w') as f:
+            write_chunks(hasher.iter_update(chunks), f)
+        key = hasher.hexdigest()
+        os.replace(temp_path, self.path(key))
+        return key
+
+    def iter_reference_chunks(self, element, context):
+        """ Yields the code replacing the element in the scene: an #include
+        of its file (the first time) and a reference to its identifier. """
+        key = self.key(element, context)
+        self.write(element, key, context)
+        if key not in context.included:
+            context.included.add(key)
+            yield '#include "%s"\n' % self.filename(key)
+        yield element.reference(self.identifier(key))
+
+
+class Static:
+    """ Objects which stay the same in all the frames of an animation (or
+    all the renders of a scene).
+
+    They are written once to an include file of the scene's IncludeCache,
+    and the scenes containing the group only ``#include`` this file: the
+    cost of a frame only depends on the objects which change.
+
+    The objects are serialized the first time the group is, and are then
+    considered frozen: build a new Static group if they change.
+
+    Parameters
+    ------------
+
+    objects
+      The static objects (shapes, light sources...).
+
+    Examples
+    ---------
+
+    >>> city = Static(LightSource([0, 100, 0], 'color', 1), *buildings)
+    >>> def scene(t):
+    ...     return Scene(Camera('location', [t, 1, -5]), [city, car(t)])
+    """
+
+    def __init__(self, *objects):
+        self.objects = objects
+        # (output format, directory) => hash of the include file
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def iter_chunks(self, context=None):
+        if (context is None) or (context.include_cache is None):
+            return self.iter_body_chunks(context)
+        return iter([self.include_line(context)])
+
+    def iter_body_chunks(self, context=None):
+        for i, e in enumerate(self.objects):
+            if i:
+                yield "\n"
+            for chunk in iter_chunks(e, context):
+                yield chunk
+
+    def include_line(self, context):
+        """ Writes the include file of the group if needed, returns the
+        #include directive. """
+        include_cache = context.include_cache
+        lookup = (context.output_format, include_cache.directory)
+        with self._lock:
+            key = self._keys.get(lookup)
+            if (key is None) or not os.path.exists(include_cache.path(key)):
+                key = include_cache.write_hashed(self.iter_body_chunks(
+                    context.subcontext()))
+                self._keys[lookup] = key
+        context.included.add(key)
+        return '#include "%s"' % include_cache.filename(key)
+
+    def __getstate__(self):
+        # Each process finds the keys again (and checks that the files
+        # exist), and locks can't be pickled.
+        return {'objects': self.objects}
+
+    def __setstate__(self, state):
+        self.__init__(*state['objects'])
+
+    def __str__(self):
+        return "".join(self.iter_chunks())
@@ -2,10 +2,19 @@
 All the advanced Input/Output operations for Vapory
 """
 
-import re
 import os
+import time
+import shutil
 import subprocess
-from .config import POVRAY_BINARY
+from tempfile import mkdtemp
+from .config import POVRAY_BINARY, SCRATCH_DIR
+from .helpers import write_chunks
+from .formats import (ppm_to_numpy, image_to_numpy, output_format,
+                      EXTENSIONS)
+from .cache import SceneHasher
+from .stats import RenderStats
+from .metrics import (REGISTRY, TimedFile, timed, record_stage,
+                      record_render_stats)
 
 try:
     import numpy
@@ -13,49 +22,287 @@ try:
 except:
     numpy_found=False
 
+
 try:
     from IPython.display import Image
     ipython_found=True
 except:
     ipython_found=False
 
-def ppm_to_numpy(filename=None, buffer=None, byteorder='>'):
-    """Return image data from a raw PGM/PPM file as numpy array.
-
-    Format specification: http://netpbm.sourceforge.net/doc/pgm.html
+def povray_command(pov_file, outfile=None, height=None, width=None,
+                   quality=None, antialiasing=None, show_window=False,
+                   includedirs=None, output_alpha=False, threads=None,
+                   region=None, file_type=None, bits_per_color=None):
+    """ Returns the command line rendering pov_file with POV-Ray.
 
+    If outfile is None, POV-Ray writes a PPM image to its standard output,
+    otherwise a PNG file (or a file of the given POV-Ray ``file_type``, e.g.
+    "P" for PPM, with the given ``bits_per_color``). See render_povstring
+    for the other parameters.
     """
 
-    if not numpy_found:
-        raise IOError("Function ppm_to_numpy requires numpy installed.")
+    format_type = file_type or ("P" if outfile is None else "N")
+    cmd = [POVRAY_BINARY, pov_file]
+    if height is not None: cmd.append('+H%d'%height)
+    if width is not None: cmd.append('+W%d'%width)
+    if quality is not None: cmd.append('+Q%d'%quality)
+    if antialiasing is not None: cmd.append('+A%f'%antialiasing)
+    if threads is not None: cmd.append('+WT%d'%threads)
+    if region is not None:
+        # POV-Ray rows and columns are 1-based and inclusive.
+        row_start, row_end, col_start, col_end = region
+        cmd += ['+SR%d'%(row_start + 1), '+ER%d'%row_end,
+                '+SC%d'%(col_start + 1), '+EC%d'%col_end]
+    if output_alpha: cmd.append('Output_Alpha=on')
+    if not show_window:
+        cmd.append('-D')
+    else:
+        cmd.append('+D')
+    if includedirs is not None:
+        for dir in includedirs:
+            cmd.append('+L%s'%dir)
+    cmd.append("Output_File_Type=%s"%format_type)
+    if bits_per_color is not None:
+        cmd.append("Bits_Per_Color=%d"%bits_per_color)
+    cmd.append("+O%s"%('-' if outfile is None else outfile))
+    return cmd
+
+
+def render_povfile(pov_file, outfile=None, height=None, width=None,
+                   quality=None, antialiasing=None, show_window=False,
+                   includedirs=None, output_alpha=False, threads=None,
+                   region=None, timeout=None, max_memory=None,
+                   return_stats=False, transport='pipe', out=None,
+                   channels=None, dtype='uint8'):
+    """ Renders an existing scene file with POV-Ray.
+
+    Returns a numpy array if outfile is None, else None once the PNG file
+    has been written (and with return_stats, a tuple ``(result, stats)``).
+    Raises an IOError if POV-Ray fails.
+    See render_povstring for the parameters.
+
+    region
+      ``(row_start, row_end, col_start, col_end)`` in pixels (0-based, ends
+      excluded). Only this part of the image is rendered, and for numpy
+      outputs only this part is returned.
+    """
 
-    if buffer is None:
-        with open(filename, 'rb') as f:
-            buffer = f.read()
+    result, _, err = _render_povfile(
+        pov_file, outfile, height, width, quality, antialiasing, show_window,
+        includedirs, output_alpha, threads, region, timeout, max_memory,
+        transport, channels, dtype)
+    if result is not None:
+        result = copy_to_out(result, out)
+    if return_stats:
+        return result, RenderStats.from_output(err)
+    return result
+
+
+def _render_povfile(pov_file, outfile=None, height=None, width=None,
+                    quality=None, antialiasing=None, show_window=False,
+                    includedirs=None, output_alpha=False, threads=None,
+                    region=None, timeout=None, max_memory=None,
+                    transport='pipe', channels=None, dtype='uint8',
+                    keep_image=False):
+    """ Renders a scene file like render_povfile, returns ``(arr, image,
+    err)`` as _run_render does. With keep_image, image is always the bytes
+    of the raw image (to store it in a RenderCache), else it is None for
+    the 'file' transport. """
+    numpy_format, output_alpha = numpy_output_format(channels, dtype,
+                                                     output_alpha, outfile)
+    image_dir = None
+    if (outfile is None) and (check_transport(transport) == 'file'):
+        image_dir = mkdtemp(prefix='vapory_', dir=SCRATCH_DIR)
     try:
-        header, width, height, maxval = re.search(
-            b"(^P\d\s(?:\s*#.*[\r\n])*"
-            b"(\d+)\s(?:\s*#.*[\r\n])*"
-            b"(\d+)\s(?:\s*#.*[\r\n])*"
-            b"(\d+)\s(?:\s*#.*[\r\n]\s)*)", buffer).groups()
-    except AttributeError:
-        raise ValueError("Not a raw PPM/PGM file: '%s'" % filename)
-
-    cols_per_pixels = 1 if header.startswith(b"P5") else 3
-
-    dtype = 'uint8' if int(maxval) < 256 else byteorder+'uint16'
-    arr = numpy.frombuffer(buffer, dtype=dtype,
-                           count=int(width)*int(height)*3,
-                           offset=len(header))
+        result, image, err = _run_render(
+            pov_file, outfile, image_dir, region, timeout, max_memory,
+            numpy_format, height, width, quality, antialiasing, show_window,
+            includedirs, output_alpha, threads, region)
+        if image_dir is not None:
+            if keep_image:
+                with open(image, 'rb') as f:
+                    image = f.read()
+            else:
+                image = None
+    finally:
+        if image_dir is not None:
+            shutil.rmtree(image_dir, ignore_errors=True)
+    return result, image, err
+
+
+def check_transport(transport):
+    """ Checks the transport of a numpy render: 'pipe' (the image is read
+    from POV-Ray's standard output) or 'file' (POV-Ray writes the image to
+    a file, in memory on systems with a tmpfs, which is memory-mapped into
+    the returned array instead of being copied for PPM outputs). """
+    if transport not in ('pipe', 'file'):
+        raise ValueError("transport should be 'pipe' or 'file', not %r."
+                         % (transport,))
+    return transport
+
+
+def numpy_output_format(channels=None, dtype='uint8', output_alpha=False,
+                        outfile=None):
+    """ Returns ``(numpy_format, output_alpha)`` for a render: the file type
+    and bits per color of POV-Ray's output for numpy renders (see
+    formats.output_format, None for file outputs), and whether POV-Ray
+    should output an alpha channel. channels defaults to 'rgba' if
+    output_alpha is set, else 'rgb'. """
+    if outfile is not None:
+        return None, output_alpha
+    if channels is None:
+        channels = 'rgba' if output_alpha else 'rgb'
+    return output_format(channels, dtype), (channels == 'rgba')
+
+
+def copy_to_out(arr, out=None):
+    """ Copies a rendered image into the ``out`` array if any, and returns
+    the array holding the image. """
+    if out is None:
+        return arr
+    if out.shape != arr.shape:
+        raise ValueError("The out array has shape %s but the image has shape"
+                         " %s." % (out.shape, arr.shape))
+    numpy.copyto(out, arr, casting='same_kind')
+    return out
+
+
+def _run_render(pov_file, outfile, image_dir, region, timeout, max_memory,
+                numpy_format, *command_args):
+    """ Runs POV-Ray on pov_file and returns ``(arr, image, err)``.
+
+    For numpy outputs (outfile is None), arr is the decoded image and image
+    its raw data (in the format ``numpy_format``, see numpy_output_format):
+    bytes read from the standard output of POV-Ray, or, if an image_dir is
+    given, the name of the image file written there. For file outputs, arr
+    and image are None. command_args are the parameters of povray_command
+    from height to region.
+    """
+    if outfile is not None:
+        cmd = povray_command(pov_file, outfile, *command_args)
+        _, err = run_povray(cmd, timeout, max_memory)
+        return None, None, err
+    file_type, bits_per_color = numpy_format
+    if image_dir is None:
+        cmd = povray_command(pov_file, None, *command_args,
+                             file_type=file_type,
+                             bits_per_color=bits_per_color)
+        out, err = run_povray(cmd, timeout, max_memory)
+        arr = image_to_numpy_region(out, region, file_type=file_type)
+        return arr, out, err
+    image_file = os.path.join(image_dir, '__temp__.' + EXTENSIONS[file_type])
+    cmd = povray_command(pov_file, image_file, *command_args,
+                         file_type=file_type, bits_per_color=bits_per_color)
+    _, err = run_povray(cmd, timeout, max_memory)
+    return (image_to_numpy_region(region=region, filename=image_file,
+                                  file_type=file_type), image_file, err)
+
+
+def run_povray(cmd, timeout=None, max_memory=None):
+    """ Runs a POV-Ray command, returns its standard output (the image for
+    numpy outputs) and standard error (the messages and statistics), and
+    raises an IOError if the render fails.
+
+    If the render takes more than ``timeout`` seconds, POV-Ray is killed and
+    a TimeoutError (a subclass of IOError) is raised. ``max_memory`` (in
+    bytes) limits the address space of the POV-Ray process, which then
+    fails cleanly instead of exhausting the memory of the machine.
+    """
+    REGISTRY.inc('vapory_renders_total')
+    # POV-Ray reads the scene from its file, nothing is sent through stdin.
+    with timed('spawn'):
+        process = subprocess.Popen(limit_memory(cmd, max_memory),
+                                   stderr=subprocess.PIPE,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
 
-    return arr.reshape((int(height), int(width), 3))
+    try:
+        with timed('povray'):
+            out, err = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process(process)
+        REGISTRY.inc('vapory_render_timeouts_total')
+        raise TimeoutError("POVRay rendering was stopped after %s seconds."
+                           % timeout)
+    except BaseException:
+        # e.g. KeyboardInterrupt: never leave a runaway POV-Ray behind.
+        kill_process(process)
+        raise
 
+    if process.returncode:
+        REGISTRY.inc('vapory_render_failures_total')
+        print(type(err), err)
+        raise IOError("POVRay rendering failed with the following error: "+err.decode('ascii'))
+    record_render_stats(RenderStats.from_output(err))
+    return out, err
+
+
+def limit_memory(cmd, max_memory):
+    """ Returns a command running cmd with its address space limited to
+    max_memory bytes, or cmd itself if max_memory is None.
+
+    The limit is set by a shell (ulimit) which then execs POV-Ray, rather
+    than with a preexec_fn, which isn't safe in programs with threads
+    (render_many, RenderService...). """
+    if max_memory is None:
+        return cmd
+    if os.name != 'posix':
+        raise IOError("max_memory is only supported on POSIX systems.")
+    kilobytes = max(1, int(max_memory) // 1024)
+    return (['/bin/sh', '-c', 'ulimit -v %d && exec "$@"' % kilobytes,
+             'povray'] + list(cmd))
+
+
+def kill_process(process):
+    """ Kills a POV-Ray process and waits for it, closing its pipes. """
+    if process.poll() is None:
+        process.kill()
+    process.communicate()
+
+
+def write_scene(chunks, pov_file):
+    """ Streams POV-Ray code (an iterable of strings) to a scene file,
+    recording the time spent generating the code (serialization) and the
+    time spent writing it (file_write) in the metrics. """
+    start = time.perf_counter()
+    f = TimedFile(open(pov_file, 'w'))
+    try:
+        write_chunks(chunks, f)
+    finally:
+        close_start = time.perf_counter()
+        f.fileobj.close()
+        end = time.perf_counter()
+    write_time = f.write_time + end - close_start
+    record_stage('serialization', close_start - start - f.write_time)
+    record_stage('file_write', write_time, bytes=f.bytes_written)
+    REGISTRY.inc('vapory_scene_bytes_total', f.bytes_written)
+
+
+def image_to_numpy_region(buffer=None, region=None, filename=None,
+                          file_type='P'):
+    """ Decodes the output of a render (bytes, or a file which is then
+    memory-mapped for PPM outputs), cropped to the rendered region if any.
+    Depending on its version, POV-Ray outputs either the region only or the
+    full image with the region rendered. """
+    with timed('decode'):
+        # Windows can't remove the temporary files of mapped images.
+        arr = image_to_numpy(file_type, filename, buffer,
+                             memmap=(os.name != 'nt'))
+    if region is None:
+        return arr
+    row_start, row_end, col_start, col_end = region
+    if arr.shape[:2] == (row_end - row_start, col_end - col_start):
+        return arr
+    return arr[row_start:row_end, col_start:col_end]
 
 
 def render_povstring(string, outfile=None, height=None, width=None,
                      quality=None, antialiasing=None, remove_temp=True,
                      show_window=False, tempfile=None, includedirs=None,
-                     output_alpha=False):
+                     output_alpha=False, cache=None, threads=None,
+                     region=None, timeout=None, max_memory=None,
+                     return_stats=False, transport='pipe', out=None,
+                     channels=None, dtype='uint8'):
 
     """ Renders the provided scene description with POV-Ray.
 
@@ -64,7 +311,9 @@ def render_povstring(string, outfile=None, height=None, width=None,
 
     string
       A string representing valid POVRay code. Typically, it will be the result
-      of scene(*objects)
+      of scene(*objects). It can also be an iterable of strings (such as
+      ``scene.iter_chunks()``), which is then streamed to the scene file
+      without being assembled in memory.
 
     outfile
       Name of the PNG file for the output.
@@ -80,60 +329,198 @@ def render_povstring(string, outfile=None, height=None, width=None,
 
     output_alpha
       If true, the background will be transparent,
-    rather than the default black background.  Note
-    that this option is ignored if rendering to a
-    numpy array, due to limitations of the intermediate
-    ppm format.
+    rather than the default black background. For
+    numpy outputs, this gives RGBA arrays (see channels).
+
+    channels, dtype
+      Channels ('rgb' or 'rgba', default: 'rgba' if output_alpha else
+      'rgb') and dtype ('uint8', 'uint16' or 'float32') of numpy outputs.
+      POV-Ray then writes an image format keeping them, decoded with numpy:
+      rgb uint8/uint16 from PPM, rgba uint8 from TGA, rgba uint16 from
+      16-bit PNG, rgb float32 (high dynamic range) from Radiance HDR.
+      16-bit arrays are big-endian uint16.
+
+    cache
+      A RenderCache. If the same scene (with the same include files) has
+      already been rendered with the same options, the result is taken from
+      the cache instead of running POV-Ray.
+
+    tempfile
+      Name of the temporary scene file. By default it is written in a new
+      scratch directory, so that concurrent renders never share files.
+
+    threads
+      Number of render threads used by POV-Ray (default: all the cores).
+
+    region
+      ``(row_start, row_end, col_start, col_end)`` in pixels (0-based, ends
+      excluded) to render only a crop of the image, e.g. for quick checks.
+
+    timeout
+      Maximal duration of the render in seconds. After that, POV-Ray is
+      killed and a TimeoutError is raised.
+
+    max_memory
+      Maximal memory (address space) of the POV-Ray process in bytes, on
+      POSIX systems. Renders needing more fail with an IOError.
+
+    return_stats
+      If True, returns ``(result, stats)`` where stats is a RenderStats
+      parsed from POV-Ray's output (parse, trace... times, rays counts,
+      intersection tests, peak memory).
+
+    transport
+      How numpy outputs get from POV-Ray to Python. With 'pipe' (default)
+      the image is read from POV-Ray's standard output. With 'file', POV-Ray
+      writes it to a scratch file (on tmpfs if available, see
+      config.SCRATCH_DIR). For RGB uint8/uint16 images (PPM files), the
+      returned array is a read-only memory map of this file, which avoids
+      holding several copies of big images. TGA, PNG and HDR files (RGBA
+      and float32 images) are decoded into new arrays.
+
+    out
+      Optional numpy array of the shape of the image, in which numpy outputs
+      are written (and which is returned), e.g. to reuse the same buffer for
+      many renders.
+
+    The temporary files are removed even when the render fails, times out
+    or is interrupted (unless remove_temp is False).
 
     """
 
-    pov_file = tempfile or '__temp__.pov'
-    with open(pov_file, 'w+') as f:
-        f.write(string)
-
-    return_np_array = (outfile is None)
     display_in_ipython = (outfile=='ipython')
+    file_transport = (outfile is None) and (check_transport(transport) ==
+                                            'file')
+    scratch_dir = None
+    if (tempfile is None) or display_in_ipython or file_transport:
+        scratch_dir = mkdtemp(prefix='vapory_',
+                              dir=SCRATCH_DIR if file_transport else None)
+    pov_file = tempfile or os.path.join(scratch_dir, '__temp__.pov')
+    try:
+        return _render_povstring(string, pov_file, scratch_dir, outfile,
+                                 height, width, quality, antialiasing,
+                                 show_window, includedirs, output_alpha,
+                                 cache, threads, region, timeout, max_memory,
+                                 return_stats, file_transport, out,
+                                 channels, dtype)
+    finally:
+        # Also on errors, timeouts and interruptions.
+        if remove_temp:
+            _remove_temp(pov_file, scratch_dir)
+
+
+def _render_povstring(string, pov_file, scratch_dir, outfile, height, width,
+                      quality, antialiasing, show_window, includedirs,
+                      output_alpha, cache, threads, region, timeout,
+                      max_memory, return_stats, file_transport, out,
+                      channels, dtype):
 
-    format_type = "P" if return_np_array else "N"
+    display_in_ipython = (outfile=='ipython')
+    chunks = [string] if isinstance(string, str) else string
+    if cache is not None:
+        hasher = SceneHasher()
+        chunks = hasher.iter_update(chunks)
+    write_scene(chunks, pov_file)
 
-    if return_np_array:
-        outfile='-'
+    return_np_array = (outfile is None)
+    numpy_format, output_alpha = numpy_output_format(channels, dtype,
+                                                     output_alpha, outfile)
 
     if display_in_ipython:
-        outfile = '__temp_ipython__.png'
+        outfile = os.path.join(scratch_dir, '__temp_ipython__.png')
+
+    if cache is not None:
+        key = render_key(cache, hasher, includedirs, height, width, quality,
+                         antialiasing, output_alpha, return_np_array, region,
+                         numpy_format)
+        found, result = _cached_result(cache, key, outfile, return_np_array,
+                                       display_in_ipython, region,
+                                       numpy_format)
+        if found:
+            REGISTRY.inc('vapory_cache_hits_total')
+            if return_np_array:
+                result = copy_to_out(result, out)
+            if return_stats:
+                return result, RenderStats(cached=True)
+            return result
+        REGISTRY.inc('vapory_cache_misses_total')
+
+    result, image, err = _run_render(
+        pov_file, None if return_np_array else outfile,
+        scratch_dir if file_transport else None, region, timeout, max_memory,
+        numpy_format, height, width, quality, antialiasing, show_window,
+        includedirs, output_alpha, threads, region)
 
-    cmd = [POVRAY_BINARY, pov_file]
-    if height is not None: cmd.append('+H%d'%height)
-    if width is not None: cmd.append('+W%d'%width)
-    if quality is not None: cmd.append('+Q%d'%quality)
-    if antialiasing is not None: cmd.append('+A%f'%antialiasing)
-    if output_alpha: cmd.append('Output_Alpha=on')
-    if not show_window:
-        cmd.append('-D')
+    if return_np_array:
+        if cache is not None:
+            if file_transport:
+                with open(image, 'rb') as f:
+                    image = f.read()
+            cache.put_bytes(key, image)
+            cache.put_array(key, result)
+        result = copy_to_out(result, out)
     else:
-        cmd.append('+D')
-    if includedirs is not None:
-        for dir in includedirs:
-            cmd.append('+L%s'%dir)
-    cmd.append("Output_File_Type=%s"%format_type)
-    cmd.append("+O%s"%outfile)
-    process = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE)
-
-    out, err = process.communicate(string.encode('ascii'))
-
-    if remove_temp:
+        if cache is not None:
+            with open(outfile, 'rb') as f:
+                cache.put_bytes(key, f.read())
+        if display_in_ipython:
+            if not ipython_found:
+                raise IOError("The 'ipython' option only works in the "
+                              "IPython Notebook.")
+            result = Image(outfile)
+
+    if return_stats:
+        return result, RenderStats.from_output(err)
+    return result
+
+
+def render_key(cache, hasher, includedirs=None, height=None, width=None,
+               quality=None, antialiasing=None, output_alpha=False,
+               return_np_array=True, region=None, numpy_format=('P', None)):
+    """ Returns the key of a render in a RenderCache: a hash of the scene
+    code (a SceneHasher), of the render options changing the image and of
+    the POV-Ray binary. output_alpha and numpy_format are as returned by
+    numpy_output_format. """
+    return cache.key(hasher, includedirs, dict(
+        height=height, width=width, quality=quality,
+        antialiasing=antialiasing, output_alpha=output_alpha,
+        return_np_array=return_np_array, region=region,
+        numpy_format=numpy_format, binary=POVRAY_BINARY))
+
+
+def _remove_temp(pov_file, scratch_dir):
+    """ Removes the scene file and the scratch directory of a render. """
+    if os.path.exists(pov_file):
         os.remove(pov_file)
+    if scratch_dir is not None:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
-    if process.returncode:
-        print(type(err), err)
-        raise IOError("POVRay rendering failed with the following error: "+err.decode('ascii'))
 
-    if return_np_array:
-        return ppm_to_numpy(buffer=out)
+def _cached_result(cache, key, outfile, return_np_array, display_in_ipython,
+                   region=None, numpy_format=('P', None)):
+    """ Returns ``(found, result)``: whether the render is in the cache, and
+    its result like a render would return it. For file outputs, the file is
+    written again from the cache and the result is None. """
 
+    if return_np_array:
+        arr = cache.get_array(key)
+        if arr is None:
+            data = cache.get_bytes(key)
+            if data is None:
+                return False, None
+            arr = image_to_numpy_region(data, region,
+                                        file_type=numpy_format[0])
+            cache.put_array(key, arr)
+        return True, arr
+
+    data = cache.get_bytes(key)
+    if data is None:
+        return False, None
+    with open(outfile, 'wb') as f:
+        f.write(data)
     if display_in_ipython:
         if not ipython_found:
-            raise("The 'ipython' option only works in the IPython Notebook.")
-        return Image(outfile)
+            raise IOError("The 'ipython' option only works in the IPython "
+                          "Notebook.")
+        return True, Image(outfile)
+    return True, None
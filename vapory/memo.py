@@ -0,0 +1,322 @@
+"""
+Memoized serialization of elements.
+
+The POV-Ray code of an element is computed once and kept on the element
+(from the second time it is serialized) along with a structural content
+hash (a Merkle hash: the hash of the element's own code with the hashes of
+its child elements). Rendering an unchanged scene again then mostly yields
+memoized strings, and a subtree shared by many elements (a texture...) is
+formatted once.
+
+The memo of an element is invalidated when its ``args`` change (they are
+an ArgList counting its modifications) or when the memo of one of its
+children is. The lists and arrays inside the args (vectors...) may be
+modified in place too: the memo keeps a snapshot of them (a copy of the
+lists, a hash of the arrays) which is compared with their values.
+
+The memos live as long as their elements. They are not copied or pickled
+with them, and clear_memos drops them (e.g. for scenes which are kept but
+won't be rendered again).
+"""
+
+import hashlib
+from itertools import islice
+from .includes import SerializationContext
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
+
+# Child elements with a code shorter than this are copied into the memo of
+# their parent, longer ones are referenced.
+MEMO_INLINE_MAX = 2**12
+# Elements with more code of their own (e.g. big meshes) are hashed but
+# their code isn't kept in memory: it is generated again when needed.
+MEMO_MAX = 2**20
+# Number of chunks of code read at once when memoizing an element.
+BATCH_SIZE = 256
+
+# Contexts in which elements yield themselves instead of their code, to
+# record the structure of their parent, for each output format.
+_RECORDING = {}
+
+
+def recording_context(output_format):
+    context = _RECORDING.get(output_format)
+    if context is None:
+        context = SerializationContext(output_format=output_format)
+        context.recording = True
+        _RECORDING[output_format] = context
+    return context
+
+
+class ArgList(list):
+    """ The list of arguments of an element. It counts its modifications,
+    so that the memoized code of the element is invalidated when the args
+    are modified in place. """
+
+    __slots__ = ('version',)
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self.version = 0
+
+    def __reduce__(self):
+        # Copies and unpickled lists start a new count.
+        return (ArgList, (list(self),))
+
+
+def _mutator(name):
+    method = getattr(list, name)
+
+    def mutate(self, *args):
+        self.version += 1
+        return method(self, *args)
+
+    mutate.__name__ = name
+    return mutate
+
+
+for _name in ['__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort',
+              'reverse']:
+    setattr(ArgList, _name, _mutator(_name))
+del _name
+
+
+def clear_memos(*objects):
+    """ Drops the memoized code and bounding boxes of elements, scenes or
+    lists of them, and of all their children, e.g. to free the memory of
+    scenes which are kept but won't be rendered again. """
+    stack = list(objects)
+    seen = set()
+    while stack:
+        e = stack.pop()
+        if id(e) in seen:
+            continue
+        seen.add(id(e))
+        if hasattr(e, '_memo'):
+            e._memo = None
+            e._serialized = False
+            e._box = None
+            stack.extend(e._args)
+        elif isinstance(e, (list, tuple)) or hasattr(e, '_segments'):
+            stack.extend(e)
+        elif hasattr(e, 'iter_chunks') and hasattr(e, '__dict__'):
+            # Scenes, Static groups...
+            stack.extend(vars(e).values())
+
+
+def args_version(element):
+    """ Returns the number of modifications of the args of an element (the
+    args of the elements are kept in a tuple until they are read). """
+    args = element._args
+    return 0 if args.__class__ is tuple else args.version
+
+
+def args_snapshot(element):
+    """ Returns the values of the lists and arrays in the args of an element
+    (or None if there are none), to detect their in-place modifications. """
+    snapshot = None
+    for i, arg in enumerate(element._args):
+        cls = arg.__class__
+        if cls is list:
+            value = _list_snapshot(arg)
+        elif (cls in _VALUES) or hasattr(cls, '_args'):
+            continue # numbers, strings and elements
+        else:
+            value = _array_snapshot(arg)
+            if value is None:
+                continue
+        if snapshot is None:
+            snapshot = []
+        snapshot.append((i, value))
+    return snapshot
+
+
+# Classes of args which can't be modified in place.
+_VALUES = {str, int, float, bool, tuple, type(None)}
+
+
+def _list_snapshot(value):
+    value = tuple(value)
+    for e in value:
+        if e.__class__ is list:
+            # Nested lists are copied too.
+            return tuple([_list_snapshot(e) if e.__class__ is list else e
+                          for e in value])
+    return value
+
+
+def _array_snapshot(value):
+    # Arrays, and objects wrapping an array like VectorArray.
+    array = getattr(value, 'array', value)
+    if numpy_found and isinstance(array, numpy.ndarray):
+        if array.dtype.hasobject:
+            return repr(array.tolist())
+        return (array.shape, array.dtype.str, hashlib.sha1(
+            numpy.ascontiguousarray(array)).hexdigest())
+    return None
+
+
+class Memo:
+    """ The memoized code of an element.
+
+    parts
+      List of strings and of child elements to serialize in their own
+      context (cacheable elements, big subtrees), or None if the code of the
+      element was too big to be kept.
+
+    digest
+      Structural content hash of the element (hex string).
+
+    children
+      Pairs ``(child, child_memo)`` of the child elements when the memo was
+      built. The memo is valid as long as their memos are the same.
+
+    static
+      True if the code is fully memoized, with no child references.
+
+    output_format
+      The OutputFormat of the code. Serializing the element with another
+      format builds a new memo.
+
+    snapshot
+      Values of the lists and arrays of the args (see args_snapshot).
+    """
+
+    __slots__ = ('version', 'parts', 'digest', 'children', 'size', 'static',
+                 'output_format', 'snapshot')
+
+    def __init__(self, version, parts, digest, children, size, static,
+                 output_format, snapshot=None):
+        self.output_format = output_format
+        self.snapshot = snapshot
+        self.version = version
+        self.parts = parts
+        self.digest = digest
+        self.children = children
+        self.size = size
+        self.static = static
+
+
+def get_memo(element, context=None):
+    """ Returns the valid memo of an element for the output format of the
+    context, building it if needed. ``context.validated`` is a set of the
+    ids of the elements already validated during the current
+    serialization. """
+    if context is None:
+        context = SerializationContext()
+    memo = element._memo
+    if (memo is None) or not is_valid(element, memo, context.validated,
+                                      context.output_format):
+        memo = build_memo(element, context)
+        element._memo = memo
+        context.validated.add(id(element))
+    return memo
+
+
+def is_valid(element, memo, validated, output_format):
+    if id(element) in validated:
+        return True
+    if element.custom_str:
+        return False # its code may depend on anything
+    if memo.version != args_version(element):
+        return False
+    if memo.snapshot != args_snapshot(element):
+        return False
+    if (memo.output_format is not output_format) and (
+            memo.output_format != output_format):
+        return False
+    for child, child_memo in memo.children:
+        if (child._memo is not child_memo) or not is_valid(
+                child, child_memo, validated, output_format):
+            return False
+    validated.add(id(element))
+    return True
+
+
+def build_memo(element, context):
+    # hashed: the code to hash (own code and hashes of the children),
+    # strings: the code to memoize (own code and code of small children).
+    snapshot = args_snapshot(element)
+    hashed = [type(element).__name__, "[cached]" if element.cache_include
+              else "|"]
+    parts, strings, children = [], [], []
+    digest = hashlib.sha1()
+    size = 0
+    static = True
+    if element.custom_str:
+        chunks = iter([str(element)])
+    else:
+        chunks = element.iter_body_chunks(recording_context(
+            context.output_format))
+    while True:
+        # Runs of strings are processed in bulk, children one by one.
+        batch = list(islice(chunks, BATCH_SIZE))
+        start = 0
+        for end in [i for (i, c) in enumerate(batch) if c.__class__ is not str]:
+            run = batch[start:end]
+            hashed += run
+            size += sum(map(len, run))
+            start = end + 1
+            child = batch[end]
+            child_memo = get_memo(child, context)
+            children.append((child, child_memo))
+            hashed.append("\0%s\0" % child_memo.digest)
+            if parts is None:
+                continue
+            strings += run
+            if (child_memo.static and (child_memo.size <= MEMO_INLINE_MAX)
+                    and not child.cache_include):
+                strings += child_memo.parts
+                size += child_memo.size
+            else:
+                if strings:
+                    parts.append("".join(strings))
+                    strings = []
+                parts.append(child)
+                static = False
+        if start:
+            batch = batch[start:]
+        hashed += batch
+        size += sum(map(len, batch))
+        if parts is not None:
+            strings += batch
+            if size > MEMO_MAX:
+                parts = strings = None
+        if len(batch) + start < BATCH_SIZE:
+            break
+        if parts is None:
+            digest.update("".join(hashed).encode('utf8'))
+            hashed = []
+    digest.update("".join(hashed).encode('utf8'))
+    if strings:
+        parts.append("".join(strings))
+    return Memo(args_version(element), parts, digest.hexdigest(),
+                tuple(children), size, static and (parts is not None),
+                context.output_format, snapshot)
+
+
+def iter_memo_chunks(element, context=None):
+    """ Yields the code of an element from its memo. Memoizing costs more
+    than serializing once, so elements are memoized the second time they
+    are serialized (shared subtrees, scenes rendered several times). """
+    if (element._memo is None) and not element._serialized:
+        element._serialized = True
+        for chunk in element.iter_body_chunks(context):
+            yield chunk
+        return
+    memo = get_memo(element, context)
+    if memo.parts is None:
+        for chunk in element.iter_body_chunks(context):
+            yield chunk
+        return
+    for part in memo.parts:
+        if isinstance(part, str):
+            yield part
+        else:
+            for chunk in part.iter_chunks(context):
+                yield chunk
@@ -0,0 +1,226 @@
+"""
+Timing instrumentation of the render pipeline, and a process-wide registry
+of metrics (counters and histograms).
+
+Each stage of a render is timed and recorded in the histogram
+``vapory_stage_seconds`` of REGISTRY, with one of these stage labels:
+
+- serialization: generating the POV-Ray code of the scene in Python.
+- file_write: writing the scene file.
+- spawn: starting the POV-Ray process.
+- povray: running POV-Ray (wall-clock, from spawn to exit).
+- povray_parse, povray_bounding, povray_photon, povray_radiosity,
+  povray_trace: the phases reported by POV-Ray itself.
+- decode: decoding the PPM output into a numpy array.
+
+>>> add_hook(lambda stage, seconds, info: print(stage, seconds))
+>>> scene.render(width=300, height=200)
+>>> REGISTRY.write_prometheus("/var/lib/node_exporter/vapory.prom")
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, 300,
+                   float('inf'))
+
+
+class Counter:
+    """ A value which only goes up. """
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """ Distribution of observed values in cumulative buckets, with their
+    count and sum (like Prometheus histograms). """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """ Counters and histograms identified by a name and labels.
+
+    >>> registry.counter('vapory_renders_total').inc()
+    >>> registry.histogram('vapory_stage_seconds', stage='decode').observe(t)
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls(**kwargs)
+            return metric
+
+    def counter(self, name, **labels):
+        return self._get(Counter, name, labels)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, labels, buckets=buckets)
+
+    def inc(self, name, amount=1, **labels):
+        counter = self.counter(name, **labels)
+        with self.lock:
+            counter.inc(amount)
+
+    def observe(self, name, value, **labels):
+        histogram = self.histogram(name, **labels)
+        with self.lock:
+            histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.metrics.clear()
+
+    def to_dict(self):
+        """ Returns all the metrics as a JSON-serializable dict. """
+        result = {}
+        with self.lock:
+            for (name, labels), metric in sorted(self.metrics.items(),
+                                                 key=lambda e: e[0]):
+                entry = {'labels': dict(labels)}
+                if isinstance(metric, Counter):
+                    entry.update(type='counter', value=metric.value)
+                else:
+                    entry.update(type='histogram', count=metric.count,
+                                 sum=metric.sum, buckets=[
+                                     [str(b), c] for (b, c) in
+                                     zip(metric.buckets, metric.counts)])
+                result.setdefault(name, []).append(entry)
+        return result
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self):
+        """ Returns the metrics in the Prometheus text exposition format. """
+
+        def format_labels(labels, **extra):
+            labels = list(labels) + sorted(extra.items())
+            if not labels:
+                return ""
+            return "{%s}" % ",".join('%s="%s"' % (k, v) for (k, v) in labels)
+
+        lines = []
+        typed = set()
+        with self.lock:
+            for (name, labels), metric in sorted(self.metrics.items(),
+                                                 key=lambda e: e[0]):
+                is_counter = isinstance(metric, Counter)
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE %s %s" % (
+                        name, "counter" if is_counter else "histogram"))
+                if is_counter:
+                    lines.append("%s%s %s" % (name, format_labels(labels),
+                                              metric.value))
+                    continue
+                for bound, count in zip(metric.buckets, metric.counts):
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append("%s_bucket%s %d" % (
+                        name, format_labels(labels, le=le), count))
+                lines.append("%s_sum%s %r" % (name, format_labels(labels),
+                                              metric.sum))
+                lines.append("%s_count%s %d" % (name, format_labels(labels),
+                                                metric.count))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, filename):
+        _write_atomic(filename, self.to_json(indent=1))
+
+    def write_prometheus(self, filename):
+        """ Writes the metrics to a file, e.g. for the textfile collector of
+        the Prometheus node exporter. """
+        _write_atomic(filename, self.to_prometheus())
+
+
+def _write_atomic(filename, text):
+    temp = "%s.%d.tmp" % (filename, os.getpid())
+    with open(temp, 'w') as f:
+        f.write(text)
+    os.replace(temp, filename)
+
+
+REGISTRY = MetricsRegistry()
+HOOKS = []
+
+
+def add_hook(hook):
+    """ Registers a function ``hook(stage, seconds, info)`` called after
+    each timed stage of every render. info is a dict with details of the
+    render, possibly empty. """
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+def record_stage(stage, seconds, **info):
+    """ Records the duration of a stage in REGISTRY and calls the hooks. """
+    REGISTRY.observe('vapory_stage_seconds', seconds, stage=stage)
+    for hook in HOOKS:
+        hook(stage, seconds, info)
+
+
+@contextmanager
+def timed(stage, **info):
+    """ Context manager timing a block of code as a stage of the render
+    pipeline. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, **info)
+
+
+def record_render_stats(stats):
+    """ Records the phases reported by POV-Ray (a RenderStats). """
+    for phase in ['parse', 'bounding', 'photon', 'radiosity', 'trace']:
+        seconds = getattr(stats, phase + '_time')
+        if seconds is not None:
+            record_stage('povray_' + phase, seconds)
+    if stats.peak_memory is not None:
+        REGISTRY.observe('vapory_povray_peak_memory_bytes', stats.peak_memory,
+                         buckets=[2**i for i in range(20, 40, 2)] +
+                                 [float('inf')])
+
+
+class TimedFile:
+    """ Wraps a file, measuring the time spent in write(). Used to separate
+    the serialization time from the file writing time of a streamed scene.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.write_time = 0.0
+        self.bytes_written = 0
+
+    def write(self, data):
+        start = time.perf_counter()
+        self.fileobj.write(data)
+        self.write_time += time.perf_counter() - start
+        self.bytes_written += len(data)
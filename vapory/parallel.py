@@ -0,0 +1,196 @@
+"""
+Parallel rendering with POV-Ray: several scenes at once (render_many), or
+one big image split in tiles (render_tiles).
+
+>>> images = list(render_many(scenes, jobs=4, width=300, height=200))
+>>> image = render_tiles(scene.iter_chunks(), width=7680, height=4320,
+                         tiles=(16, 16), jobs=8)
+"""
+
+import os
+import shutil
+from tempfile import mkdtemp
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from .io import render_povfile, write_scene
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
+
+
+def threads_per_job(jobs):
+    """ Returns the number of POV-Ray threads for each of ``jobs`` parallel
+    renders, so that together they use each core once. """
+    return max(1, (os.cpu_count() or 1) // jobs)
+
+
+def make_executor(executor, jobs):
+    """ Returns a pool of ``jobs`` workers: executor is 'process', 'thread'
+    or an existing concurrent.futures executor (returned as is). """
+    if executor == 'process':
+        return ProcessPoolExecutor(max_workers=jobs)
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=jobs)
+    if hasattr(executor, 'submit'):
+        return executor
+    raise ValueError("executor should be 'process', 'thread' or an "
+                     "Executor, got %s" % repr(executor))
+
+
+def _render_job(scene, render_kwargs):
+    return scene.render(**render_kwargs)
+
+
+def render_many(scenes, jobs=None, executor='process', ordered=True,
+                outfiles=None, **render_kwargs):
+    """ Renders several scenes in parallel.
+
+    Each render gets its own scratch directory, and the cores of the machine
+    are split between the POV-Ray processes (see threads_per_job) unless
+    ``threads`` is given in the render parameters.
+
+    Parameters
+    ------------
+
+    scenes
+      A list of Scene objects.
+
+    jobs
+      Number of renders running at the same time (default: number of cores).
+
+    executor
+      'process' (default) or 'thread'. POV-Ray runs in its own process
+      anyway, 'thread' avoids pickling the scenes when they are huge.
+      An existing concurrent.futures executor can also be provided.
+
+    ordered
+      If True, the results are yielded in the order of the scenes. If False,
+      ``(index, result)`` pairs are yielded as soon as the renders complete.
+
+    outfiles
+      Optional list of output files, one per scene. By default the results
+      are numpy arrays.
+
+    render_kwargs
+      Parameters of Scene.render (width, height, quality...), common to all
+      the scenes.
+
+    Returns
+    --------
+
+    A generator of the results of Scene.render.
+    """
+
+    scenes = list(scenes)
+    jobs = min(jobs or os.cpu_count() or 1, max(1, len(scenes)))
+    if outfiles is None:
+        outfiles = [render_kwargs.pop('outfile', None)] * len(scenes)
+    render_kwargs.setdefault('threads', threads_per_job(jobs))
+
+    pool = make_executor(executor, jobs)
+    try:
+        futures = [pool.submit(_render_job, scene,
+                               dict(render_kwargs, outfile=outfile))
+                   for scene, outfile in zip(scenes, outfiles)]
+        if ordered:
+            for future in futures:
+                yield future.result()
+        else:
+            indices = dict((future, i) for (i, future) in enumerate(futures))
+            for future in as_completed(futures):
+                yield indices[future], future.result()
+    finally:
+        if pool is not executor:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def tile_regions(width, height, tiles):
+    """ Splits a width x height image in ``tiles=(nx, ny)`` regions
+    ``(row_start, row_end, col_start, col_end)``, row by row. """
+    nx, ny = tiles
+    cols = [i * width // nx for i in range(nx + 1)]
+    rows = [j * height // ny for j in range(ny + 1)]
+    return [(rows[j], rows[j + 1], cols[i], cols[i + 1])
+            for j in range(ny) for i in range(nx)
+            if (rows[j] < rows[j + 1]) and (cols[i] < cols[i + 1])]
+
+
+def render_tiles(string, width, height, tiles=(8, 8), jobs=None,
+                 executor='process', threads=None, out=None, **render_kwargs):
+    """ Renders one image by splitting it into tiles rendered in parallel
+    POV-Ray processes, and returns the stitched image as a numpy array.
+
+    The scene is written only once; each tile is a partial render of this
+    file (+SR/+ER/+SC/+EC). Use more tiles than jobs: idle workers pick the
+    next tile in the queue, which balances the load when some parts of the
+    image are much slower to trace than others.
+
+    Parameters
+    ------------
+
+    string
+      The POV-Ray code of the scene (a string or an iterable of strings,
+      like ``scene.iter_chunks()``).
+
+    width, height
+      Size of the full image in pixels.
+
+    tiles
+      ``(nx, ny)``, number of tiles in each direction.
+
+    jobs
+      Number of POV-Ray processes running at the same time (default: number
+      of cores).
+
+    executor
+      'process' (default), 'thread' or a concurrent.futures executor.
+
+    threads
+      Number of threads of each POV-Ray process (default: the cores split
+      between the jobs).
+
+    out
+      Optional numpy array of shape (height, width, 3) in which the tiles
+      are written (and which is returned).
+
+    render_kwargs
+      Other parameters of render_povfile (quality, antialiasing,
+      includedirs...).
+    """
+
+    if not numpy_found:
+        raise IOError("Function render_tiles requires numpy installed.")
+
+    regions = tile_regions(width, height, tiles)
+    jobs = min(jobs or os.cpu_count() or 1, len(regions))
+    if threads is None:
+        threads = threads_per_job(jobs)
+
+    scratch_dir = mkdtemp(prefix='vapory_')
+    pov_file = os.path.join(scratch_dir, '__temp__.pov')
+    chunks = [string] if isinstance(string, str) else string
+    pool = None
+    try:
+        write_scene(chunks, pov_file)
+        pool = make_executor(executor, jobs)
+        futures = dict(
+            (pool.submit(render_povfile, pov_file, None, height, width,
+                         threads=threads, region=region, **render_kwargs),
+             region)
+            for region in regions)
+        image = out
+        for future in as_completed(futures):
+            tile = future.result()
+            if image is None:
+                image = numpy.zeros((height, width) + tile.shape[2:],
+                                    dtype=tile.dtype)
+            row_start, row_end, col_start, col_end = futures[future]
+            image[row_start:row_end, col_start:col_end] = tile
+        return image
+    finally:
+        if (pool is not None) and (pool is not executor):
+            pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
@@ -0,0 +1,168 @@
+"""
+Structurally shared lists, for the functional updates of scenes.
+
+``scene.add_objects([light])`` returns a new scene whose list of objects
+shares the objects of the first one: adding a few objects to a scene of
+hundreds of thousands costs about the same as adding them to an empty one.
+
+Each SharedList is a separate mutable list: modifying one doesn't modify
+the lists it shares items with (copy-on-write). The items themselves are
+shared, not copied.
+
+A SharedList has the methods and operators of a list, but isn't a subclass
+of list: ``isinstance(scene.objects, list)`` is False since Scene.objects
+became a SharedList. Use ``list(scene.objects)`` to get a real list.
+"""
+
+from itertools import chain
+from collections.abc import MutableSequence
+
+
+class SharedList(MutableSequence):
+    """ A list stored as a few immutable segments (tuples) which are shared
+    between the copies of the list.
+
+    The segments are sorted by decreasing size, each one at least twice as
+    long as the next: appending or extending only creates or merges the
+    small segments at the end, and there are at most log2(n) segments.
+    Modifying an item in place copies the segment which holds it.
+    """
+
+    __slots__ = ('_segments', '_length')
+
+    def __init__(self, items=()):
+        if isinstance(items, SharedList):
+            self._segments = items._segments
+            self._length = items._length
+        else:
+            items = tuple(items)
+            self._segments = (items,) if items else ()
+            self._length = len(items)
+
+    def copy(self):
+        """ Returns a copy of the list, in constant time. """
+        return SharedList(self)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return chain.from_iterable(self._segments)
+
+    def _locate(self, index):
+        """ Returns the position of the segment holding the item at the
+        given index and the index of the item in this segment. """
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("SharedList index out of range")
+        for i, segment in enumerate(self._segments):
+            if index < len(segment):
+                return i, index
+            index -= len(segment)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SharedList(list(self)[index])
+        i, j = self._locate(index)
+        return self._segments[i][j]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            items = list(self)
+            items[index] = value
+            self.__init__(items)
+            return
+        i, j = self._locate(index)
+        segment = self._segments[i]
+        self._replace(i, segment[:j] + (value,) + segment[j + 1:])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            items = list(self)
+            del items[index]
+            self.__init__(items)
+            return
+        i, j = self._locate(index)
+        segment = self._segments[i]
+        self._replace(i, segment[:j] + segment[j + 1:])
+
+    def insert(self, index, value):
+        if index < 0:
+            index = max(0, index + self._length)
+        if index >= self._length:
+            self.append(value)
+            return
+        i, j = self._locate(index)
+        segment = self._segments[i]
+        self._replace(i, segment[:j] + (value,) + segment[j:])
+
+    def clear(self):
+        self._segments = ()
+        self._length = 0
+
+    def reverse(self):
+        """ Reverses the list in place, in one pass. """
+        self.__init__(list(self)[::-1])
+
+    def sort(self, key=None, reverse=False):
+        self.__init__(sorted(self, key=key, reverse=reverse))
+
+    def _replace(self, i, segment):
+        segments = self._segments[:i] + self._segments[i + 1:]
+        if segment:
+            segments = segments[:i] + (segment,) + segments[i:]
+        self._segments = segments
+        self._length = sum(map(len, segments))
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        values = tuple(values)
+        if not values:
+            return
+        segments = list(self._segments)
+        segments.append(values)
+        # Merges the last segments until each one is at least twice as
+        # long as the next.
+        while (len(segments) > 1) and (len(segments[-2]) <
+                                       2 * len(segments[-1])):
+            last = segments.pop()
+            segments[-1] = segments[-1] + last
+        self._segments = tuple(segments)
+        self._length += len(values)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __add__(self, values):
+        new = self.copy()
+        new.extend(values)
+        return new
+
+    def __radd__(self, values):
+        return SharedList(list(values) + list(self))
+
+    def __mul__(self, n):
+        return SharedList(list(self) * n)
+
+    __rmul__ = __mul__
+
+    def __imul__(self, n):
+        self.__init__(list(self) * n)
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, (SharedList, list)):
+            return (len(self) == len(other)) and all(
+                a == b for (a, b) in zip(self, other))
+        return NotImplemented
+
+    def __reduce__(self):
+        # Copies and pickles are plain lists of items.
+        return (SharedList, (list(self),))
+
+    def __repr__(self):
+        return "SharedList(%r)" % list(self)
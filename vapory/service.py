@@ -0,0 +1,392 @@
+"""
+A local render service: a bounded pool of POV-Ray workers fed by a priority
+queue, which coalesces identical requests so that concurrent callers don't
+stampede POV-Ray.
+
+>>> service = RenderService(workers=4)
+>>> future = service.submit(scene, priority=10, deadline=30,
+...                         width=300, height=200)
+>>> image = future.result()
+
+The service can also be reached from other processes through a localhost
+socket:
+
+>>> host, port = service.serve()          # in the daemon
+>>> image = request_render(scene, port, width=300, height=200) # in clients
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import itertools
+import threading
+import socketserver
+from io import BytesIO
+from queue import PriorityQueue
+from tempfile import mkdtemp
+from concurrent.futures import Future
+from .cache import SceneHasher, RenderCache
+from .io import (_render_povfile, _cached_result, ppm_to_numpy,
+                 write_scene, render_key, numpy_output_format)
+from .parallel import threads_per_job
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
+
+
+class _RenderJob:
+
+    def __init__(self, key, pov_file, render_kwargs, priority):
+        self.key = key
+        self.pov_file = pov_file
+        self.render_kwargs = render_kwargs
+        self.priority = priority
+        # The futures of the callers waiting for the job, with their
+        # ``(deadline, timer)``.
+        self.callers = {}
+        self.started = False
+        self.expired = False
+
+    def deadline(self):
+        """ Returns the latest deadline of the callers, None if one of them
+        has no deadline. """
+        deadlines = [deadline for (deadline, _) in self.callers.values()]
+        if None in deadlines:
+            return None
+        return max(deadlines)
+
+
+class RenderService:
+    """ Renders scenes to numpy arrays with a bounded pool of workers.
+
+    Jobs are served by decreasing priority. Requests for a scene which is
+    already queued or rendering with the same options (same key as in
+    RenderCache) share the same render, but each caller gets its own
+    Future, which fails at its own deadline.
+
+    Parameters
+    ------------
+
+    workers
+      Number of POV-Ray processes running at the same time.
+
+    threads
+      Threads of each POV-Ray process (default: the cores split between
+      the workers).
+
+    cache
+      Optional RenderCache checked before queueing a job, and filled with
+      the results (the raw images in its directory if any, and the arrays
+      in memory), like with Scene.render.
+    """
+
+    def __init__(self, workers=None, threads=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads or threads_per_job(self.workers)
+        self.cache = cache
+        # Without a cache, this one is only used to compute the keys.
+        self.keys = cache or RenderCache(max_items=0)
+        self.queue = PriorityQueue()
+        self.counter = itertools.count()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.worker_threads = [threading.Thread(target=self._work)
+                               for i in range(self.workers)]
+        for thread in self.worker_threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, scene, priority=0, deadline=None, **render_kwargs):
+        """ Queues a render, returns a concurrent.futures.Future of the numpy
+        image.
+
+        Parameters
+        ------------
+
+        scene
+          A Scene, or a string of POV-Ray code.
+
+        priority
+          Jobs with a higher priority are rendered first.
+
+        deadline
+          Seconds after which the Future fails with a TimeoutError, even if
+          the job is still queued. A job is dropped once all its callers
+          have given up, and POV-Ray is killed at the latest deadline of
+          the callers waiting when it starts (callers joining a running
+          job share this time limit).
+
+        render_kwargs
+          Parameters of the render, as in render_povfile (width, height,
+          quality, antialiasing, includedirs, output_alpha...) except out
+          and return_stats.
+        """
+
+        includedirs = list(render_kwargs.pop('includedirs', None) or [])
+        if isinstance(scene, str):
+            chunks = [scene]
+        else:
+            scene = scene.with_camera_ratio(render_kwargs.get('width'),
+                                            render_kwargs.get('height'))
+            chunks = scene.iter_render_chunks(includedirs)
+        render_kwargs['includedirs'] = includedirs
+        render_kwargs.setdefault('threads', self.threads)
+
+        scratch_dir = mkdtemp(prefix='vapory_')
+        pov_file = os.path.join(scratch_dir, '__temp__.pov')
+        hasher = SceneHasher()
+        write_scene(hasher.iter_update(chunks), pov_file)
+        # The same key as Scene.render, so that they can share a cache.
+        numpy_format, output_alpha = numpy_output_format(
+            render_kwargs.get('channels'), render_kwargs.get('dtype', 'uint8'),
+            render_kwargs.get('output_alpha', False))
+        key = render_key(self.keys, hasher, includedirs,
+                         render_kwargs.get('height'),
+                         render_kwargs.get('width'),
+                         render_kwargs.get('quality'),
+                         render_kwargs.get('antialiasing'), output_alpha,
+                         True, render_kwargs.get('region'), numpy_format)
+
+        if self.cache is not None:
+            # Like Scene.render: the decoded array in memory, else the raw
+            # image on disk.
+            found, arr = _cached_result(self.cache, key, None, True, False,
+                                        render_kwargs.get('region'),
+                                        numpy_format)
+            if found:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+                future = Future()
+                future.set_result(arr)
+                return future
+
+        future = Future()
+        future.set_running_or_notify_cancel() # only the service sets it
+        timer = None
+        with self.lock:
+            job = self.inflight.get(key)
+            if job is not None:
+                # Coalesced: the new caller shares the job, which gets the
+                # highest priority of its callers.
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+                if (priority > job.priority) and not job.started:
+                    job.priority = priority
+                    self.queue.put((-priority, next(self.counter), job))
+            else:
+                job = _RenderJob(key, pov_file, render_kwargs, priority)
+                self.inflight[key] = job
+                self.queue.put((-priority, next(self.counter), job))
+            if deadline is not None:
+                timer = threading.Timer(deadline, self._expire, (job, future))
+                timer.daemon = True
+                deadline = time.time() + deadline
+            job.callers[future] = (deadline, timer)
+        if timer is not None:
+            timer.start()
+        return future
+
+    def render(self, scene, priority=0, deadline=None, **render_kwargs):
+        """ Renders a scene through the service and waits for the result. """
+        return self.submit(scene, priority, deadline, **render_kwargs).result()
+
+    def _work(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.started or job.expired:
+                    # A copy of a job whose priority was raised, or a job
+                    # whose callers have all given up.
+                    continue
+                job.started = True
+                deadline = job.deadline()
+            try:
+                kwargs = job.render_kwargs
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError("The render job missed its "
+                                           "deadline before it could start.")
+                    # POV-Ray is killed if the deadline passes while it runs.
+                    timeout = kwargs.get('timeout')
+                    kwargs = dict(kwargs, timeout=remaining if timeout is None
+                                  else min(timeout, remaining))
+                arr, image, _ = _render_povfile(
+                    job.pov_file, keep_image=(self.cache is not None),
+                    **kwargs)
+                if self.cache is not None:
+                    self.cache.put_bytes(job.key, image)
+                    self.cache.put_array(job.key, arr)
+            except Exception as err:
+                for future in self._finish(job):
+                    future.set_exception(err)
+            else:
+                for future in self._finish(job):
+                    future.set_result(arr)
+
+    def _finish(self, job):
+        """ Removes a job once it's done, returns the futures of the callers
+        still waiting for it. """
+        with self.lock:
+            del self.inflight[job.key]
+            futures = list(job.callers)
+            for _, timer in job.callers.values():
+                if timer is not None:
+                    timer.cancel()
+            job.callers.clear()
+        shutil.rmtree(os.path.dirname(job.pov_file), ignore_errors=True)
+        return futures
+
+    def _expire(self, job, future):
+        """ Fails the future of a caller whose deadline has passed, and drops
+        the job if it is still queued and nobody else waits for it. """
+        with self.lock:
+            if job.callers.pop(future, None) is None:
+                return # the job is already done
+            drop = not (job.callers or job.started)
+            if drop:
+                job.expired = True
+                del self.inflight[job.key]
+        if drop:
+            shutil.rmtree(os.path.dirname(job.pov_file), ignore_errors=True)
+        future.set_exception(TimeoutError("The render job missed its "
+                                          "deadline."))
+
+    def shutdown(self, wait=True):
+        """ Stops the workers (after the jobs already queued) and the
+        socket server if any. """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.worker_threads:
+            # None sorts after all the jobs: they are rendered first.
+            self.queue.put((float('inf'), next(self.counter), None))
+        if wait:
+            for thread in self.worker_threads:
+                thread.join()
+
+    def serve(self, host='127.0.0.1', port=0):
+        """ Starts a socket front end in a background thread, returns its
+        ``(host, port)``. See request_render for the client side. """
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = parse_request(self.rfile.readline())
+                    scene = self.rfile.read(request.pop('size'))
+                    arr = service.render(scene.decode('utf8'), **request)
+                except Exception as err:
+                    response = {'error': "%s: %s" % (type(err).__name__, err)}
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+                    return
+                data, image_format = encode_image(arr)
+                response = {'size': len(data), 'format': image_format}
+                self.wfile.write((json.dumps(response) + "\n").encode())
+                self.wfile.write(data)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server.server_address
+
+
+# The render options which socket clients may set.
+REQUEST_KEYS = ['width', 'height', 'quality', 'antialiasing', 'channels',
+                'dtype', 'region', 'output_alpha', 'includedirs', 'priority',
+                'deadline']
+
+
+def parse_request(line):
+    """ Returns the request sent by request_render on its first line, a
+    JSON object with the size of the scene code and the render options.
+    Raises a ValueError for other keys (so that clients can't set the
+    timeout, the memory limit, the transport... of the daemon) or if the
+    size isn't a non-negative integer. """
+    request = json.loads(line.decode('utf8'))
+    if not isinstance(request, dict):
+        raise ValueError("The request should be a JSON object.")
+    size = request.get('size')
+    if (not isinstance(size, int)) or isinstance(size, bool) or (size < 0):
+        raise ValueError("The request should give the size of the scene "
+                         "code as a non-negative integer, not %r." % (size,))
+    unknown = sorted(set(request) - set(REQUEST_KEYS + ['size']))
+    if unknown:
+        raise ValueError("Unsupported request options: %s."
+                         % ", ".join(unknown))
+    return request
+
+
+def encode_image(arr):
+    """ Returns ``(data, format)`` to send a rendered image: a PPM (see
+    numpy_to_ppm) for integer images, else the .npy file of the array. """
+    if arr.dtype.kind == 'u':
+        return numpy_to_ppm(arr), 'ppm'
+    f = BytesIO()
+    numpy.save(f, arr, allow_pickle=False)
+    return f.getvalue(), 'npy'
+
+
+def decode_image(data, image_format='ppm'):
+    """ Decodes the data of encode_image. """
+    if image_format == 'npy':
+        return numpy.load(BytesIO(data), allow_pickle=False)
+    return ppm_to_numpy(buffer=data)
+
+
+def numpy_to_ppm(arr):
+    """ Returns the bytes of a binary PPM (or PGM, or PAM for RGBA) image of
+    the array, which must be of dtype uint8 or uint16. """
+    if (arr.dtype.kind != 'u') or (arr.dtype.itemsize not in (1, 2)):
+        raise ValueError("Only uint8 and uint16 arrays can be written as PPM,"
+                         " not %s." % arr.dtype)
+    maxval = 255 if arr.dtype.itemsize == 1 else 65535
+    channels = 1 if arr.ndim == 2 else arr.shape[2]
+    if channels in (1, 3):
+        magic = b"P5" if channels == 1 else b"P6"
+        header = b"%s\n%d %d\n%d\n" % (magic, arr.shape[1], arr.shape[0],
+                                        maxval)
+    else:
+        header = (b"P7\nWIDTH %d\nHEIGHT %d\nDEPTH %d\nMAXVAL %d\nENDHDR\n"
+                  % (arr.shape[1], arr.shape[0], channels, maxval))
+    return header + arr.astype(arr.dtype.newbyteorder('>')).tobytes()
+
+
+def request_render(scene, port, host='127.0.0.1', priority=0, deadline=None,
+                   **render_kwargs):
+    """ Renders a scene through the socket front end of a RenderService
+    (see RenderService.serve) and returns the numpy image. The scene is
+    sent as POV-Ray code, so the render options which change the scene
+    code (the camera ratio) are applied here. """
+
+    if not isinstance(scene, str):
+        scene = scene.with_camera_ratio(render_kwargs.get('width'),
+                                        render_kwargs.get('height'))
+        includedirs = list(render_kwargs.get('includedirs') or [])
+        scene = "".join(scene.iter_render_chunks(includedirs))
+        render_kwargs['includedirs'] = includedirs
+    data = scene.encode('utf8')
+    request = dict(render_kwargs, priority=priority, deadline=deadline,
+                   size=len(data))
+    with socket.create_connection((host, port)) as sock:
+        f = sock.makefile('rwb')
+        f.write((json.dumps(request) + "\n").encode('utf8'))
+        f.write(data)
+        f.flush()
+        response = json.loads(f.readline().decode('utf8'))
+        if 'error' in response:
+            raise IOError("The render service failed: %s" % response['error'])
+        return decode_image(f.read(response['size']),
+                            response.get('format', 'ppm'))
@@ -0,0 +1,128 @@
+"""
+Statistics of a render, parsed from what POV-Ray writes on its standard
+error at the end of a render.
+
+>>> image, stats = scene.render(width=300, height=200, return_stats=True)
+>>> stats.trace_time, stats.rays, stats.peak_memory
+"""
+
+import re
+
+TIME_RE = re.compile(r"^\s*(Parse|Bounding|Photon|Radiosity|Trace) Time:"
+                     r"[^\n(]*\(\s*([\d.]+) seconds\)"
+                     r"(?:\s*using (\d+) thread\(s\) with ([\d.]+) CPU-seconds)?",
+                     re.MULTILINE)
+COUNT_RE = re.compile(r"\b(Pixels|Samples|Rays|Saved):\s+(\d+)")
+RESOLUTION_RE = re.compile(r"Image Resolution (\d+) x (\d+)")
+INTERSECTION_RE = re.compile(r"^(\S[^\n]*?)\s+(\d+)\s+(\d+)\s+([\d.]+)\s*$",
+                             re.MULTILINE)
+SHADOW_RE = re.compile(r"Shadow Ray Tests:\s+(\d+)\s+Succeeded:\s+(\d+)")
+MEMORY_RE = re.compile(r"Peak memory used:\s+(\d+) bytes")
+
+
+class RenderStats:
+    """ Statistics of a POV-Ray render.
+
+    Attributes
+    -----------
+
+    parse_time, bounding_time, photon_time, radiosity_time, trace_time
+      Wall-clock durations of the phases in seconds (None if the phase
+      didn't happen or isn't reported).
+
+    cpu_times
+      Dict phase => CPU-seconds, for the phases reporting it.
+
+    pixels, samples, rays, saved_rays
+      Counts reported by POV-Ray.
+
+    resolution
+      ``(width, height)`` of the image.
+
+    intersections
+      Dict shape => ``(tests, succeeded)`` of the ray/shape intersection
+      tests.
+
+    shadow_ray_tests, shadow_rays_succeeded
+      Counts of the shadow rays.
+
+    peak_memory
+      Peak memory used by POV-Ray, in bytes.
+
+    cached
+      True if the result came from a RenderCache (POV-Ray didn't run, and
+      all the other attributes are empty).
+
+    output
+      The full text written by POV-Ray.
+    """
+
+    def __init__(self, output="", cached=False):
+        self.output = output
+        self.cached = cached
+        self.parse_time = self.bounding_time = self.photon_time = None
+        self.radiosity_time = self.trace_time = None
+        self.cpu_times = {}
+        self.pixels = self.samples = self.rays = self.saved_rays = None
+        self.resolution = None
+        self.intersections = {}
+        self.shadow_ray_tests = self.shadow_rays_succeeded = None
+        self.peak_memory = None
+
+    @classmethod
+    def from_output(cls, output):
+        """ Parses the text written by POV-Ray (bytes or str). """
+        if isinstance(output, bytes):
+            output = output.decode('ascii', 'replace')
+        output = output.replace('\r', '\n')
+        stats = cls(output)
+
+        for phase, seconds, _, cpu_seconds in TIME_RE.findall(output):
+            setattr(stats, phase.lower() + '_time', float(seconds))
+            if cpu_seconds:
+                stats.cpu_times[phase.lower()] = float(cpu_seconds)
+
+        names = {'Pixels': 'pixels', 'Samples': 'samples', 'Rays': 'rays',
+                 'Saved': 'saved_rays'}
+        for name, value in COUNT_RE.findall(output):
+            setattr(stats, names[name], int(value))
+
+        match = RESOLUTION_RE.search(output)
+        if match:
+            stats.resolution = tuple(int(e) for e in match.groups())
+
+        block = output.split("Ray->Shape Intersection", 1)
+        if len(block) == 2:
+            table = block[1].split("Shadow Ray Tests", 1)[0]
+            for shape, tests, succeeded, _ in INTERSECTION_RE.findall(table):
+                stats.intersections[shape.strip()] = (int(tests),
+                                                      int(succeeded))
+
+        match = SHADOW_RE.search(output)
+        if match:
+            stats.shadow_ray_tests, stats.shadow_rays_succeeded = [
+                int(e) for e in match.groups()]
+
+        match = MEMORY_RE.search(output)
+        if match:
+            stats.peak_memory = int(match.group(1))
+
+        return stats
+
+    @property
+    def total_time(self):
+        """ Sum of the durations of all the reported phases. """
+        return sum(t for t in [self.parse_time, self.bounding_time,
+                               self.photon_time, self.radiosity_time,
+                               self.trace_time] if t is not None)
+
+    def as_dict(self):
+        """ Returns the statistics as a dict (without the raw output), e.g.
+        to log them as JSON. """
+        return dict((k, v) for (k, v) in self.__dict__.items()
+                    if k != 'output')
+
+    def __repr__(self):
+        return "RenderStats(%s)" % ", ".join(
+            "%s=%r" % (k, v) for (k, v) in sorted(self.as_dict().items())
+            if v not in (None, {}))
@@ -1,9 +1,22 @@
 import webbrowser # <= to open the POVRay help
-from copy import deepcopy
+from copy import deepcopy, copy as shallow_copy
 import re
 from .io import render_povstring
-
-from .helpers import WIKIREF, vectorize, format_if_necessary
+from .parallel import render_tiles
+from .async_render import render_povstring_async
+from .includes import IncludeCache, SerializationContext
+from .memo import ArgList, get_memo, iter_memo_chunks
+from .dedup import find_duplicates, iter_declare_chunks, iter_dedup_chunks
+from .persistent import SharedList
+
+from .helpers import (WIKIREF, vectorize, format_if_necessary, iter_chunks,
+                      write_chunks, OutputFormat)
+
+try:
+    import numpy
+    numpy_found=True
+except:
+    numpy_found=False
 
 class Scene:
     """ A scene contains Items and can be written to a file.
@@ -15,10 +28,28 @@ class Scene:
                        items=[light_source, myshpere, my_box],
                        included)
 
+    With ``dedup_min_size=N``, the identical subtrees (textures, objects...)
+    of at least N characters of code which appear several times in the
+    scene are written once as #declare's and referred to afterwards (see
+    vapory.dedup).
+
+    ``precision`` (significant digits of the floats) and ``minify`` (no
+    cosmetic whitespace) set how the code is written, see OutputFormat.
+    The default writes floats exactly and indents nothing.
+
+    set_camera and add_objects return new scenes which share the elements
+    of this one (see vapory.persistent): replace the elements of a scene
+    rather than modifying them in place, or use copy() first.
+
+    ``scene.objects`` is a SharedList, whatever sequence was given: it
+    behaves like a list but isn't one (``isinstance(scene.objects, list)``
+    is False), use ``list(scene.objects)`` where a real list is needed.
+
     """
     def __init__(self, camera, objects=[], atmospheric=[],
                  included=[], defaults=[], global_settings=[],
-                 declares=[]):
+                 declares=[], cache_dir=None, dedup_min_size=None,
+                 precision=None, minify=False):
 
         self.camera = camera
         self.objects = objects
@@ -27,38 +58,103 @@ class Scene:
         self.defaults = defaults
         self.declares = declares
         self.global_settings = global_settings
+        self.cache_dir = cache_dir
+        self.dedup_min_size = dedup_min_size
+        self.precision = precision
+        self.minify = minify
 
-    def __str__(self):
+    @property
+    def objects(self):
+        return self._objects
+
+    @objects.setter
+    def objects(self, objects):
+        self._objects = SharedList(objects)
+
+    @property
+    def output_format(self):
+        return OutputFormat(self.precision, self.minify)
+
+    @property
+    def include_cache(self):
+        """ The IncludeCache where the cacheable elements are written. """
+        return IncludeCache(self.cache_dir)
+
+    def iter_chunks(self, context=None):
+        """ Yields the POV-Ray code of the scene chunk by chunk, depth-first,
+        without ever building the whole scene string in memory. """
+
+        if context is None:
+            context = SerializationContext(self.include_cache,
+                                           self.output_format)
 
         included = ['#include "%s"'%e for e in self.included]
-        defaults = ['#default { %s }'%e for e in self.defaults]
         declares = ['#declare %s;'%e for e in self.declares]
 
-        global_settings = ["global_settings{\n%s\n}"%("\n".join(
-                           [str(e) for e in self.global_settings]))]
-        return '\n'.join([str(e)
-                          for l in  [included, declares, self.objects, [self.camera],
-                              self.atmospheric, global_settings]
-                          for e in l])
+        settings = ["".join(iter_chunks(e, context))
+                    for e in self.global_settings]
+        if context.output_format.minify:
+            global_settings = ["global_settings{%s}" % " ".join(settings)]
+        else:
+            global_settings = ["global_settings{\n%s\n}" % "\n".join(
+                settings)]
+        if self.dedup_min_size is not None:
+            duplicates = find_duplicates(
+                self.objects + [self.camera] + self.atmospheric, context,
+                self.dedup_min_size)
+            declares = declares + [
+                "".join(iter_declare_chunks([e], context)).rstrip("\n")
+                for e in duplicates]
+        first = True
+        for l in [included, declares, self.objects, [self.camera],
+                  self.atmospheric, global_settings]:
+            for e in l:
+                if not first:
+                    yield "\n"
+                first = False
+                for chunk in iter_chunks(e, context):
+                    yield chunk
+
+    def write_to(self, fileobj):
+        """ Writes the POV-Ray code of the scene to a file-like object. """
+        write_chunks(self.iter_chunks(), fileobj)
+
+    def __str__(self):
+        return "".join(self.iter_chunks())
 
     def copy(self):
+        """ Returns a deep copy of the scene. """
         return deepcopy(self)
 
+    def _evolve(self):
+        """ Returns a copy of the scene with its own lists, sharing its
+        elements. """
+        new = shallow_copy(self)
+        new.objects = self.objects
+        for name in ['atmospheric', 'included', 'defaults', 'declares',
+                     'global_settings']:
+            setattr(new, name, list(getattr(self, name)))
+        return new
+
     def set_camera(self, new_camera):
-        new = self.copy()
+        new = self._evolve()
         new.camera = new_camera
         return new
 
     def add_objects(self, objs):
 
-        new = self.copy()
+        new = self._evolve()
         new.objects +=  objs
         return new
 
     def render(self, outfile=None, height=None, width=None,
                      quality=None, antialiasing=None, remove_temp=True,
                      auto_camera_angle=True, show_window=False, tempfile=None,
-                     includedirs=None, output_alpha=False):
+                     includedirs=None, output_alpha=False, cache=None,
+                     threads=None, region=None, tiles=None, jobs=None,
+                     timeout=None, max_memory=None, return_stats=False,
+                     transport='pipe', out=None, channels=None,
+                     dtype='uint8', cull_margin=None):
 
         """ Renders the scene to a PNG, a numpy array, or the IPython Notebook.
 
@@ -79,28 +175,242 @@ class Scene:
 
         output_alpha
           If true, the background will be transparent,
-        rather than the default black background.  Note
-        that this option is ignored if rendering to a
-        numpy array, due to limitations of the intermediate
-        ppm format.
+        rather than the default black background. For
+        numpy outputs, this gives RGBA arrays.
+
+        channels, dtype
+          Channels ('rgb' or 'rgba', default: 'rgba' if output_alpha else
+          'rgb') and dtype ('uint8', 'uint16' or 'float32' for high dynamic
+          range) of numpy outputs. Supported: rgb uint8/uint16/float32 and
+          rgba uint8/uint16. 16-bit arrays are big-endian uint16.
+
+        cache
+          An optional RenderCache (see vapory.cache). Identical renders are
+          then served from the cache instead of running POV-Ray again.
+
+        threads
+          Number of render threads used by POV-Ray (default: all the cores).
+
+        region
+          ``(row_start, row_end, col_start, col_end)`` in pixels (0-based,
+          ends excluded) to render only this crop of the image.
+
+        tiles, jobs
+          ``tiles=(nx, ny)`` splits the image in nx*ny tiles rendered by
+          ``jobs`` parallel POV-Ray processes and stitched into one numpy
+          array (see vapory.parallel.render_tiles). Only for numpy outputs,
+          and not with ``cache``, ``tempfile``, ``remove_temp=False`` or
+          ``region``.
+
+        timeout, max_memory
+          Limits of the POV-Ray process (each tile's process for tiled
+          renders): duration in seconds, after which POV-Ray is killed and a
+          TimeoutError raised, and memory in bytes (POSIX only). The
+          temporary files are removed in every case.
+
+        return_stats
+          If True, returns ``(result, stats)``, where stats is a RenderStats
+          (see vapory.stats) with the times of the render phases, the rays
+          and intersection counts and the peak memory reported by POV-Ray.
+          Not available for tiled renders.
+
+        transport
+          For numpy outputs, 'pipe' (default) to read the image from
+          POV-Ray's output, or 'file' to have POV-Ray write it to a scratch
+          file (on tmpfs if available). RGB uint8/uint16 images (PPM files)
+          are then returned as a read-only memory map of the file, which is
+          cheaper for big images; the other formats are decoded in memory.
+
+        out
+          Optional numpy array of the shape of the image, filled with the
+          numpy output and returned (e.g. to render in a loop without
+          allocating new images).
+
+        cull_margin
+          If not None, the objects farther than this distance (in scene
+          units) outside of the camera's field of view are left out of the
+          scene, which makes big scenes faster to write and to parse. Use a
+          margin big enough to keep the objects whose shadows or
+          reflections are visible. See vapory.culling.
 
         """
 
-        if auto_camera_angle and width is not None:
-            self.camera = self.camera.add_args(['right', [1.0*width/height, 0,0]])
-
-        return render_povstring(str(self), outfile, height, width,
+        scene = self.prepare(width, height, auto_camera_angle, cull_margin)
+        includedirs = list(includedirs or [])
+        chunks = scene.iter_render_chunks(includedirs)
+
+        if tiles is not None:
+            if outfile is not None:
+                raise ValueError("Tiled renders are only available for numpy "
+                                 "outputs (outfile=None).")
+            if (width is None) or (height is None):
+                raise ValueError("Tiled renders require a width and height.")
+            if return_stats:
+                raise ValueError("return_stats is not available for tiled "
+                                 "renders.")
+            ignored = [name for (name, used) in [
+                ('cache', cache is not None),
+                ('tempfile', tempfile is not None),
+                ('remove_temp', not remove_temp),
+                ('region', region is not None)] if used]
+            if ignored:
+                raise ValueError("%s not available for tiled renders."
+                                 % ", ".join(ignored))
+            return render_tiles(chunks, width, height, tiles,
+                                jobs, threads=threads, quality=quality,
+                                antialiasing=antialiasing,
+                                includedirs=includedirs,
+                                output_alpha=output_alpha, timeout=timeout,
+                                max_memory=max_memory, transport=transport,
+                                out=out, channels=channels, dtype=dtype)
+
+        return render_povstring(chunks, outfile, height, width,
                                 quality, antialiasing, remove_temp, show_window,
-                                tempfile, includedirs, output_alpha)
+                                tempfile, includedirs, output_alpha, cache,
+                                threads, region, timeout, max_memory,
+                                return_stats, transport, out, channels,
+                                dtype)
+
+
+    async def render_async(self, outfile=None, height=None, width=None,
+                           quality=None, antialiasing=None, remove_temp=True,
+                           auto_camera_angle=True, includedirs=None,
+                           output_alpha=False, threads=None, region=None,
+                           progress=None, timeout=None, max_memory=None,
+                           return_stats=False, channels=None, dtype='uint8',
+                           cull_margin=None):
+        """ Renders the scene like render(), from asyncio code.
+
+        >>> image = await scene.render_async(width=300, height=200,
+                                             progress=print)
+
+        progress
+          Function (or coroutine function) called with a RenderProgress
+          (see vapory.async_render) for each progress line of POV-Ray.
+
+        Cancelling the task (or reaching the timeout) kills the POV-Ray
+        process.
+        """
 
+        scene = self.prepare(width, height, auto_camera_angle, cull_margin)
+        includedirs = list(includedirs or [])
+        return await render_povstring_async(
+            scene.iter_render_chunks(includedirs), outfile, height, width,
+            quality, antialiasing, remove_temp, includedirs,
+            output_alpha, threads, region, progress, timeout, max_memory,
+            return_stats, channels, dtype)
+
+    def with_camera_ratio(self, width, height, auto_camera_angle=True):
+        """ Returns the scene with a camera matching the width/height ratio
+        of the image (a shallow copy, so that rendering the same scene twice
+        gives the same code and hits the caches). """
+        if not (auto_camera_angle and width is not None):
+            return self
+        return self.set_camera(self.camera.add_args(
+            ['right', [1.0*width/height, 0,0]]))
+
+    def prepare(self, width, height, auto_camera_angle=True,
+                cull_margin=None):
+        """ Returns the scene as rendered: with the camera ratio of the
+        image and, if a cull_margin is given, without the objects out of
+        view. """
+        scene = self.with_camera_ratio(width, height, auto_camera_angle)
+        if cull_margin is not None:
+            from .culling import cull_objects # (imports this module)
+            scene = cull_objects(scene, cull_margin)
+        return scene
+
+    def iter_render_chunks(self, includedirs):
+        """ Yields the code of the scene for a render. Once all the code is
+        yielded, the directory of the include cache is appended to the
+        includedirs list if some elements were written to include files
+        (cacheable elements, Static groups): the renders read includedirs
+        after writing the scene file. """
+        context = SerializationContext(self.include_cache,
+                                       self.output_format)
+        for chunk in self.iter_chunks(context):
+            yield chunk
+        if context.included:
+            includedirs.append(self.include_cache.directory)
+
+
+class POVRayElementType(type):
+    """ Class of the element classes. It computes the POV-Ray keyword of
+    each class once, when the class is defined (unless the class sets its
+    own), notes whether the class overrides __str__, and gives the classes
+    of this module no instance __dict__ (their attributes are slots). """
+
+    def __new__(meta, name, bases, namespace):
+        if namespace.get('__module__') == __name__:
+            namespace.setdefault('__slots__', ())
+        cls = type.__new__(meta, name, bases, namespace)
+        if 'pov_keyword' not in namespace:
+            cls.pov_keyword = cls.transformed_name().lower()
+        cls.custom_str = (bool(bases) and '__str__' in namespace) or any(
+            getattr(base, 'custom_str', False) for base in bases)
+        return cls
+
+
+class POVRayElement(metaclass=POVRayElementType):
+
+    # _args: the arguments, in a tuple until they are read through ``args``
+    # _memo, _serialized: memoized code and content hash, see memo.py
+    # _box: memoized bounding box, see bounds.py
+    # cache_include: whether cacheable() marked the element, which is then
+    # written to an include file.
+    __slots__ = ('_args', '_memo', '_serialized', '_box', 'cache_include')
+
+    # Keyword used to refer to a #declare'd element, e.g. "object" for
+    # shapes. Defaults to the element's own name (texture { ID }...).
+    declare_keyword = None
+    # Whether the element can be #declare'd by the deduplication of scenes
+    declarable = False
+    # Whether the class overrides __str__ (set by POVRayElementType): its
+    # code is then str(element), wherever the element is.
+    custom_str = False
 
-class POVRayElement:
     def __init__(self, *args):
-        self.args = list(args)
+        self.cache_include = False
+        self.args = args
+
+    @property
+    def args(self):
+        args = self._args
+        if args.__class__ is tuple:
+            # The args may be modified in place from now on.
+            args = self._args = ArgList(args)
+        return args
+
+    @args.setter
+    def args(self, args):
+        self._args = args if args.__class__ is tuple else tuple(args)
+        self._memo = None
+        self._serialized = False
+        self._box = None
 
     def copy(self):
+        """ Returns a deep copy of the element. """
         return deepcopy(self)
 
+    def __getstate__(self):
+        # Copies and pickles carry the args only: the memoized code and box
+        # are computed again if needed.
+        return (self._args, self.cache_include, getattr(self, '__dict__',
+                                                        None))
+
+    def __setstate__(self, state):
+        args, self.cache_include, attributes = state
+        self.args = args
+        if attributes:
+            self.__dict__.update(attributes)
+
+    def _evolve(self, args=None):
+        """ Returns a copy of the element with its own list of args (the
+        given args, or the same ones), sharing its children. """
+        new = shallow_copy(self)
+        new.args = self._args if args is None else args
+        return new
+
     @classmethod
     def transformed_name(cls):
         """ Tranform Sphere=>sphere, and LightSource=>light_source """
@@ -111,25 +421,92 @@ class POVRayElement:
         webbrowser.open(WIKIREF + cls.transformed_name())
 
     def add_args(self, new_args):
-        new = self.copy()
-        new.args += new_args
+        """ Returns a new element with more args. It shares the children of
+        this one: replace them rather than modifying them in place. """
+        return self._evolve(tuple(self._args) + tuple(new_args))
+
+    def cacheable(self, cache=True):
+        """ Returns a copy of the element that scenes will write once to a
+        content-hashed include file, and only reference afterwards.
+        Use it for heavy subtrees (meshes...) reused across renders. """
+        new = self._evolve()
+        new.cache_include = cache
         return new
 
-    def __str__(self):
-        # Tranforms Sphere=>sphere, and LightSource=>light_source
-        name = self.transformed_name().lower()
+    def reference(self, identifier):
+        """ Returns the code referring to a #declare'd copy of the element. """
+        keyword = self.declare_keyword or self.pov_keyword
+        return "%s { %s }" % (keyword, identifier)
+
+    def content_hash(self, context=None):
+        """ Returns the structural hash of the element (a hex string), equal
+        for elements of the same class with equal args. It is memoized, and
+        updated when the args change. """
+        return get_memo(self, context).digest
+
+    def iter_chunks(self, context=None):
+        """ Yields the POV-Ray code of the element chunk by chunk. """
+        if self.custom_str and not (context is not None and
+                                    context.recording):
+            return iter([str(self)])
+        if context is None:
+            return self.iter_memo_chunks()
+        if context.recording:
+            return iter([self])
+        if self.cache_include and (context.include_cache is not None):
+            return context.include_cache.iter_reference_chunks(self, context)
+        if context.declared:
+            return iter_dedup_chunks(self, context)
+        return self.iter_memo_chunks(context)
+
+    def iter_memo_chunks(self, context=None):
+        """ Yields the code of the element, memoized (see vapory.memo). """
+        return iter_memo_chunks(self, context)
+
+    def iter_body_chunks(self, context=None):
+        if (context is not None) and context.output_format.minify:
+            start, separator, end = "%s{" % self.pov_keyword, " ", "}"
+        else:
+            start, separator, end = "%s {\n" % self.pov_keyword, "\n", " \n}"
+        yield start
+        for i, e in enumerate(self._args):
+            if i:
+                yield separator
+            for chunk in iter_chunks(e, context):
+                yield chunk
+        yield end
+
+    def write_to(self, fileobj):
+        """ Writes the POV-Ray code of the element to a file-like object. """
+        write_chunks(self.iter_chunks(), fileobj)
 
-        return "%s {\n%s \n}" % (name, "\n".join([str(format_if_necessary(e))
-                                                  for e in self.args]))
+    def __str__(self):
+        if self.custom_str:
+            # Called from an overriding __str__: the default code.
+            return "".join(self.iter_body_chunks())
+        return "".join(self.iter_chunks())
 
 
 class POVRayMap(POVRayElement):
-    def __str__(self):
-        name = self.transformed_name().lower()
-        return "%s { %s }"%(name,
-                            "\n".join([ "[ %s ]"%(" ".join(
-                                [str(format_if_necessary(e)) for e in l]))
-                                        for l in self.args]))
+    def iter_body_chunks(self, context=None):
+        if (context is not None) and context.output_format.minify:
+            start, separator, end = "%s{" % self.pov_keyword, " ", "}"
+            entry_start, entry_end = "[", "]"
+        else:
+            start, separator, end = "%s { " % self.pov_keyword, "\n", " }"
+            entry_start, entry_end = "[ ", " ]"
+        yield start
+        for i, l in enumerate(self._args):
+            if i:
+                yield separator
+            yield entry_start
+            for j, e in enumerate(l):
+                if j:
+                    yield " "
+                for chunk in iter_chunks(e, context):
+                    yield chunk
+            yield entry_end
+        yield end
 
 class Macro(POVRayElement):
     """ This special class enables to use macros like
@@ -137,9 +514,21 @@ class Macro(POVRayElement):
     Macro('Tetrahedron_by_Corners', P,Q,R,S,R1,R2, filled)
     """
 
-    def __str__(self):
-        return "%s( %s)"%(self.args[0], " , ".join([str(format_if_necessary(e))
-                                                   for e in self.args[1:]]))
+    def reference(self, identifier):
+        return identifier
+
+    def iter_body_chunks(self, context=None):
+        if (context is not None) and context.output_format.minify:
+            start, separator = "%s(", ","
+        else:
+            start, separator = "%s( ", " , "
+        yield start % self._args[0]
+        for i, e in enumerate(self._args[1:]):
+            if i:
+                yield separator
+            for chunk in iter_chunks(e, context):
+                yield chunk
+        yield ")"
 
 # =============================================================================
 # =============================================================================
@@ -600,6 +989,271 @@ class Mesh2(POVRayElement):
          inside_vector [direction] | OBJECT_MODIFIERS"
     """
 
+    @classmethod
+    def from_arrays(cls, vertices, faces, *modifiers, normals=None,
+                    uvs=None, texture_indices=None, textures=None):
+        """ Builds a Mesh2 from numpy arrays, for big triangle meshes.
+
+        The arrays are kept inside the element and written out block by block
+        with vectorized formatting. The counts are computed automatically.
+
+        Parameters
+        ------------
+
+        vertices
+          (N, 3) array of vertex coordinates.
+
+        faces
+          (F, 3) array of vertex indices.
+
+        modifiers
+          Other arguments of the mesh (Texture, transformations...).
+
+        normals
+          Optional (N, 3) array of per-vertex normals. This parameter and
+          the next ones are keyword-only.
+
+        uvs
+          Optional (N, 2) array of per-vertex uv coordinates.
+
+        texture_indices
+          Optional (F,) or (F, 3) array of indices in ``textures``.
+
+        textures
+          List of Texture elements, written as the mesh's texture_list.
+
+        Examples
+        ---------
+
+        >>> mesh = Mesh2.from_arrays(vertices, faces,
+                                     Texture(Pigment('color', [1,0,0])))
+        """
+
+        if not numpy_found:
+            raise IOError("Mesh2.from_arrays requires numpy installed.")
+
+        vertices = numpy.asarray(vertices, dtype=float)
+        faces = numpy.asarray(faces, dtype=int)
+        args = [VertexVectors(len(vertices), VectorArray(vertices))]
+
+        if normals is not None:
+            normals = numpy.asarray(normals, dtype=float)
+            args.append(NormalVectors(len(normals), VectorArray(normals)))
+
+        if uvs is not None:
+            uvs = numpy.asarray(uvs, dtype=float)
+            args.append(UvVectors(len(uvs), VectorArray(uvs)))
+
+        if textures is not None:
+            args.append(TextureList(len(textures), *textures))
+
+        if texture_indices is None:
+            faces_array = VectorArray(faces)
+        else:
+            texture_indices = numpy.asarray(texture_indices, dtype=int)
+            if texture_indices.ndim == 1:
+                texture_indices = texture_indices.reshape((-1, 1))
+            n_tex = texture_indices.shape[1]
+            faces_array = VectorArray(
+                numpy.hstack([faces, texture_indices]),
+                row_format="<%s,%s,%s>" + ",%s" * n_tex)
+        args.append(FaceIndices(len(faces), faces_array))
+
+        return cls(*(args + list(modifiers)))
+
+
+class VectorArray:
+    """ Array-backed list of vectors, written [a,b,c] => <a,b,c>, one vector
+    per line, like the arguments of VertexVectors or FaceIndices.
+
+    The whole array is formatted with one string operation per block of
+    rows instead of one Python str() call per number.
+
+    Parameters
+    ------------
+
+    array
+      A 2D numpy array (one vector per row).
+
+    row_format
+      Format of one row, e.g. "<%s,%s,%s>,%s" for face indices followed by a
+      texture index. Defaults to "<%s,...,%s>" with one %s per column.
+
+    block_size
+      Number of rows formatted at once.
+
+    number_format
+      Format replacing the %s of the row format for float arrays, e.g.
+      "%.6g" (default: the precision of the scene, or the exact repr).
+    """
+
+    def __init__(self, array, row_format=None, block_size=2**14,
+                 number_format=None):
+        if not numpy_found:
+            raise IOError("VectorArray requires numpy installed.")
+        array = numpy.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape((-1, 1))
+        if row_format is None:
+            row_format = "<%s>" % ",".join(["%s"] * array.shape[1])
+        self.array = array
+        self.row_format = row_format
+        self.block_size = block_size
+        self.number_format = number_format
+
+    def __len__(self):
+        return len(self.array)
+
+    def formatted_row(self, context=None):
+        """ Returns the row format with the number format of the array, or
+        else the precision of the context. """
+        number_format = self.number_format
+        if (context is not None) and (context.output_format.precision
+                                      is not None):
+            number_format = context.output_format.float_format
+        if (number_format is None) or (self.array.dtype.kind != 'f'):
+            return self.row_format
+        return self.row_format.replace("%s", number_format)
+
+    def iter_chunks(self, context=None):
+        row_format = self.formatted_row(context)
+        for start in range(0, len(self.array), self.block_size):
+            block = self.array[start:start + self.block_size]
+            if start:
+                yield "\n"
+            yield "\n".join([row_format] * len(block)) % tuple(
+                block.ravel().tolist())
+
+    def __str__(self):
+        return "".join(self.iter_chunks())
+
+
+def _as_columns(values, n, width):
+    """ Returns a number, an (n,) array or an (n, width) array as an
+    (n, width) float array. """
+    values = numpy.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape((-1, 1))
+    return numpy.broadcast_to(values, (n, width))
+
+
+def _placements(row_format, n, columns, number_format="%.9g"):
+    """ Returns a VectorArray writing ``row_format % (...)`` for each of the
+    n rows of the (format, values, width) columns whose values are not
+    None. Unless the scene sets a precision, the numbers are written with
+    9 significant digits, which is about 4 times faster than Python's
+    shortest float repr. """
+    formats, arrays = [], []
+    for (fmt, values, width) in columns:
+        if values is None:
+            continue
+        if width is None:
+            values = numpy.asarray(values, dtype=float)
+            width = values.shape[1]
+            fmt = fmt[width]
+        formats.append(fmt)
+        arrays.append(_as_columns(values, n, width))
+    return VectorArray(numpy.hstack(arrays),
+                       row_format=row_format % " ".join(formats),
+                       number_format=number_format)
+
+
+_COLOR_FORMATS = {3: "pigment { color rgb <%s,%s,%s> }",
+                  4: "pigment { color rgbt <%s,%s,%s,%s> }"}
+
+
+class InstanceArray(POVRayElement):
+    """ Copies of an object (the prototype) placed, scaled, rotated and
+    colored from numpy arrays, for scenes with many similar objects.
+
+    The prototype is #declare'd once and each copy is written on one line,
+    with vectorized formatting, in a union.
+
+    Parameters
+    ------------
+
+    prototype
+      The object to copy (a Sphere, a Union...). For the colors to show, it
+      should have no pigment of its own.
+
+    positions
+      (N, 3) array of the translations of the copies.
+
+    modifiers
+      Other arguments of the union (Texture, transformations...).
+
+    scales
+      Optional number, (N,) array or (N, 3) array of scales. This parameter
+      and the next ones are keyword-only.
+
+    rotations
+      Optional (N, 3) array of rotations, in degrees around x, y and z.
+
+    colors
+      Optional (N, 3) array of rgb colors, or (N, 4) array of rgbt colors.
+
+    Examples
+    ---------
+
+    >>> dots = InstanceArray(Sphere([0, 0, 0], 1), positions, scales=0.1,
+                             colors=colors)
+    """
+
+    pov_keyword = "union"
+
+    def __init__(self, prototype, positions, *modifiers, scales=None,
+                 rotations=None, colors=None):
+        if not numpy_found:
+            raise IOError("InstanceArray requires numpy installed.")
+        name = "VAPORY_INSTANCE_%s" % prototype.content_hash()[:16].upper()
+        row_format = "object { %s %%s }" % name
+        placements = _placements(row_format, len(positions), [
+            ("scale <%s,%s,%s>", scales, 3),
+            ("rotate <%s,%s,%s>", rotations, 3),
+            ("translate <%s,%s,%s>", positions, 3),
+            (_COLOR_FORMATS, colors, None)])
+        POVRayElement.__init__(self, "#declare %s =" % name, prototype,
+                               placements, *modifiers)
+
+
+class SphereArray(POVRayElement):
+    """ Spheres with centers, radii and colors from numpy arrays, written as
+    a union of spheres with vectorized formatting.
+
+    Parameters
+    ------------
+
+    centers
+      (N, 3) array of the centers of the spheres.
+
+    modifiers
+      Other arguments of the union (Texture, transformations...).
+
+    radii
+      Number or (N,) array of radii (keyword-only, like colors).
+
+    colors
+      Optional (N, 3) array of rgb colors, or (N, 4) array of rgbt colors.
+
+    Examples
+    ---------
+
+    >>> spheres = SphereArray(centers, Finish('phong', 1), radii=radii,
+                              colors=colors)
+    """
+
+    pov_keyword = "union"
+
+    def __init__(self, centers, *modifiers, radii=1, colors=None):
+        if not numpy_found:
+            raise IOError("SphereArray requires numpy installed.")
+        placements = _placements("sphere { %s }", len(centers), [
+            ("<%s,%s,%s>,", centers, 3),
+            ("%s", radii, 1),
+            (_COLOR_FORMATS, colors, None)])
+        POVRayElement.__init__(self, placements, *modifiers)
+
+
 class FaceIndices(POVRayElement):
     """FaceIndices(
          number_of_faces,
@@ -630,6 +1284,11 @@ class VertexVectors(POVRayElement):
     """
 
 
+class UvVectors(POVRayElement):
+    """
+    """
+
+
 class Polygon(POVRayElement):
     """Polygon(
            Number_Of_Points, [Point_1] [Point_2]... [Point_n]
@@ -1139,3 +1798,21 @@ class DensityMap(POVRayMap):
          DENSITY_MAP_IDENTIFIER | DENSITY_MAP_ENTRY...
        DENSITY_MAP_ENTRY:
          *[ 'Value', DENSITY_BODY ]"""
+
+
+# Shapes are referred to as object { IDENTIFIER } once #declare'd.
+for _cls in [Object, Blob, Parametric, Prism, Sphere, SphereSweep,
+             Superellipsoid, Sor, Text, Torus, Box, Cone, Cylinder,
+             HeightField, Isosurface, JuliaFractal, Lathe, Ovus,
+             BicubicPatch, Disc, Mesh, Mesh2, Polygon, Triangle,
+             SmoothTriangle, Plane, Poly, Cubic, Quartic, Polynomial,
+             Quadric, Union, Intersection, Difference, Merge, LightSource,
+             LightGroup, InstanceArray, SphereArray]:
+    _cls.declare_keyword = "object"
+    _cls.declarable = True
+
+for _cls in [Texture, Pigment, Finish, Normal, Interior, Material, Media,
+             Density, InteriorTexture, ColorMap, PigmentMap, NormalMap,
+             SlopeMap, TextureMap, DensityMap]:
+    _cls.declarable = True
+del _cls